@@ -0,0 +1,59 @@
+# bench_anomaly.py — 単価の外れ値検出（mitsumori.anomaly）の採点時間と検出の確認
+# 過去明細は base_items を ±20% 揺らした合成データ。見積の一部の行に極端な単価（1/10・10 倍）と上限超えの管理費を仕込む
+# 実行: python -m bench.bench_anomaly
+
+import random
+import time
+
+import pandas as pd
+
+from mitsumori.items import Item, to_items
+from mitsumori.ratecard import RateCard
+from mitsumori.anomaly import PriceStats, load_price_stats, score_items
+
+from bench.corpus_gen import base_items
+
+def _history(n_estimates: int, n_items: int, seed: int = 0) -> pd.DataFrame:
+    rng = random.Random(seed)
+    base = base_items(n_items, note_len=0)
+    rows = []
+    for _ in range(n_estimates):
+        for x in base:
+            rows.append({"category": x["category"], "task": x["task"], "unit": x["unit"],
+                         "unit_price": int(x["unit_price"] * rng.uniform(0.8, 1.2))})
+    return pd.DataFrame(rows)
+
+def _case(n_items: int, seed: int):
+    rng = random.Random(seed)
+    items = to_items(base_items(n_items, note_len=0))
+    planted = set(rng.sample(range(n_items), max(1, n_items // 10)))
+    out = []
+    for i, x in enumerate(items):
+        if i in planted:
+            x = Item(x.category, x.task, x.qty, x.unit, int(x.unit_price * rng.choice([0.1, 10])), x.note)
+        out.append(x)
+    out.append(Item("管理費", "管理費（固定）", 1, "式", 10_000_000_000, ""))
+    planted.add(len(out) - 1)
+    return out, planted
+
+def main():
+    card = RateCard(":memory:")
+    card.upsert("撮影費", "カメラマン#3", "日", 90_000, 60_000, 150_000)
+    t0 = time.perf_counter()
+    stats = load_price_stats(card, _history(500, 160))
+    print(f"統計の事前集計: {len(stats)} キー / {(time.perf_counter() - t0) * 1000:.1f} ms")
+    print(f"{'items':>6}{'score µs':>10}{'planted':>9}{'flagged':>9}{'missed':>8}{'extra':>7}")
+    for n_items in (15, 40, 160):
+        items, planted = _case(n_items, seed=n_items)
+        best = float("inf")
+        for _ in range(200):
+            t0 = time.perf_counter()
+            res = score_items(items, stats)
+            best = min(best, time.perf_counter() - t0)
+        flagged = set(res["flagged"])
+        print(f"{n_items:>6}{best * 1e6:>10.1f}{len(planted):>9}{len(flagged):>9}"
+              f"{len(planted - flagged):>8}{len(flagged - planted):>7}")
+    assert len(PriceStats.empty()) == 0
+
+if __name__ == "__main__":
+    main()
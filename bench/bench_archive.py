@@ -0,0 +1,48 @@
+# bench_archive.py — 見積アーカイブ（mitsumori.archive）の保存・検索・取得の時間
+# 合成した見積 N 件をメモリ上の SQLite に保存し、全文検索（trigram / 短語は LIKE）・カテゴリ・金額での検索を計る
+# 実行: python -m bench.bench_archive
+
+import random
+import time
+
+from mitsumori.archive import EstimateArchive
+from mitsumori.case import CaseSpec
+from mitsumori.items import to_items, items_to_df, df_to_items
+from mitsumori.estimate import compute_totals
+
+from bench.corpus_gen import base_items
+
+NOTES = ["化粧品 ブランドムービー", "ドローン空撮あり", "採用動画 インタビュー", "展示会用ループ映像", "SNS 縦型ショート"]
+QUERIES = [("", {}), ("ドローン", {}), ("インタビュー 採用", {}), ("カメラマン", {}),
+           ("SNS", {}), ("", {"category": "出演関連費"}), ("", {"min_total": 5_000_000, "max_total": 20_000_000})]
+
+def _fill(arc: EstimateArchive, n: int, seed: int = 0) -> float:
+    rng = random.Random(seed)
+    t0 = time.perf_counter()
+    for i in range(n):
+        items = to_items(base_items(rng.randint(8, 40), seed=i, note_len=2))
+        df, meta = compute_totals(items_to_df(items), 30, 20)
+        case = CaseSpec(extra_notes=f"{rng.choice(NOTES)} #{i}", shoot_location=rng.choice(["都内スタジオ", "大阪ロケ", ""]))
+        arc.save(case, df_to_items(df), meta, {"app": "bench", "model": "-"})
+    return time.perf_counter() - t0
+
+def main():
+    for n in (1_000, 10_000):
+        arc = EstimateArchive(":memory:")
+        fill = _fill(arc, n)
+        print(f"\n{n:,} 件  保存 {fill / n * 1000:.2f} ms/件")
+        print(f"{'query':<22}{'filter':<40}{'hits':>6}{'ms':>9}")
+        for q, kw in QUERIES:
+            best = float("inf")
+            for _ in range(10):
+                t0 = time.perf_counter()
+                hits = arc.search(q, limit=20, **kw)
+                best = min(best, time.perf_counter() - t0)
+            print(f"{q or '-':<22}{str(kw or '-'):<40}{len(hits):>6}{best * 1000:>9.2f}")
+        t0 = time.perf_counter()
+        rec = arc.get(n // 2)
+        print(f"get: {(time.perf_counter() - t0) * 1000:.2f} ms（{len(rec['items'])} 行）")
+        arc.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# bench_async_estimates.py — 同時に走る見積 N 件：1 件 1 スレッドで同期 SDK を待つ旧経路と、共有イベントループで await する経路
+# LLM は応答待ち LATENCY_S 秒の擬似プロバイダ（同期版は time.sleep、非同期版は asyncio.sleep）。生成 → 継続生成 1 回 → 正規化の
+# 3 リクエストに、価格レンジのサンプル（並行 RANGE_SAMPLES 本）を加えた movietest_app と同じ呼び出しの形で計る。
+# 旧経路はスクリプトのスレッドが見積ごとに 1 本＋レンジ用に 1 本＋サンプル用に RANGE_SAMPLES 本を使う。
+# 実行: python -m bench.bench_async_estimates
+
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from mitsumori import aio
+from mitsumori.case import CaseSpec
+from mitsumori.montecarlo import RANGE_SAMPLES, asample_parallel, sample_parallel
+from mitsumori.service import EstimateOptions, LLMProvider, run_estimate, run_estimate_async
+
+LATENCY_S = 0.2
+
+def _reply(prompt: str):
+    # 1 回目は途中切れ（閉じていない 2 件目）、継続指示には残りを返す
+    if "【継続指示】" in prompt:
+        return json.dumps({"items": [{"category": "編集費・MA費", "task": "編集", "qty": 3, "unit": "日", "unit_price": 60000}]}), False
+    head = {"category": "撮影費", "task": "カメラマン", "qty": 2, "unit": "日", "unit_price": 80000}
+    return '{"items": [' + json.dumps(head, ensure_ascii=False) + ', {"category": "編集費', True
+
+class FakeProvider(LLMProvider):
+    name = "fake"
+
+    def complete(self, prompt, max_tokens, temperature=0.2):
+        time.sleep(LATENCY_S)
+        return _reply(prompt)
+
+    async def acomplete(self, prompt, max_tokens, temperature=0.2):
+        await asyncio.sleep(LATENCY_S)
+        return _reply(prompt)
+
+CASE = CaseSpec(shoot_days=2, edit_days=3, extra_notes="bench")
+OPTIONS = EstimateOptions(target_days=30)
+
+def _threaded(n: int):
+    provider = FakeProvider("fake")
+
+    def _one(_):
+        with ThreadPoolExecutor(max_workers=1) as range_pool:
+            fut = range_pool.submit(sample_parallel, lambda p: provider.complete(p, 1)[0], "sample", RANGE_SAMPLES)
+            res = run_estimate(CASE, provider, OPTIONS)
+            fut.result()
+        return res
+
+    with ThreadPoolExecutor(max_workers=n) as sessions:   # Streamlit のセッションスレッドの代わり
+        return list(sessions.map(_one, range(n)))
+
+def _shared_loop(n: int):
+    provider = FakeProvider("fake")
+
+    async def _one():
+        samples = asyncio.ensure_future(asample_parallel(lambda p: provider.acomplete(p, 1), "sample", RANGE_SAMPLES))
+        res = await run_estimate_async(CASE, provider, OPTIONS)
+        await samples
+        return res
+
+    async def _all():
+        return await asyncio.gather(*(_one() for _ in range(n)))
+
+    return aio.run(_all())
+
+def _measure(fn, n: int):
+    """(結果, 秒, 実行中に増えたスレッド数の最大)"""
+    base = threading.active_count()
+    peak = [base]
+    stop = threading.Event()
+
+    def _watch():
+        while not stop.is_set():
+            peak[0] = max(peak[0], threading.active_count())
+            time.sleep(0.005)
+
+    w = threading.Thread(target=_watch)
+    w.start()
+    t0 = time.perf_counter()
+    results = fn(n)
+    sec = time.perf_counter() - t0
+    stop.set()
+    w.join()
+    return results, sec, peak[0] - base - 1
+
+def main():
+    aio.shared_loop()   # ループのスレッド自体は数えない
+    print(f"{'estimates':>10}{'threaded s':>12}{'threads':>9}{'shared loop s':>15}{'threads':>9}{'same':>6}")
+    for n in (1, 10, 50, 200):
+        ref, t_thr, th = _measure(_threaded, n)
+        got, t_loop, tl = _measure(_shared_loop, n)
+        same = all(a.meta == b.meta and a.items == b.items for a, b in zip(ref, got))
+        print(f"{n:>10}{t_thr:>12.2f}{th:>9}{t_loop:>15.2f}{tl:>9}{str(same):>6}")
+
+if __name__ == "__main__":
+    main()
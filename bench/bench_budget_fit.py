@@ -0,0 +1,67 @@
+# bench_budget_fit.py — 予算寄せの精度と時間：旧「単一倍率 + ¥1,000 丸め」と mitsumori.budget の比較
+# 誤差 = compute_totals 後の税抜合計 − 参考予算。倍率が [low, high] に張り付くケースは集計から除く。
+# 実行: python -m bench.bench_budget_fit
+
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from mitsumori.items import to_items, items_to_df
+from mitsumori.estimate import EstimateTable, MGMT_FEE_CAP_RATE, _compute_totals_df, compute_totals
+from mitsumori.budget import fit_prices_table, scale_prices_to_budget
+
+from bench.corpus_gen import base_items
+
+# ---------- 旧 scale_prices_to_budget（アプリ内実装の写し） ----------
+def _legacy_scale(df_items: pd.DataFrame, base_days: int, target_days: int, target_taxable_jpy: int,
+                  low: float = 0.6, high: float = 5.0, round_to: int = 1000) -> pd.DataFrame:
+    df_now, meta_now = _compute_totals_df(df_items, base_days, target_days)
+    nonmgmt_after_rush = float(meta_now["subtotal_after_rush_excl_mgmt"])
+    if nonmgmt_after_rush <= 0:
+        return df_items.copy()
+    desired_nonmgmt_after_rush = target_taxable_jpy / (1.0 + MGMT_FEE_CAP_RATE)
+    s = desired_nonmgmt_after_rush / nonmgmt_after_rush
+    s = max(low, min(high, s))
+    df_scaled = df_items.copy()
+    is_mgmt = (df_scaled["category"] == "管理費")
+    df_scaled.loc[~is_mgmt, "unit_price"] = (
+        df_scaled.loc[~is_mgmt, "unit_price"].astype(float) * s
+    ).round().astype(int)
+    if round_to and round_to > 1:
+        def _round(x): return int(round(x / round_to) * round_to)
+        df_scaled.loc[~is_mgmt, "unit_price"] = df_scaled.loc[~is_mgmt, "unit_price"].map(_round)
+    return df_scaled
+
+def main():
+    rng = random.Random(7)
+    print(f"{'items':>6}{'runs':>6}{'legacy |err| mean/max':>24}{'fit |err| mean/max':>22}{'legacy ms':>11}{'fit ms':>8}")
+    for n in (5, 15, 40, 160):
+        items = to_items(base_items(n, note_len=2))
+        for k, x in enumerate(items):
+            if k % 4 == 0:
+                x.qty = x.qty + 0.5
+        df_items = items_to_df(items)
+        t = EstimateTable.from_items(items)
+        base_taxable = compute_totals(df_items, 30, 30)[1]["taxable"]
+        err_a, err_b, t_a, t_b = [], [], 0.0, 0.0
+        runs = 100
+        for _ in range(runs):
+            target_days = rng.randint(5, 40)
+            target = int(base_taxable * rng.uniform(0.7, 2.5))
+            t0 = time.perf_counter()
+            df_a = _legacy_scale(df_items, 30, target_days, target)
+            t_a += time.perf_counter() - t0
+            t0 = time.perf_counter()
+            df_b = scale_prices_to_budget(df_items, 30, target_days, target)
+            t_b += time.perf_counter() - t0
+            if fit_prices_table(t, 30, target_days, target)[1]["clamped"]:
+                continue
+            err_a.append(abs(compute_totals(df_a, 30, target_days)[1]["taxable"] - target))
+            err_b.append(abs(compute_totals(df_b, 30, target_days)[1]["taxable"] - target))
+        print(f"{n:>6}{len(err_a):>6}{np.mean(err_a):>14,.0f}/{max(err_a):>9,}{np.mean(err_b):>12,.0f}/{max(err_b):>9,}"
+              f"{t_a/runs*1000:>11.3f}{t_b/runs*1000:>8.3f}")
+
+if __name__ == "__main__":
+    main()
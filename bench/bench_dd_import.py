@@ -0,0 +1,61 @@
+# bench_dd_import.py — 過去の DD見積書の一括取り込み（mitsumori.ddimport）の files/s
+# 合成テンプレ（bench/template_gen.py）に明細 8〜120 行を書いた xlsx を N 件作り（1 割は同じファイルの複製、
+# 枠を超える見積は続きのシート付き）、メモリ上のアーカイブへ取り込む。プロセス数 1 と CPU 数で比べ、
+# 読み戻した明細が書いた明細と一致すること・2 回目の取り込みが全件重複として飛ばされることも確かめる。
+# 実行: python -m bench.bench_dd_import
+
+import os
+import random
+import shutil
+import tempfile
+from pathlib import Path
+
+from mitsumori.archive import EstimateArchive
+from mitsumori.ddimport import import_files, read_dd_workbook
+from mitsumori.items import to_items, items_to_df
+from mitsumori.template import OVERFLOW_MAX_PAGES, fill_template
+
+from bench.corpus_gen import base_items
+from bench.template_gen import make_dd_template
+
+N_FILES = 300
+
+def _make_files(root: Path, n: int) -> dict:
+    rng = random.Random(0)
+    t = make_dd_template()
+    written = {}
+    for i in range(n):
+        path = root / f"{2019 + i % 6}" / f"見積_{i:04d}.xlsx"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if i % 10 == 9:
+            shutil.copy(root / f"{2019 + (i - 1) % 6}" / f"見積_{i - 1:04d}.xlsx", path)  # 複製
+            continue
+        items = to_items(base_items(rng.randint(8, 120), seed=i))
+        path.write_bytes(fill_template(t, items_to_df(items), max_pages=OVERFLOW_MAX_PAGES).data)
+        written[str(path)] = [(x.task, x.qty, x.unit, x.unit_price) for x in items]
+    return written
+
+def main():
+    root = Path(tempfile.mkdtemp(prefix="dd_import_"))
+    try:
+        written = _make_files(root, N_FILES)
+        paths = sorted(str(p) for p in root.rglob("*.xlsx"))
+        for p, want in list(written.items())[:20]:
+            got = read_dd_workbook(Path(p).read_bytes()).items
+            assert [(x.task, x.qty, x.unit, x.unit_price) for x in got] == want, f"{p}: 読み戻した明細が一致しない"
+
+        print(f"{N_FILES} files（重複 {N_FILES - len(written)}）")
+        print(f"{'workers':>8}{'imported':>10}{'dup':>6}{'sec':>8}{'files/s':>10}")
+        for workers in sorted({1, os.cpu_count() or 1}):
+            arc = EstimateArchive(":memory:")
+            st = import_files(arc, paths, workers=workers)
+            assert st.imported == len(written) and not st.errors, st
+            print(f"{workers:>8}{st.imported:>10}{st.duplicates:>6}{st.seconds:>8.2f}{st.files_per_sec:>10.1f}")
+            again = import_files(arc, paths, workers=workers)
+            assert again.imported == 0 and again.duplicates == N_FILES
+            print(f"{'(再実行)':>8}{again.imported:>10}{again.duplicates:>6}{again.seconds:>8.2f}{again.files_per_sec:>10.1f}")
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == "__main__":
+    main()
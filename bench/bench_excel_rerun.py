@@ -0,0 +1,46 @@
+# bench_excel_rerun.py — download_excel の再実行 1 回あたりの時間：毎回ブックを作る旧経路と内容ハッシュのキャッシュ
+# 旧経路は BytesIO に書いて download_button に渡す（受け取り側で getvalue のコピーが入る）まで、
+# キャッシュ経路は内容ハッシュの計算 ＋ キャッシュ済み bytes の受け渡しまでを計る。
+# 実行: python -m bench.bench_excel_rerun
+
+import time
+from io import BytesIO
+
+import pandas as pd
+
+from mitsumori.items import to_items, items_to_df
+from mitsumori.estimate import compute_totals
+from mitsumori.export import estimate_xlsx, estimate_xlsx_bytes
+
+from bench.corpus_gen import base_items
+
+RERUNS = 20
+
+def _legacy(df, meta) -> bytes:
+    buf = BytesIO(estimate_xlsx_bytes(df, meta))
+    buf.seek(0)
+    return buf.getvalue()
+
+def _per_run(fn, df, meta) -> float:
+    t0 = time.perf_counter()
+    for _ in range(RERUNS):
+        fn(df, meta)
+    return (time.perf_counter() - t0) / RERUNS
+
+def main():
+    print(f"{'rows':>6}{'legacy ms':>11}{'first ms':>10}{'cached ms':>11}{'speedup':>9}{'xlsx KB':>9}")
+    for n in (15, 40, 200, 1000, 5000):
+        df, meta = compute_totals(items_to_df(to_items(base_items(n))), 30, 20)
+        legacy = _per_run(_legacy, df, meta)
+        t0 = time.perf_counter()
+        data = estimate_xlsx(df, meta)
+        first = time.perf_counter() - t0
+        cached = _per_run(estimate_xlsx, df, meta)
+        got = pd.read_excel(BytesIO(data), nrows=len(df))
+        ref = pd.read_excel(BytesIO(_legacy(df, meta)), nrows=len(df))
+        assert got.equals(ref)
+        print(f"{n:>6}{legacy * 1000:>11.2f}{first * 1000:>10.2f}{cached * 1000:>11.3f}"
+              f"{legacy / cached:>8.0f}x{len(data) / 1024:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# bench_item_pipeline.py — 旧「JSON 文字列リレー」と型付き Item パイプラインの比較
+# 旧: raw → robust_parse_items_json(str) → [正規化: プロンプト→応答→robust_parse_items_json(str)] → df_from_items_json
+# 新: raw → parse_items(List[Item]) → [正規化: items_to_json→応答→parse_items] → items_to_df
+# 正規化 LLM は「入力 JSON をそのまま返す」エコーで代用（LLM 境界の直列化コストは両方に残る）。
+# 実行: python -m bench.bench_item_pipeline
+
+import json
+import time
+import tracemalloc
+
+import pandas as pd
+
+from mitsumori.parsing import robust_parse_items_json
+from mitsumori.items import parse_items, items_to_json, items_to_df
+
+from bench.corpus_gen import base_items, render
+
+# ---------- 旧 df_from_items_json（dict 再構築 + pd.to_numeric） ----------
+def _legacy_df_from_items_json(items_json: str) -> pd.DataFrame:
+    try:
+        data = json.loads(items_json) if items_json else {}
+    except Exception:
+        data = {}
+    items = data.get("items", []) or []
+    norm = []
+    for x in items:
+        norm.append({
+            "category": str((x or {}).get("category", "")),
+            "task": str((x or {}).get("task", "")),
+            "qty": (x or {}).get("qty", 0),
+            "unit": str((x or {}).get("unit", "")),
+            "unit_price": (x or {}).get("unit_price", 0),
+            "note": str((x or {}).get("note", "")),
+        })
+    df = pd.DataFrame(norm)
+    for col in ["category", "task", "qty", "unit", "unit_price", "note"]:
+        if col not in df.columns:
+            df[col] = "" if col in ["category", "task", "unit", "note"] else 0
+    df["qty"] = pd.to_numeric(df["qty"], errors="coerce").fillna(0.0)
+    df["unit_price"] = pd.to_numeric(df["unit_price"], errors="coerce").fillna(0).astype(int)
+    return df
+
+def legacy_pipeline(raw: str, normalize: bool):
+    s = robust_parse_items_json(raw)
+    if normalize:
+        prompt_payload = s
+        s = robust_parse_items_json(prompt_payload)
+    df = _legacy_df_from_items_json(s)
+    stored = s
+    return df, stored
+
+def typed_pipeline(raw: str, normalize: bool):
+    items = parse_items(raw)
+    if normalize:
+        prompt_payload = items_to_json(items)
+        items = parse_items(prompt_payload)
+    df = items_to_df(items)
+    stored = items_to_json(items)
+    return df, stored
+
+def _measure(fn, raw: str, normalize: bool, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(raw, normalize)
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    fn(raw, normalize)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+def main():
+    print(f"{'items':>6}{'normalize':>10}{'legacy ms':>11}{'typed ms':>10}{'speedup':>9}{'legacy KiB':>12}{'typed KiB':>11}")
+    for n, repeat in [(15, 200), (40, 100), (160, 30), (1000, 5)]:
+        raw, _ = render(base_items(n, note_len=2), "json", "items", "fence")
+        df_a, _ = legacy_pipeline(raw, True)
+        df_b, _ = typed_pipeline(raw, True)
+        pd.testing.assert_frame_equal(df_a, df_b)
+        for normalize in (False, True):
+            t_a, m_a = _measure(legacy_pipeline, raw, normalize, repeat)
+            t_b, m_b = _measure(typed_pipeline, raw, normalize, repeat)
+            print(f"{n:>6}{str(normalize):>10}{t_a*1000:>11.3f}{t_b*1000:>10.3f}{t_a/t_b:>8.2f}x"
+                  f"{m_a/1024:>12.1f}{m_b/1024:>11.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# bench_json_scan.py — 旧 _coerce_json_like（正規表現＋ast.literal_eval）と寛容スキャナの比較
+# 実行: python -m bench.bench_json_scan
+
+import re
+import ast
+import json
+import time
+import random
+import tracemalloc
+
+from mitsumori.parsing import coerce_json_like
+
+# ---------- 旧実装（movie_app / movietest_app / ssstest_app にあったもの） ----------
+def _legacy_strip_code_fences(s: str) -> str:
+    s = s.strip()
+    if s.startswith("```"):
+        s = re.sub(r"^```(json)?\s*", "", s, flags=re.IGNORECASE)
+        s = re.sub(r"\s*```$", "", s)
+    return s.strip()
+
+def _legacy_coerce_json_like(s: str):
+    s = _legacy_strip_code_fences(s)
+    if not s:
+        return None
+    try:
+        return json.loads(s)
+    except Exception:
+        pass
+    try:
+        first = s.find("{"); last = s.rfind("}")
+        if first != -1 and last != -1 and last > first:
+            frag = s[first:last+1]
+            frag = re.sub(r",\s*([}\]])", r"\1", frag)
+            frag2 = frag.replace("\r", "")
+            frag2 = re.sub(r"\bTrue\b", "true", frag2)
+            frag2 = re.sub(r"\bFalse\b", "false", frag2)
+            frag2 = re.sub(r"\bNone\b", "null", frag2)
+            if "'" in frag2 and '"' not in frag2:
+                frag2 = frag2.replace("'", '"')
+            try:
+                return json.loads(frag2)
+            except Exception:
+                pass
+    except Exception:
+        pass
+    try:
+        return ast.literal_eval(s)
+    except Exception:
+        return None
+
+# ---------- 入力生成 ----------
+CATS = ["制作人件費", "企画", "撮影費", "出演関連費", "編集費・MA費", "諸経費"]
+
+def _items(n: int, seed: int = 0):
+    rnd = random.Random(seed)
+    return [{
+        "category": rnd.choice(CATS),
+        "task": f"項目{i}",
+        "qty": rnd.randint(1, 5),
+        "unit": "日",
+        "unit_price": rnd.randrange(10_000, 500_000, 1_000),
+        "note": "備考" * rnd.randint(0, 4),
+    } for i in range(n)]
+
+def make_cases(n: int):
+    items = _items(n)
+    valid = json.dumps({"items": items}, ensure_ascii=False, indent=2)
+    return {
+        "valid": valid,
+        "fenced": f"```json\n{valid}\n```",
+        "trailing_commas": valid.replace("}\n", "},\n").replace("]\n}", ",]\n}"),
+        "python_repr": repr({"items": items}),
+        "python_literals": valid.replace("true", "True").replace('"note": "', '"flag": None, "note": "'),
+        "truncated": valid[: int(len(valid) * 0.8)],
+    }
+
+def _bench(fn, s: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(s)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def _peak_kib(fn, s: str) -> float:
+    tracemalloc.start()
+    fn(s)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+def _count_items(obj) -> int:
+    if isinstance(obj, dict) and isinstance(obj.get("items"), list):
+        return len(obj["items"])
+    return -1
+
+def main():
+    for n, repeat in [(40, 50), (400, 10), (8000, 3)]:
+        cases = make_cases(n)
+        print(f"\n=== items={n} ===")
+        print(f"{'case':<18}{'bytes':>10}{'legacy ms':>12}{'scan ms':>10}"
+              f"{'legacy KiB':>12}{'scan KiB':>10}{'legacy n':>10}{'scan n':>8}")
+        for name, s in cases.items():
+            t_old = _bench(_legacy_coerce_json_like, s, repeat)
+            t_new = _bench(coerce_json_like, s, repeat)
+            m_old = _peak_kib(_legacy_coerce_json_like, s)
+            m_new = _peak_kib(coerce_json_like, s)
+            n_old = _count_items(_legacy_coerce_json_like(s))
+            n_new = _count_items(coerce_json_like(s))
+            print(f"{name:<18}{len(s.encode()):>10}{t_old*1000:>12.2f}{t_new*1000:>10.2f}"
+                  f"{m_old:>12.0f}{m_new:>10.0f}{n_old:>10}{n_new:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# bench_parse_stages.py — パース経路のステージ別スループット／割り当て計測
+# ステージ: scan（coerce_json_like）→ robust_parse_items_json（正規化＋json.dumps）→ df_from_items_json
+# 実行: python -m bench.bench_parse_stages [--repeat 5] [--out bench_output.txt]
+
+import sys
+import time
+import argparse
+import tracemalloc
+
+from mitsumori.parsing import coerce_json_like, robust_parse_items_json
+from mitsumori.items import df_from_items_json
+
+from bench.corpus_gen import CORPUS_VERSION, load_manifest, load_case_text, generate, long_response
+
+STAGES = [
+    ("scan", lambda raw, parsed: coerce_json_like(raw)),
+    ("robust_parse", lambda raw, parsed: robust_parse_items_json(raw)),
+    ("df_from_items", lambda raw, parsed: df_from_items_json(parsed)),
+]
+
+def _groups():
+    manifest = load_manifest()
+    yield f"corpus/{CORPUS_VERSION}", [load_case_text(c["file"]) for c in manifest["cases"]]
+    by_style = {}
+    for name, text, _ in generate(300, seed=1):
+        by_style.setdefault("synthetic/" + name.split("/")[0], []).append(text)
+    yield from sorted(by_style.items())
+    for style in ("json", "python", "fullwidth"):
+        yield f"long8k/{style}", [long_response(style=style)[0]]
+
+def _time_stage(fn, texts, parsed, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for raw, p in zip(texts, parsed):
+            fn(raw, p)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def _peak_stage(fn, texts, parsed) -> int:
+    peak = 0
+    for raw, p in zip(texts, parsed):
+        tracemalloc.start()
+        fn(raw, p)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return peak
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--out", default=None, help="結果を追記するファイル（例: bench_output.txt）")
+    args = ap.parse_args(argv)
+
+    lines = [f"{'group':<28}{'stage':<16}{'docs':>6}{'KiB':>9}{'items':>7}{'ms':>9}{'MB/s':>8}{'items/s':>10}{'peak KiB':>10}"]
+    for group, texts in _groups():
+        parsed = [robust_parse_items_json(t) for t in texts]
+        n_items = sum(len(df_from_items_json(p)) for p in parsed)
+        n_bytes = sum(len(t.encode("utf-8")) for t in texts)
+        for stage, fn in STAGES:
+            sec = _time_stage(fn, texts, parsed, args.repeat)
+            peak = _peak_stage(fn, texts, parsed)
+            mbps = n_bytes / sec / 1e6 if sec else 0.0
+            ips = n_items / sec if sec else 0.0
+            lines.append(f"{group:<28}{stage:<16}{len(texts):>6}{n_bytes/1024:>9.1f}{n_items:>7}"
+                         f"{sec*1000:>9.2f}{mbps:>8.2f}{ips:>10.0f}{peak/1024:>10.1f}")
+
+    report = "\n".join(lines)
+    print(report)
+    if args.out:
+        with open(args.out, "a", encoding="utf-8") as f:
+            f.write(report + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
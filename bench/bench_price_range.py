@@ -0,0 +1,43 @@
+# bench_price_range.py — 価格レンジ（mitsumori.montecarlo.price_bands）の集計時間と、サンプルごとの compute_totals との一致確認
+# サンプルは base_items の単価を ±30% 程度揺らし、1 割の行を欠落させた合成データ
+# 実行: python -m bench.bench_price_range
+
+import random
+import time
+
+import numpy as np
+
+from mitsumori.items import to_items
+from mitsumori.estimate import EstimateTable, compute_totals_table
+from mitsumori.montecarlo import price_bands
+
+from bench.corpus_gen import base_items
+
+def _samples(n_items: int, n_samples: int, seed: int):
+    rng = random.Random(seed)
+    base = base_items(n_items, note_len=2)
+    out = []
+    for _ in range(n_samples):
+        raw = [dict(x, unit_price=int(x["unit_price"] * rng.uniform(0.7, 1.3)))
+               for x in base if rng.random() > 0.1]
+        out.append(to_items(raw))
+    return out
+
+def main():
+    print(f"{'items':>6}{'samples':>9}{'bands ms':>10}{'P10 total':>14}{'P50 total':>14}{'P90 total':>14}")
+    for n_items in (15, 40, 160):
+        for n_samples in (5, 10, 30):
+            samples = _samples(n_items, n_samples, seed=n_items + n_samples)
+            best = float("inf")
+            for _ in range(20):
+                t0 = time.perf_counter()
+                band = price_bands(samples, 30, 20)
+                best = min(best, time.perf_counter() - t0)
+            ref = [compute_totals_table(EstimateTable.from_items(s), 30, 20)[1]["total"] for s in samples]
+            for p, v in zip((10, 50, 90), np.percentile(ref, [10, 50, 90])):
+                assert abs(band["total"][p] - v) <= 1, (p, band["total"][p], v)
+            t = band["total"]
+            print(f"{n_items:>6}{n_samples:>9}{best*1000:>10.3f}{t[10]:>14,}{t[50]:>14,}{t[90]:>14,}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# bench_retrieval.py — 類似案件検索（mitsumori.retrieval）の索引作成・検索時間と、few-shot ブロックの長さ
+# 合成アーカイブ（条件をランダムに振った CaseSpec ＋ base_items）で計る。
+# --live を付けると OPENAI_API_KEY で実際に生成し、few-shot あり／なしの
+# 出力行数・合計のばらつき（変動係数）・応答時間を比べる（課金が発生するので既定では呼ばない）。
+# 実行: python -m bench.bench_retrieval [--live] [--runs 5] [--model gpt-4.1]
+
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+from mitsumori.case import CaseSpec
+from mitsumori.items import to_items, parse_items, items_to_df
+from mitsumori.estimate import compute_totals
+from mitsumori.retrieval import CaseIndex, few_shot_block
+
+from bench.corpus_gen import base_items
+
+NOTES = ["化粧品のブランドムービー。スタジオ撮影、モデル 1 名", "採用動画。社員インタビュー 3 名、オフィス撮影",
+         "ドローン空撮を含む観光 PR", "展示会用のループ映像、CG 多め", "SNS 向け縦型ショート 5 本"]
+
+def _case(rng: random.Random) -> CaseSpec:
+    return CaseSpec(
+        final_duration=rng.choice(["15秒", "30秒", "60秒", "3分"]), num_versions=rng.randint(1, 5),
+        shoot_days=rng.randint(1, 4), edit_days=rng.randint(2, 8), cast_main=rng.randint(0, 3),
+        cast_extra=rng.randint(0, 10), use_cg=rng.random() < 0.3, ma_needed=rng.random() < 0.5,
+        kizai=rng.sample(["4Kカメラ", "照明", "ドローン", "グリーンバック"], rng.randint(1, 3)),
+        shoot_location=rng.choice(["都内スタジオ", "大阪ロケ", "オフィス"]), extra_notes=rng.choice(NOTES),
+    )
+
+def _offline(n_cases: int, k: int):
+    rng = random.Random(n_cases)
+    cases = [(i, _case(rng)) for i in range(n_cases)]
+    items = {i: to_items(base_items(rng.randint(10, 30), seed=i, note_len=0)) for i, _ in cases}
+    t0 = time.perf_counter()
+    idx = CaseIndex.build(cases)
+    build = time.perf_counter() - t0
+    probes = [_case(rng) for _ in range(50)]
+    t0 = time.perf_counter()
+    hits = [idx.nearest(p, k) for p in probes]
+    search = (time.perf_counter() - t0) / len(probes)
+    block = few_shot_block([(cases[i][1], items[i], s) for i, s in hits[0]])
+    print(f"{n_cases:>8,}{build * 1000:>12.1f}{search * 1000:>12.3f}{len(block):>12,}")
+    return cases, items, idx
+
+def _live(model: str, runs: int, k: int):
+    from openai import OpenAI
+    client = OpenAI()
+    cases, items, idx = _offline(2_000, k)
+    rng = random.Random(7)
+    probe = _case(rng)
+    block = few_shot_block([(cases[i][1], items[i], s) for i, s in idx.nearest(probe, k)])
+    base = ("JSON 1オブジェクト（ルートは items 配列。各要素 category/task/qty/unit/unit_price/note）で"
+            f"広告映像の見積項目を返してください。\n【案件条件】{probe.to_dict()}\n")
+    print(f"\n{'mode':<10}{'items mean':>12}{'items sd':>10}{'total CV':>10}{'latency s':>11}{'prompt chars':>14}")
+    for mode, prompt in (("zero-shot", base), ("few-shot", base + "\n" + block)):
+        n_items, totals, lat = [], [], []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            resp = client.chat.completions.create(
+                model=model, messages=[{"role": "user", "content": prompt}],
+                response_format={"type": "json_object"}, temperature=0.7, max_tokens=4000,
+            )
+            lat.append(time.perf_counter() - t0)
+            got = parse_items(resp.choices[0].message.content or "")
+            n_items.append(len(got))
+            totals.append(compute_totals(items_to_df(got), probe.base_days, probe.base_days)[1]["total"] if got else 0)
+        t = np.asarray(totals, dtype=float)
+        cv = t.std() / t.mean() if t.mean() else float("nan")
+        print(f"{mode:<10}{np.mean(n_items):>12.1f}{np.std(n_items):>10.2f}{cv:>10.3f}{np.mean(lat):>11.2f}{len(prompt):>14,}")
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m bench.bench_retrieval")
+    ap.add_argument("--live", action="store_true")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--model", default="gpt-4.1")
+    ap.add_argument("-k", type=int, default=3)
+    args = ap.parse_args(argv)
+    print(f"{'cases':>8}{'build ms':>12}{'query ms':>12}{'block chars':>12}")
+    for n in (1_000, 10_000, 50_000):
+        _offline(n, args.k)
+    if args.live:
+        if not os.getenv("OPENAI_API_KEY"):
+            print("OPENAI_API_KEY が未設定のため --live を省略しました。")
+            return 1
+        _live(args.model, args.runs, args.k)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
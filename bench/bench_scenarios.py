@@ -0,0 +1,55 @@
+# bench_scenarios.py — What-if 格子の一括評価（mitsumori.scenario）とセルごとのスカラー計算の比較
+# スカラー: セルごとに fit_prices_table → compute_totals_table（アプリで 1 回ずつ再実行するのと同じ計算）
+# 実行: python -m bench.bench_scenarios
+
+import time
+
+from mitsumori.items import to_items
+from mitsumori.estimate import EstimateTable, compute_totals_table
+from mitsumori.budget import fit_prices_table
+from mitsumori.scenario import evaluate_grid
+
+from bench.corpus_gen import base_items
+
+KEYS = ("subtotal_after_rush_excl_mgmt", "mgmt_fee_final", "taxable", "tax", "total")
+
+def scalar_grid(t: EstimateTable, base_days: int, days, budgets) -> list:
+    rows = []
+    for d in days:
+        row = []
+        for b in budgets:
+            tt = fit_prices_table(t, base_days, d, b)[0] if b else t
+            row.append(compute_totals_table(tt, base_days, d)[1])
+        rows.append(row)
+    return rows
+
+def main():
+    base_days = 30
+    print(f"{'items':>6}{'cells':>7}{'scalar ms':>11}{'grid ms':>9}{'speedup':>9}")
+    for n in (15, 40, 160):
+        items = to_items(base_items(n, note_len=2))
+        for k, x in enumerate(items):
+            if k % 4 == 0:
+                x.qty = x.qty + 0.5
+        t = EstimateTable.from_items(items)
+        for days, budgets in [
+            (list(range(10, 31, 4)), [0, 2_000_000, 3_000_000, 4_000_000]),
+            (list(range(1, 41)), [0] + list(range(300_000, 10_000_000, 250_000))),
+        ]:
+            t0 = time.perf_counter()
+            ref = scalar_grid(t, base_days, days, budgets)
+            t_s = time.perf_counter() - t0
+            best = float("inf")
+            for _ in range(20):
+                t0 = time.perf_counter()
+                grid = evaluate_grid(t, base_days, days, budgets)
+                best = min(best, time.perf_counter() - t0)
+            for i in range(len(days)):
+                for j in range(len(budgets)):
+                    for k in KEYS:
+                        assert ref[i][j][k] == grid[k][i, j], (n, days[i], budgets[j], k)
+            cells = len(days) * len(budgets)
+            print(f"{n:>6}{cells:>7}{t_s*1000:>11.2f}{best*1000:>9.3f}{t_s/best:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
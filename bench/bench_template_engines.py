@@ -0,0 +1,51 @@
+# bench_template_engines.py — DD見積書テンプレ出力：openpyxl 版とシート XML 直接書き換え版の比較
+# 合成テンプレ（bench/template_gen.py）の大きさを変え、明細 40 行を書く時間と出力サイズを計る。
+# xml 版の「初回」はテンプレの下準備（対象シートの分解・スタイル追加）込み、「2 回目以降」は下準備済み。
+# 明細シートの値・式・表示形式・太字が openpyxl 版と一致することも確かめる。
+# 実行: python -m bench.bench_template_engines
+
+import time
+from io import BytesIO
+
+from openpyxl import load_workbook
+
+from mitsumori.items import to_items, items_to_df
+from mitsumori.estimate import compute_totals
+from mitsumori.template import fill_template, template_info
+
+from bench.corpus_gen import base_items
+from bench.template_gen import make_dd_template
+
+TEMPLATES = [("軽量", dict(style_heavy=False)),
+             ("装飾＋参照表 3k 行", dict(style_heavy=True, ref_rows=3_000)),
+             ("装飾＋参照表 30k 行", dict(style_heavy=True, ref_rows=30_000))]
+REPEAT = 5
+
+def _sheet(data: bytes) -> dict:
+    ws = load_workbook(BytesIO(data)).active
+    return {c.coordinate: (c.value, c.number_format, bool(c.font.b))
+            for row in ws.iter_rows() for c in row if c.value is not None}
+
+def _per_run(t, df, engine) -> float:
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        fill_template(t, df, engine=engine)
+    return (time.perf_counter() - t0) / REPEAT
+
+def main():
+    df, _ = compute_totals(items_to_df(to_items(base_items(40))), 30, 20)
+    print(f"{'template':<22}{'KB':>7}{'openpyxl s':>12}{'xml first s':>13}{'xml warm ms':>13}{'speedup':>9}")
+    for name, kw in TEMPLATES:
+        t = make_dd_template(**kw)
+        template_info(t)  # テンプレ解析（mitsumori/template.py のレジストリ）はどちらの経路でも共通
+        ref = fill_template(t, df, engine="openpyxl").data
+        t0 = time.perf_counter()
+        got = fill_template(t, df, engine="xml").data
+        first = time.perf_counter() - t0
+        assert _sheet(got) == _sheet(ref), f"{name}: 明細シートが openpyxl 版と一致しない"
+        slow = _per_run(t, df, "openpyxl")
+        warm = _per_run(t, df, "xml")
+        print(f"{name:<22}{len(t) / 1024:>7.0f}{slow:>12.2f}{first:>13.3f}{warm * 1000:>13.1f}{slow / warm:>8.0f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# bench_template_overflow.py — DD見積書テンプレの続きシート出力（明細枠 53 行を超える見積）
+# 明細 100〜1,000 行を max_pages=OVERFLOW_MAX_PAGES で書き、openpyxl 版と xml 版の時間・シート数を比べる。
+# 両方の出力で、各シートの値・式・表示形式・太字が一致することも確かめる（1 枚目の小計は続きのシートの小計を足す式）。
+# 実行: python -m bench.bench_template_overflow
+
+import time
+from io import BytesIO
+
+from openpyxl import load_workbook
+
+from mitsumori.items import to_items, items_to_df
+from mitsumori.estimate import compute_totals
+from mitsumori.template import OVERFLOW_MAX_PAGES, fill_template
+
+from bench.corpus_gen import base_items
+from bench.template_gen import make_dd_template
+
+SIZES = [100, 300, 1000]
+REPEAT = 3
+
+def _sheets(data: bytes) -> dict:
+    wb = load_workbook(BytesIO(data))
+    return {ws.title: {c.coordinate: (c.value, c.number_format, bool(c.font.b))
+                       for row in ws.iter_rows() for c in row if c.value is not None}
+            for ws in wb.worksheets}
+
+def _per_run(t, df, engine) -> float:
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        fill_template(t, df, engine=engine, max_pages=OVERFLOW_MAX_PAGES)
+    return (time.perf_counter() - t0) / REPEAT
+
+def main():
+    t = make_dd_template(style_heavy=True, ref_rows=3_000)
+    print(f"{'lines':>7}{'sheets':>8}{'dropped':>9}{'openpyxl s':>12}{'xml ms':>9}{'speedup':>9}")
+    for n in SIZES:
+        df, _ = compute_totals(items_to_df(to_items(base_items(n))), 30, 20)
+        ref = fill_template(t, df, engine="openpyxl", max_pages=OVERFLOW_MAX_PAGES)
+        got = fill_template(t, df, engine="xml", max_pages=OVERFLOW_MAX_PAGES)
+        assert (got.pages, got.dropped) == (ref.pages, ref.dropped)
+        assert _sheets(got.data) == _sheets(ref.data), f"{n} 行: 続きのシートが openpyxl 版と一致しない"
+        slow = _per_run(t, df, "openpyxl")
+        fast = _per_run(t, df, "xml")
+        print(f"{n:>7}{got.pages:>8}{got.dropped:>9}{slow:>12.2f}{fast * 1000:>9.1f}{slow / fast:>8.0f}x")
+
+if __name__ == "__main__":
+    main()
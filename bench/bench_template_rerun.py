@@ -0,0 +1,40 @@
+# bench_template_rerun.py — 結果欄の再実行 1 回あたりの DD見積書テンプレ出力の時間
+# 旧経路は再実行のたびに openpyxl で読み込み・書き込み・保存していた（export_with_template の毎回呼び出し）。
+# キャッシュ経路（template_xlsx）はテンプレの SHA-256 と明細・meta の内容ハッシュを取って覚えた bytes を返すだけ。
+# 参考として、キャッシュなしの XML 直接書き換え（内容が変わった再実行で掛かる時間）も並べる。
+# 実行: python -m bench.bench_template_rerun
+
+import time
+
+from mitsumori.items import to_items, items_to_df
+from mitsumori.estimate import compute_totals
+from mitsumori.template import fill_template, template_xlsx
+
+from bench.corpus_gen import base_items
+from bench.template_gen import make_dd_template
+
+TEMPLATES = [("軽量", dict(style_heavy=False)), ("装飾＋参照表 3k 行", dict(style_heavy=True, ref_rows=3_000))]
+RERUNS = 5
+
+def _per_run(fn) -> float:
+    t0 = time.perf_counter()
+    for _ in range(RERUNS):
+        fn()
+    return (time.perf_counter() - t0) / RERUNS
+
+def main():
+    print(f"{'template':<20}{'lines':>6}{'legacy ms':>11}{'xml ms':>9}{'cached ms':>11}{'speedup':>9}")
+    for name, kw in TEMPLATES:
+        t = make_dd_template(**kw)
+        for n in (15, 45):
+            df, meta = compute_totals(items_to_df(to_items(base_items(n))), 30, 20)
+            legacy = _per_run(lambda: fill_template(t, df, engine="openpyxl"))
+            xml = _per_run(lambda: fill_template(t, df, engine="xml"))
+            first = template_xlsx(t, df, meta)
+            cached = _per_run(lambda: template_xlsx(t, df, meta))
+            assert template_xlsx(t, df, meta) is first
+            print(f"{name:<20}{n:>6}{legacy * 1000:>11.1f}{xml * 1000:>9.2f}{cached * 1000:>11.3f}"
+                  f"{legacy / cached:>8.0f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# bench_totals.py — 再実行ごとの「合計計算 → HTML」経路の比較
+# 旧: pandas の compute_totals と iterrows の render_html（アプリ内実装の写し）
+# 新: mitsumori.estimate（列配列の整数円カーネル。FAST_PATH_MAX_ROWS 以下）と mitsumori.render
+# 実行: python -m bench.bench_totals
+
+import time
+
+import pandas as pd
+
+from mitsumori.items import to_items, items_to_df
+from mitsumori.estimate import (
+    MGMT_FEE_CAP_RATE, TAX_RATE, FAST_PATH_MAX_ROWS, _compute_totals_df, compute_totals,
+)
+from mitsumori.budget import scale_prices_to_budget
+from mitsumori.render import render_html
+
+from bench.corpus_gen import base_items
+
+# ---------- 旧 render_html（iterrows） ----------
+def _legacy_render_html(df_items: pd.DataFrame, meta: dict) -> str:
+    def td_right(x): return f"<td style='text-align:right'>{x}</td>"
+    html = []
+    html.append("<p>以下は、映像制作にかかる各種費用をカテゴリごとに整理した概算見積書です。</p>")
+    html.append(f"<p>短納期係数：{meta['rush_coeff']} ／ 管理費上限：{int(MGMT_FEE_CAP_RATE*100)}% ／ 消費税率：{int(TAX_RATE*100)}%</p>")
+    html.append("<table border='1' cellspacing='0' cellpadding='6' style='border-collapse:collapse;width:100%'>")
+    html.append("<thead><tr>"
+                "<th style='text-align:left'>カテゴリ</th>"
+                "<th style='text-align:left'>項目</th>"
+                "<th style='text-align:right'>単価</th>"
+                "<th style='text-align:left'>数量</th>"
+                "<th style='text-align:left'>単位</th>"
+                "<th style='text-align:right'>金額（円）</th>"
+                "</tr></thead>")
+    html.append("<tbody>")
+    current_cat = None
+    for _, r in df_items.iterrows():
+        cat = r.get("category", "")
+        if cat != current_cat:
+            html.append(f"<tr><td colspan='6' style='text-align:left;background:#f6f6f6;font-weight:bold'>{cat}</td></tr>")
+            current_cat = cat
+        unit_price_str = f"{int(r.get('unit_price', 0)):,}"
+        qty_str = str(r.get('qty', ''))
+        unit_str = r.get('unit', '')
+        amount_str = f"{int(r.get('小計', 0)):,}"
+        task_str = r.get('task', '')
+        html.append(
+            "<tr>"
+            f"<td>{cat}</td>"
+            f"<td>{task_str}</td>"
+            f"{td_right(unit_price_str)}"
+            f"<td>{qty_str}</td>"
+            f"<td>{unit_str}</td>"
+            f"{td_right(amount_str)}"
+            "</tr>"
+        )
+    html.append("</tbody></table>")
+    html.append(
+        f"<p><b>小計（税抜）</b>：{meta['taxable']:,}円　／　"
+        f"<b>消費税</b>：{meta['tax']:,}円　／　"
+        f"<b>合計</b>：<span style='color:red'>{meta['total']:,}円</span></p>"
+    )
+    html.append("<p>※本見積書は自動生成された概算です。実制作内容・条件により金額が増減します。</p>")
+    return "\n".join(html)
+
+def legacy_rerun(df_items, base_days, target_days):
+    df_calc, meta = _compute_totals_df(df_items, base_days, target_days)
+    return df_calc, meta, _legacy_render_html(df_calc, meta)
+
+def fast_rerun(df_items, base_days, target_days):
+    df_calc, meta = compute_totals(df_items, base_days, target_days)
+    return df_calc, meta, render_html(df_calc, meta)
+
+def _cases(n: int):
+    items = to_items(base_items(n, note_len=2))
+    yield "with_mgmt", items_to_df(items)
+    yield "no_mgmt", items_to_df([x for x in items if x.category != "管理費"])
+    for x in items[::3]:
+        x.qty = x.qty + 0.5
+    yield "float_qty", items_to_df(items)
+    yield "budget_fit", scale_prices_to_budget(items_to_df(items), 30, 12, 3_000_000)
+
+def _check(df_items):
+    for base_days, target_days in [(30, 30), (30, 12), (20, 5)]:
+        a = legacy_rerun(df_items, base_days, target_days)
+        b = fast_rerun(df_items, base_days, target_days)
+        pd.testing.assert_frame_equal(a[0], b[0])
+        assert a[1] == b[1], (a[1], b[1])
+        assert a[2] == b[2]
+
+def _best(fn, df_items, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(df_items, 30, 12)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    print(f"fast path: <= {FAST_PATH_MAX_ROWS} rows")
+    print(f"{'items':>6}{'case':>11}{'legacy ms':>11}{'fast ms':>9}{'speedup':>9}")
+    for n, repeat in [(15, 200), (40, 100), (160, 30), (1000, 5)]:
+        for name, df_items in _cases(n):
+            _check(df_items)
+            t_a = _best(legacy_rerun, df_items, repeat)
+            t_b = _best(fast_rerun, df_items, repeat)
+            print(f"{n:>6}{name:>11}{t_a*1000:>11.3f}{t_b*1000:>9.3f}{t_a/t_b:>8.2f}x")
+
+if __name__ == "__main__":
+    main()
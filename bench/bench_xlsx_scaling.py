@@ -0,0 +1,54 @@
+# bench_xlsx_scaling.py — 行数を増やしたときの Excel 出力の時間とピークメモリ
+# pandas.to_excel（従来の estimate_xlsx_bytes）と、ストリーミング経路（xlsxwriter constant_memory /
+# openpyxl write_only）を比べる。時間とメモリは別々に計る（tracemalloc を掛けたままだと時間が膨らむため）。
+# 実行: python -m bench.bench_xlsx_scaling [--rows 1000 5000 20000 50000]
+
+import time
+import argparse
+import tracemalloc
+from io import BytesIO
+
+import pandas as pd
+
+from mitsumori.items import to_items, items_to_df
+from mitsumori.estimate import compute_totals
+from mitsumori.export import estimate_xlsx_bytes, estimate_xlsx_stream_bytes
+
+from bench.corpus_gen import base_items
+
+WRITERS = {
+    "to_excel": lambda df, meta: estimate_xlsx_bytes(df, meta),
+    "stream/xlsxwriter": lambda df, meta: estimate_xlsx_stream_bytes(df, meta, "xlsxwriter"),
+    "stream/openpyxl": lambda df, meta: estimate_xlsx_stream_bytes(df, meta, "openpyxl"),
+}
+
+def _peak_mb(fn, df, meta) -> float:
+    tracemalloc.start()
+    try:
+        fn(df, meta)
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[1000, 5000, 20000, 50000])
+    args = ap.parse_args(argv)
+
+    print(f"{'rows':>7}  {'writer':<18}{'sec':>8}{'rows/s':>10}{'peak MB':>9}{'xlsx KB':>9}")
+    for n in args.rows:
+        df, meta = compute_totals(items_to_df(to_items(base_items(n))), 30, 20)
+        ref = None
+        for name, fn in WRITERS.items():
+            t0 = time.perf_counter()
+            data = fn(df, meta)
+            sec = time.perf_counter() - t0
+            peak = _peak_mb(fn, df, meta)
+            got = pd.read_excel(BytesIO(data), header=None)
+            if ref is None:
+                ref = got
+            assert got.equals(ref), f"{name}: 出力が to_excel と一致しない（{n} 行）"
+            print(f"{n:>7}  {name:<18}{sec:>8.2f}{n / sec:>10,.0f}{peak:>9.1f}{len(data) / 1024:>9.0f}")
+
+if __name__ == "__main__":
+    main()
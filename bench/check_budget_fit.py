@@ -0,0 +1,79 @@
+# check_budget_fit.py — 予算寄せの正当性ハーネス
+# 倍率が [low, high] に張り付かないフィットでは、compute_totals 後の税抜合計と参考予算の差が
+# 動かせる行の最小刻み（単価 1 グリッドぶんの行金額の変化）未満に収まることを確かめる。
+# 実行: python -m bench.check_budget_fit [--cases 5000] [--seed 0]
+
+import sys
+import random
+import argparse
+
+import numpy as np
+
+from mitsumori.items import to_items
+from mitsumori.estimate import EstimateTable, rush_coeff, MGMT_CATEGORY
+from mitsumori.budget import fit_prices_table, line_amounts
+
+ROUND_TO = 1000
+QTYS = (0.25, 0.5, 1, 1.5, 2, 3, 4, 5, 6, 10)
+CATEGORIES = ("制作人件費", "企画", "撮影費", "出演関連費", "編集費・MA費", "諸経費")
+
+# レビューで見つかった取りこぼし：粗い行の丸めが行き過ぎ、細かい行が残差を吸収できなかった
+KNOWN = [
+    ("two_lines_rush", [("制作人件費", 0.25, 1000), ("制作人件費", 10, 481757)], 8, 3, 10_946_565),
+]
+
+def _table(lines) -> EstimateTable:
+    return EstimateTable.from_items(to_items(
+        [{"category": c, "task": f"{c}#{i}", "qty": q, "unit": "式", "unit_price": p}
+         for i, (c, q, p) in enumerate(lines)]))
+
+def _random_case(rnd: random.Random):
+    lines = [(rnd.choice(CATEGORIES), rnd.choice(QTYS), rnd.randrange(1_000, 600_000))
+             for _ in range(rnd.randint(1, 8))]
+    if rnd.random() < 0.3:
+        lines.append((MGMT_CATEGORY, 1, rnd.randrange(0, 300_000, 1_000)))
+    base_days = rnd.randint(3, 40)
+    target_days = rnd.randint(1, 40)
+    base = sum(q * p for _, q, p in lines)
+    return lines, base_days, target_days, int(base * rnd.uniform(0.5, 4.0))
+
+def miss(lines, base_days: int, target_days: int, target: int):
+    """(|誤差|, 最小刻み)。倍率が張り付いたフィットは None。"""
+    t = _table(lines)
+    out, info = fit_prices_table(t, base_days, target_days, target, round_to=ROUND_TO)
+    if info["clamped"]:
+        return None
+    accel = rush_coeff(base_days, target_days)
+    qty = np.asarray(out.qty, dtype=np.float64)
+    price = np.asarray(out.unit_price, dtype=np.float64)
+    free = np.array([c != MGMT_CATEGORY for c in out.category])
+    step = line_amounts(qty, price + ROUND_TO, accel) - line_amounts(qty, price, accel)
+    step = step[free & (step > 0)]
+    return abs(info["error"]), float(step.min())
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases", type=int, default=5000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    rnd = random.Random(args.seed)
+    cases = list(KNOWN) + [(f"random/{i}", *_random_case(rnd)) for i in range(args.cases)]
+    failures, checked = [], 0
+    for name, lines, base_days, target_days, target in cases:
+        r = miss(lines, base_days, target_days, target)
+        if r is None:
+            continue
+        checked += 1
+        err, step = r
+        if err >= step:
+            failures.append((name, err, step))
+
+    print(f"known: {len(KNOWN)} / random: {args.cases}（倍率の張り付きを除き {checked} 件を検査）")
+    for name, err, step in failures[:20]:
+        print(f"FAIL {name}: |誤差| {err:,.0f} 円 ≥ 最小刻み {step:,.0f} 円")
+    print(f"{checked - len(failures)}/{checked} passed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+# check_parse_corpus.py — パース経路の正当性ハーネス
+# コーパス（bench/corpus/<version>/manifest.json）と合成ミューテーションについて、
+# robust_parse_items_json → df_from_items_json を通って生き残る item を検証する。
+# 実行: python -m bench.check_parse_corpus [--cases 500] [--seed 0]
+
+import sys
+import argparse
+
+from mitsumori.parsing import robust_parse_items_json
+from mitsumori.items import df_from_items_json
+
+from bench.corpus_gen import CORPUS_VERSION, load_manifest, load_case_text, generate, long_response
+
+def survivors(raw: str):
+    df = df_from_items_json(robust_parse_items_json(raw))
+    return df["task"].tolist(), [int(x) for x in df["unit_price"].tolist()]
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases", type=int, default=500)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    failures = []
+
+    manifest = load_manifest()
+    for case in manifest["cases"]:
+        tasks, prices = survivors(load_case_text(case["file"]))
+        if tasks != case["expect_tasks"]:
+            failures.append((case["file"], case["expect_tasks"], tasks))
+        elif "expect_unit_prices" in case and prices != case["expect_unit_prices"]:
+            failures.append((case["file"], case["expect_unit_prices"], prices))
+    n_corpus = len(manifest["cases"])
+
+    for name, text, expect in generate(args.cases, seed=args.seed):
+        tasks, _ = survivors(text)
+        if tasks != expect:
+            failures.append((name, expect, tasks))
+
+    for style in ("json", "python", "fullwidth"):
+        text, expect = long_response(style=style)
+        tasks, _ = survivors(text)
+        if tasks != expect:
+            failures.append((f"long/{style}", expect, tasks))
+
+    total = n_corpus + args.cases + 3
+    print(f"corpus {CORPUS_VERSION}: {n_corpus} files / synthetic: {args.cases} / long: 3")
+    for name, expect, got in failures[:20]:
+        print(f"FAIL {name}\n  expect={expect[:8]}{'…' if len(expect) > 8 else ''}\n  got   ={got[:8]}{'…' if len(got) > 8 else ''}")
+    print(f"{total - len(failures)}/{total} passed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# corpus_gen.py — LLM 出力の壊れ方を模した合成ミューテーション生成器
+# 生成物は (名前, テキスト, 生き残るべき task のリスト) の組。seed 固定で再現可能。
+
+import os
+import json
+import random
+
+CORPUS_VERSION = "v1"
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus", CORPUS_VERSION)
+
+ROLES = [
+    ("制作人件費", "制作プロデューサー", "日"), ("制作人件費", "ディレクター", "日"),
+    ("企画", "企画構成費", "式"), ("撮影費", "カメラマン", "日"), ("撮影費", "照明スタッフ", "日"),
+    ("撮影費", "ヘアメイク", "日"), ("撮影費", "スタイリスト", "日"), ("出演関連費", "エキストラ", "人"),
+    ("編集費・MA費", "オフライン編集", "日"), ("編集費・MA費", "MA", "式"), ("諸経費", "交通費", "式"),
+]
+
+def load_manifest() -> dict:
+    with open(os.path.join(CORPUS_DIR, "manifest.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+def load_case_text(file: str) -> str:
+    with open(os.path.join(CORPUS_DIR, file), encoding="utf-8") as f:
+        return f.read()
+
+def base_items(n: int, seed: int = 0, note_len: int = 1) -> list:
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        cat, role, unit = ROLES[i % len(ROLES)]
+        out.append({
+            "category": cat,
+            "task": f"{role}#{i}",
+            "qty": rnd.randint(1, 6),
+            "unit": unit,
+            "unit_price": rnd.randrange(10_000, 400_000, 1_000),
+            "note": "、".join(["撮影立会い含む"] * rnd.randint(0, note_len)),
+        })
+    return out
+
+# ---------- 1 item の直列化（形式ごと） ----------
+def _item_json(x: dict) -> str:
+    return json.dumps(x, ensure_ascii=False)
+
+def _item_python(x: dict) -> str:
+    return repr({**x, "confirmed": True, "memo": None})
+
+def _item_fullwidth(x: dict) -> str:
+    price = f"{x['unit_price']:,}".translate(str.maketrans("0123456789,", "０１２３４５６７８９，"))
+    return (f"｛“category”：“{x['category']}”，“task”：“{x['task']}”，“qty”：{x['qty']}，"
+            f"“unit”：“{x['unit']}”，“unit_price”：“{price}円”，“note”：“{x['note']}”｝")
+
+def _item_trailing(x: dict) -> str:
+    return _item_json(x)[:-1] + ",}"
+
+ITEM_STYLES = {
+    "json": (_item_json, ", ", ""),
+    "python": (_item_python, ", ", ""),
+    "fullwidth": (_item_fullwidth, "，\n", ""),
+    "trailing_commas": (_item_trailing, ",\n", ","),
+}
+
+WRAPPERS = {
+    "items": ('{"items": [', "]}"),
+    "result": ('{"result": {"items": [', '], "currency": "JPY"}}'),
+    "data": ('{"data": [', "]}"),
+    "root_array": ("[", "]"),
+}
+
+DECORATIONS = {
+    "none": ("", ""),
+    "fence": ("```json\n", "\n```"),
+    "prose": ("以下が見積もりJSONです。\n", "\n以上です。ご確認ください。"),
+}
+
+def render(items: list, style: str = "json", wrapper: str = "items", decoration: str = "none"):
+    """items を指定形式で文字列化し、(テキスト, 各 item の終端オフセット) を返す。"""
+    fn, sep, tail = ITEM_STYLES[style]
+    head, foot = WRAPPERS[wrapper]
+    pre, post = DECORATIONS[decoration]
+    if style == "python":
+        head = head.replace('"', "'")
+        foot = foot.replace('"', "'")
+    parts = [pre, head]
+    pos = len(pre) + len(head)
+    ends = []
+    for i, x in enumerate(items):
+        if i:
+            parts.append(sep)
+            pos += len(sep)
+        s = fn(x)
+        parts.append(s)
+        pos += len(s)
+        ends.append(pos)
+    parts.extend([tail, foot, post])
+    return "".join(parts), ends
+
+def mutate(items: list, rnd: random.Random):
+    """形式・ラッパー・装飾・途中切れをランダムに組み合わせた 1 ケースを作る。"""
+    style = rnd.choice(list(ITEM_STYLES))
+    wrapper = rnd.choice(list(WRAPPERS))
+    decoration = rnd.choice(list(DECORATIONS))
+    text, ends = render(items, style, wrapper, decoration)
+    name = f"{style}/{wrapper}/{decoration}"
+    expect = [x["task"] for x in items]
+    if rnd.random() < 0.4 and ends:
+        # max_output_tokens 到達を模して途中で切る（装飾の後ろも当然消える）
+        cut = rnd.randint(ends[0] - 5, len(text) - len(DECORATIONS[decoration][1]) - 1)
+        text = text[:cut]
+        expect = [x["task"] for x, e in zip(items, ends) if e <= cut]
+        name += f"/truncated@{cut}"
+    return name, text, expect
+
+def generate(n_cases: int = 200, seed: int = 0, n_items: int = 12):
+    rnd = random.Random(seed)
+    for i in range(n_cases):
+        items = base_items(rnd.randint(1, n_items), seed=seed * 100_000 + i)
+        yield mutate(items, rnd)
+
+def long_response(n_items: int = 160, seed: int = 0, style: str = "json"):
+    """gpt-4.1 の max_tokens=8000 近辺に相当する長大レスポンス（note 長め）。"""
+    items = base_items(n_items, seed=seed, note_len=3)
+    text, _ = render(items, style, "items", "none")
+    return text, [x["task"] for x in items]
@@ -0,0 +1,77 @@
+# template_gen.py — DD見積書テンプレ（事前拡張・行挿入なし）を模した合成 xlsx
+# 明細 1 行目 B19 に {{ITEMS_START}}、明細枠の W 列に =O*S、枠の直下に =SUM(W..) の小計行。
+# 明細行は B:N / O:P / Q:R / S:V / W:Z を結合し罫線付き。style_heavy=True では塗り・フォントを行ごとに変え、
+# 別シートに大きな参照表（約款・単価一覧）を持たせて、読み込み・保存の重い社内テンプレに寄せる。
+
+from io import BytesIO
+
+from openpyxl import Workbook
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+START_ROW = 19
+
+def make_dd_template(capacity: int = 53, style_heavy: bool = False, ref_rows: int = 3000) -> bytes:
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "御見積書"
+    thin = Side(style="thin", color="808080")
+    box = Border(left=thin, right=thin, top=thin, bottom=thin)
+
+    ws.merge_cells("B2:Z3")
+    ws["B2"] = "御 見 積 書"
+    ws["B2"].font = Font(size=20, bold=True)
+    ws["B2"].alignment = Alignment(horizontal="center", vertical="center")
+    for r, label in enumerate(["件名", "納期", "納品場所", "有効期限", "お支払条件"], start=6):
+        ws.merge_cells(start_row=r, start_column=2, end_row=r, end_column=6)
+        ws.merge_cells(start_row=r, start_column=7, end_row=r, end_column=18)
+        ws.cell(row=r, column=2, value=label).border = box
+    ws.merge_cells("B18:N18")
+    for col, head in (("B", "項目"), ("O", "数量"), ("Q", "単位"), ("S", "単価"), ("W", "金額")):
+        ws[f"{col}18"] = head
+        ws[f"{col}18"].font = Font(bold=True)
+    for a, b in (("O", "P"), ("Q", "R"), ("S", "V"), ("W", "Z")):
+        ws.merge_cells(f"{a}18:{b}18")
+
+    sub_row = START_ROW + capacity
+    for r in range(START_ROW, sub_row):
+        for a, b in (("B", "N"), ("O", "P"), ("Q", "R"), ("S", "V"), ("W", "Z")):
+            ws.merge_cells(f"{a}{r}:{b}{r}")
+        for c in range(2, 27):
+            cell = ws.cell(row=r, column=c)
+            cell.border = box
+            if style_heavy:
+                cell.fill = PatternFill("solid", fgColor=("F2F2F2" if r % 2 else "FFFFFF"))
+                cell.font = Font(name="Meiryo UI", size=9 + (c % 3), color=f"{(r * 7919 + c) % 0xFFFFFF:06X}")
+        ws[f"W{r}"] = f"=O{r}*S{r}"
+        ws[f"W{r}"].number_format = "#,##0"
+    ws[f"B{START_ROW}"] = "{{ITEMS_START}}"
+
+    ws.merge_cells(f"S{sub_row}:V{sub_row}")
+    ws[f"S{sub_row}"] = "小計"
+    ws.merge_cells(f"W{sub_row}:Z{sub_row}")
+    ws[f"W{sub_row}"] = f"=SUM(W{START_ROW}:W{sub_row - 1})"
+    ws[f"S{sub_row + 1}"] = "消費税"
+    ws[f"W{sub_row + 1}"] = f"=ROUND(W{sub_row}*0.1,0)"
+    ws[f"S{sub_row + 2}"] = "合計"
+    ws[f"W{sub_row + 2}"] = f"=W{sub_row}+W{sub_row + 1}"
+    for r in range(sub_row, sub_row + 3):
+        ws[f"W{r}"].number_format = "#,##0"
+    for c in "BCDEFGHIJKLMNOPQRSTUVWXYZ":
+        ws.column_dimensions[c].width = 3.5
+
+    if style_heavy:
+        ref = wb.create_sheet("単価一覧")
+        for r in range(1, ref_rows + 1):
+            ref.append([f"区分{r % 40}", f"項目{r}", r * 1000, "日", f"備考テキスト {r} " * 3])
+            if r % 5 == 0:
+                for c in range(1, 6):
+                    ref.cell(row=r, column=c).fill = PatternFill("solid", fgColor="DDEBF7")
+        terms = wb.create_sheet("約款")
+        for r in range(1, ref_rows // 3 + 1):
+            terms.merge_cells(start_row=r, start_column=1, end_row=r, end_column=10)
+            terms.cell(row=r, column=1, value=f"第{r}条 本見積の条件に関する定め（サンプル文言）").alignment = \
+                Alignment(wrap_text=True)
+
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
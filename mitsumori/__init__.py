@@ -0,0 +1,2 @@
+# mitsumori — 見積エージェント共通ロジック（Streamlit 非依存）
+# movie_app / movietest_app / ssstest_app から import して使う。
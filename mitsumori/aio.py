@@ -0,0 +1,55 @@
+# ---------- 共有イベントループ（LLM の非同期呼び出し） ----------
+# LLM の SDK 呼び出し（AsyncOpenAI / Gemini の generate_content_async。どちらも下は httpx.AsyncClient 等の非同期 I/O）は、
+# プロセスに 1 本だけ立てるバックグラウンドスレッドのイベントループで待つ。
+# Streamlit のスクリプト（セッションごとのスレッド）は submit() / run() でコルーチンを投げ、結果だけを受け取る。
+# 応答待ちの HTTP はこのループ 1 本に集まるので、価格レンジのサンプルなど並行呼び出しのたびにスレッドを立てない。
+# コルーチンはループのスレッドで動くため st.* には触らないこと（値を返してスクリプト側で書く）。
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+HTTP_TIMEOUT_S = 60.0
+
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_openai_client = None
+
+def shared_loop() -> asyncio.AbstractEventLoop:
+    """共有ループ（初回に daemon スレッドで起動）。"""
+    global _loop
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="mitsumori-aio", daemon=True).start()
+            _loop = loop
+        return _loop
+
+def submit(coro: Awaitable[T]) -> "Future[T]":
+    """コルーチンを共有ループに投げる。戻り値は concurrent.futures.Future（.result() で待てる）。"""
+    return asyncio.run_coroutine_threadsafe(coro, shared_loop())
+
+def run(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """コルーチンを共有ループで実行し、呼び出し元のスレッドで結果を待つ（例外はそのまま上がる）。"""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is not None and running is _loop:
+        coro.close()
+        raise RuntimeError("共有ループの上から aio.run() は呼べません（await してください）")
+    return submit(coro).result(timeout)
+
+def openai_client():
+    """共有ループで使う AsyncOpenAI（httpx.AsyncClient の接続プールをプロセスで使い回す）。
+    鍵・組織は OpenAI と同じく環境変数（OPENAI_API_KEY / OPENAI_ORG_ID）から読む。"""
+    global _openai_client
+    with _lock:
+        if _openai_client is None:
+            import httpx
+            from openai import AsyncOpenAI
+            _openai_client = AsyncOpenAI(http_client=httpx.AsyncClient(timeout=HTTP_TIMEOUT_S))
+        return _openai_client
@@ -0,0 +1,207 @@
+# ---------- 単価の外れ値検出 ----------
+# 過去の見積（分析用 Parquet）と単価表から (項目, 単位) ごとの単価分布を先に集計しておき、
+# 見積の各行を NumPy でまとめて採点する。判定は対数単価の z 値と IQR フェンス（どちらかで外れたら警告）。
+# 管理費は分布ではなく上限（MGMT_FEE_CAP_RATE）との比較で見る。
+# 集計済みの統計を引くだけなので、40 行程度の見積なら採点は 1 ms 未満。
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from mitsumori.items import Item, items_to_json
+from mitsumori.estimate import MGMT_CATEGORY, MGMT_FEE_CAP_RATE
+from mitsumori.ratecard import RateCard, normalize_key
+
+Z_MAX = 3.0            # |z| がこれを超えたら外れ値
+IQR_K = 1.5            # Q1 - k*IQR 〜 Q3 + k*IQR の外なら外れ値
+MIN_SAMPLES = 5        # z 値・分位を使うのに必要な過去の件数
+MIN_LOG_SPREAD = np.log10(1.25)  # 分布が狭すぎて数％の差で警告が出ないよう、IQR（対数）の下限を設ける
+
+class PriceStats:
+    """
+    (正規化した項目名, 単位) → 単価分布の要約。値は対数（log10）単価で持つ。
+    配列: n, mu, sigma, q1, q3, median（median だけは円。単価表由来は標準単価）。sigma が NaN の行は IQR 判定のみ。
+    """
+    __slots__ = ("index", "n", "mu", "sigma", "q1", "q3", "median", "source")
+
+    def __init__(self, keys: Sequence[Tuple[str, str]], n, mu, sigma, q1, q3, median, source: Sequence[str]):
+        self.index: Dict[Tuple[str, str], int] = {k: i for i, k in enumerate(keys)}
+        self.n = np.asarray(n, dtype=np.int64)
+        self.mu = np.asarray(mu, dtype=np.float64)
+        self.sigma = np.asarray(sigma, dtype=np.float64)
+        self.q1 = np.asarray(q1, dtype=np.float64)
+        self.q3 = np.asarray(q3, dtype=np.float64)
+        self.median = np.asarray(median, dtype=np.float64)
+        self.source = list(source)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @classmethod
+    def empty(cls) -> "PriceStats":
+        return cls([], [], [], [], [], [], [], [])
+
+    @classmethod
+    def from_lines(cls, df: pd.DataFrame, min_samples: int = MIN_SAMPLES) -> "PriceStats":
+        """過去明細（task / unit / unit_price 列。mitsumori.columnar.query の戻り値など）から集計する。"""
+        if df.empty:
+            return cls.empty()
+        d = pd.DataFrame({
+            "t": [normalize_key(x) for x in df["task"]],
+            "u": [normalize_key(x) for x in df["unit"]],
+            "lp": np.log10(df["unit_price"].to_numpy(dtype=np.float64).clip(min=1.0)),
+            "p": df["unit_price"].to_numpy(dtype=np.float64),
+            "cat": df["category"].to_numpy(),
+        })
+        d = d[(d["p"] > 0) & (d["cat"] != MGMT_CATEGORY)]
+        g = d.groupby(["t", "u"], sort=False)
+        agg = g["lp"].agg(["size", "mean", "std"])
+        agg["q1"] = g["lp"].quantile(0.25)
+        agg["q3"] = g["lp"].quantile(0.75)
+        agg["median"] = g["p"].median()
+        agg = agg[agg["size"] >= min_samples]
+        return cls(list(agg.index), agg["size"], agg["mean"], agg["std"].fillna(0.0),
+                   agg["q1"], agg["q3"], agg["median"], ["過去見積"] * len(agg))
+
+    @classmethod
+    def from_rate_card(cls, card: RateCard) -> "PriceStats":
+        """単価表の下限・上限を Q1・Q3 とみなす（z 値は使わない）。別名でも引けるよう別名ごとに持つ。"""
+        rows = card.conn.execute(
+            "SELECT a.alias, a.unit, r.min_price, r.typical_price, r.max_price "
+            "FROM rate_aliases a JOIN rates r ON r.id = a.rate_id"
+        ).fetchall()
+        keys, q1, q3, med, seen = [], [], [], [], set()
+        for alias, unit, lo, typ, hi in rows:
+            if (alias, unit) in seen:
+                continue
+            seen.add((alias, unit))
+            keys.append((alias, unit))
+            q1.append(np.log10(max(lo or typ, 1)))
+            q3.append(np.log10(max(hi or typ, 1)))
+            med.append(typ)
+        n = len(keys)
+        return cls(keys, [0] * n, [np.nan] * n, [np.nan] * n, q1, q3, med, ["単価表"] * n)
+
+    def merged(self, fallback: "PriceStats") -> "PriceStats":
+        """self に無いキーだけ fallback から補う（過去見積を優先し、単価表で穴を埋める用途）。"""
+        extra = [(k, i) for k, i in fallback.index.items() if k not in self.index]
+        idx = np.array([i for _, i in extra], dtype=np.int64)
+        return PriceStats(
+            list(self.index) + [k for k, _ in extra],
+            np.concatenate([self.n, fallback.n[idx]]),
+            np.concatenate([self.mu, fallback.mu[idx]]),
+            np.concatenate([self.sigma, fallback.sigma[idx]]),
+            np.concatenate([self.q1, fallback.q1[idx]]),
+            np.concatenate([self.q3, fallback.q3[idx]]),
+            np.concatenate([self.median, fallback.median[idx]]),
+            self.source + [fallback.source[i] for i in idx],
+        )
+
+# =========================
+# 採点
+# =========================
+def score_lines(category: Sequence[str], task: Sequence[str], unit: Sequence[str],
+                qty: Sequence[float], unit_price: Sequence[int], stats: PriceStats,
+                accel: float = 1.0) -> dict:
+    """
+    戻り値: {"flagged": 外れ値の行番号, "reasons": 行ごとの理由（問題なしは ""）,
+             "z": 対数単価の z 値（統計が無い行は NaN）, "checked": 分布と照合できた行数}
+    accel は短納期係数。管理費の上限判定で compute_totals と同じ小計を使うために渡す。
+    """
+    n = len(task)
+    price = np.asarray(unit_price, dtype=np.float64)
+    q = np.asarray(qty, dtype=np.float64)
+    is_mgmt = np.fromiter((c == MGMT_CATEGORY for c in category), dtype=bool, count=n)
+    idx = np.fromiter((stats.index.get((normalize_key(t), normalize_key(u)), -1) for t, u in zip(task, unit)),
+                      dtype=np.int64, count=n)
+    idx[is_mgmt] = -1
+    known = idx >= 0
+    j = np.where(known, idx, 0)
+
+    z = np.full(n, np.nan)
+    lo_out = np.zeros(n, dtype=bool)
+    hi_out = np.zeros(n, dtype=bool)
+    if len(stats):
+        lp = np.log10(price.clip(min=1.0))
+        mu, sigma, q1, q3 = stats.mu[j], stats.sigma[j], stats.q1[j], stats.q3[j]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = np.where(known & (sigma > 0) & (stats.n[j] >= MIN_SAMPLES), (lp - mu) / sigma, np.nan)
+        spread = np.maximum(q3 - q1, MIN_LOG_SPREAD)
+        zf = np.nan_to_num(z)
+        lo_out = known & (price > 0) & ((lp < q1 - IQR_K * spread) | (zf < -Z_MAX))
+        hi_out = known & ((lp > q3 + IQR_K * spread) | (zf > Z_MAX))
+    zero = ~is_mgmt & (price <= 0)
+
+    # 管理費：LLM が出した額の合計が上限（短納期係数込みの小計 × 上限率）を超えていないか
+    amounts = np.rint(q * price)
+    sub = np.rint(np.rint(amounts[~is_mgmt]) * accel).sum()
+    mgmt_total = amounts[is_mgmt].sum()
+    cap = round(sub * MGMT_FEE_CAP_RATE)
+    mgmt_over = is_mgmt & (mgmt_total > cap)
+
+    reasons = [""] * n
+    for i in np.flatnonzero(lo_out | hi_out | zero | mgmt_over):
+        if zero[i]:
+            reasons[i] = "単価が 0 円"
+        elif mgmt_over[i]:
+            reasons[i] = f"管理費 {int(mgmt_total):,} 円が上限 {int(cap):,} 円を超過（上限に補正）"
+        else:
+            k = idx[i]
+            where = "低すぎ" if lo_out[i] else "高すぎ"
+            reasons[i] = f"単価{where}（{stats.source[k]}の目安 {int(stats.median[k]):,} 円）"
+    return {
+        "flagged": [i for i, r in enumerate(reasons) if r],
+        "reasons": reasons,
+        "z": z,
+        "checked": int(known.sum()),
+    }
+
+def score_items(items: List[Item], stats: PriceStats, accel: float = 1.0) -> dict:
+    return score_lines([x.category for x in items], [x.task for x in items], [x.unit for x in items],
+                       [x.qty for x in items], [x.unit_price for x in items], stats, accel)
+
+def score_df(df: pd.DataFrame, stats: PriceStats, accel: float = 1.0) -> dict:
+    """df_from_items_json / items_to_df の出力をそのまま採点する。"""
+    return score_lines(df["category"].tolist(), df["task"].tolist(), df["unit"].tolist(),
+                       df["qty"].tolist(), df["unit_price"].tolist(), stats, accel)
+
+def load_price_stats(card: Optional[RateCard] = None, lines: Optional[pd.DataFrame] = None) -> PriceStats:
+    """過去明細の統計を優先し、足りない項目は単価表の範囲で補う。どちらも無ければ空。"""
+    stats = PriceStats.from_lines(lines) if lines is not None else PriceStats.empty()
+    if card is not None:
+        stats = stats.merged(PriceStats.from_rate_card(card))
+    return stats
+
+# =========================
+# 外れ値の行だけ再見積
+# =========================
+def reprice_targets(items: List[Item], result: dict) -> List[int]:
+    # 管理費は compute_totals が上限で補正するので、LLM に聞き直すのは単価の外れ値だけ
+    return [i for i in result["flagged"] if items[i].category != MGMT_CATEGORY]
+
+def reprice_prompt(items: List[Item], result: dict) -> str:
+    """外れ値の行だけを入力にした再見積プロンプト（各アプリが STRICT_JSON_HEADER を前に付けて投げる）。"""
+    targets = reprice_targets(items, result)
+    lines = "\n".join(f"- {items[i].task}（{items[i].unit}）: {result['reasons'][i]}" for i in targets)
+    return f"""次の見積行は、過去の見積の単価分布から外れています。
+日本の広告映像制作の相場として妥当な unit_price を付け直してください。
+category / task / qty / unit は変えず、入力と同じ行を同じ順で返してください。
+【外れた理由】
+{lines}
+【入力JSON】
+{items_to_json([items[i] for i in targets])}
+"""
+
+def merge_repriced(items: List[Item], result: dict, repriced: List[Item]) -> List[Item]:
+    """再見積の単価だけを元の行に戻す。task 名で対応を取り、取れなければ順番で合わせる。"""
+    targets = reprice_targets(items, result)
+    by_task = {normalize_key(r.task): r for r in repriced}
+    same_len = len(repriced) == len(targets)
+    out = list(items)
+    for pos, i in enumerate(targets):
+        x = items[i]
+        r = by_task.get(normalize_key(x.task)) or (repriced[pos] if same_len else None)
+        if r is not None and r.unit_price > 0:
+            out[i] = Item(x.category, x.task, x.qty, x.unit, r.unit_price, x.note)
+    return out
@@ -0,0 +1,303 @@
+# ---------- 見積 HTTP API（Streamlit なし） ----------
+# mitsumori/service.py のパイプラインを非同期 HTTP で出す（tornado。Streamlit の依存に含まれているので追加不要）。
+#   POST /v1/estimates  案件条件 → LLM で明細生成 → 計算。JSON / xlsx / DD見積書テンプレ xlsx で返す
+#   POST /v1/totals     明細 → 計算のみ（LLM なし）
+#   GET  /healthz       実行中・待ちの件数
+# LLM を呼ぶ見積は同時実行数（MITSUMORI_API_CONCURRENCY）までイベントループ上で await し（run_estimate_async。
+# 応答待ちにスレッドは使わない）、待ち（MITSUMORI_API_QUEUE）が埋まっていれば 503 を返す。xlsx 出力だけスレッドで作る。
+# リクエスト ID は X-Request-ID を引き継ぐか新しく振り、応答ヘッダ・JSON・アクセスログに載せる。
+# 起動: python -m mitsumori.api --port 8600
+
+import os
+import re
+import sys
+import json
+import uuid
+import base64
+import asyncio
+import logging
+import argparse
+import threading
+from datetime import date
+from dataclasses import fields
+from urllib.parse import quote
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import tornado.web
+
+from mitsumori.case import CaseSpec
+from mitsumori.export import XLSX_MIME, estimate_xlsx
+from mitsumori.items import to_items
+from mitsumori.ratecard import MODE_CLAMP, MODE_FILL, MODE_REPLACE, RateCard
+from mitsumori.service import (
+    DEFAULT_MODELS, PROVIDER_OPENAI, EstimateOptions, LLMProvider, ProviderError, estimate_lines, finalize_items, make_provider,
+    result_to_dict, run_estimate_async, target_days_for,
+)
+from mitsumori.template import OVERFLOW_MAX_PAGES, TemplateError, template_xlsx
+
+API_CONCURRENCY = int(os.getenv("MITSUMORI_API_CONCURRENCY", "32"))
+API_QUEUE = int(os.getenv("MITSUMORI_API_QUEUE", "16"))
+API_PROVIDER = os.getenv("MITSUMORI_API_PROVIDER", PROVIDER_OPENAI)
+# 要求で指定できるモデル（カンマ区切り）。プロバイダはモデルごとに作って持ち続けるので、任意の名前は受けない
+API_MODELS = tuple(m.strip() for m in os.getenv("MITSUMORI_API_MODELS", ",".join(DEFAULT_MODELS.values())).split(",")
+                   if m.strip())
+MAX_BODY_BYTES = 20 * 1024 * 1024   # テンプレ xlsx（base64）を含む
+RETRY_AFTER_S = 5
+EXPORT_WORKERS = 4   # xlsx / DD見積書テンプレ出力のスレッド数
+
+RATE_CARD_MODES = (MODE_FILL, MODE_CLAMP, MODE_REPLACE)
+FORMATS = ("json", "xlsx", "dd_template")
+
+log = logging.getLogger("mitsumori.api")
+
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+class Busy(Exception):
+    """同時実行数・待ち行列とも埋まっている。"""
+
+class Limiter:
+    """同時実行数 concurrency、待ちは queue 件まで。それを超える要求は Busy。"""
+
+    def __init__(self, concurrency: int, queue: int):
+        self.concurrency, self.queue = concurrency, queue
+        self.running = self.waiting = 0
+        self._sem = asyncio.Semaphore(concurrency)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.running >= self.concurrency and self.waiting >= self.queue:
+            raise Busy()
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._sem.release()
+
+class _Handler(tornado.web.RequestHandler):
+    def prepare(self):
+        rid = self.request.headers.get("X-Request-ID", "")
+        self.request_id = rid if _REQUEST_ID.match(rid) else uuid.uuid4().hex
+        self.set_header("X-Request-ID", self.request_id)
+
+    def body_json(self) -> dict:
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, "リクエスト本文が JSON ではありません")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, "リクエスト本文は JSON オブジェクトにしてください")
+        return body
+
+    def send_json(self, payload: dict, status: int = 200):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(json.dumps({"request_id": self.request_id, **payload}, ensure_ascii=False,
+                               default=lambda v: v.item() if hasattr(v, "item") else str(v)))
+
+    def send_xlsx(self, data: bytes, filename: str):
+        self.set_header("Content-Type", XLSX_MIME)
+        self.set_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(filename)}")
+        self.finish(data)
+
+    def write_error(self, status_code: int, **kwargs):
+        exc = kwargs.get("exc_info", (None, None, None))[1]
+        msg = exc.log_message if isinstance(exc, tornado.web.HTTPError) and exc.log_message else self._reason
+        self.send_json({"error": msg}, status_code)
+
+    async def run_blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.application.pool, fn, *args)
+
+    async def respond(self, body: dict, payload: dict, df_calc, meta: dict):
+        fmt = body.get("format", "json")
+        if fmt == "json":
+            return self.send_json(payload)
+        if fmt == "xlsx":
+            return self.send_xlsx(await self.run_blocking(estimate_xlsx, df_calc, meta), "見積もり.xlsx")
+        try:
+            template = base64.b64decode(body.get("template_b64") or "", validate=True)
+        except ValueError:
+            raise tornado.web.HTTPError(400, "template_b64 が base64 ではありません")
+        if not template:
+            raise tornado.web.HTTPError(400, "format=dd_template には template_b64（DD見積書テンプレ xlsx）が必要です")
+        max_pages = _int_field(body, "max_pages", OVERFLOW_MAX_PAGES, minimum=1)
+        try:
+            res = await self.run_blocking(lambda: template_xlsx(template, df_calc, meta, max_pages=max_pages))
+        except TemplateError as e:
+            raise tornado.web.HTTPError(422, str(e))
+        self.set_header("X-Template-Pages", str(res.pages))
+        self.set_header("X-Template-Dropped", str(res.dropped))
+        self.send_xlsx(res.data, "見積もり_DDテンプレ.xlsx")
+
+def _int_field(d: dict, key: str, default=None, minimum: Optional[int] = None, where: str = ""):
+    v = d.get(key)
+    if v is None:
+        return default
+    if isinstance(v, bool) or not isinstance(v, (int, float, str)):
+        raise tornado.web.HTTPError(400, f"{where}{key} は整数にしてください")
+    try:
+        n = int(v) if not isinstance(v, float) or v.is_integer() else None
+    except ValueError:
+        n = None
+    if n is None:
+        raise tornado.web.HTTPError(400, f"{where}{key} は整数にしてください")
+    if minimum is not None and n < minimum:
+        raise tornado.web.HTTPError(400, f"{where}{key} は {minimum} 以上にしてください")
+    return n
+
+def _case(d) -> CaseSpec:
+    """CaseSpec の項目を型どおりに検証・変換する（LLM を呼ぶ前に 400 で返すため）。未知のキーは捨てる。"""
+    if d is None:
+        d = {}
+    if not isinstance(d, dict):
+        raise tornado.web.HTTPError(400, "case は JSON オブジェクトにしてください")
+    out = {}
+    for f in fields(CaseSpec):
+        v = d.get(f.name)
+        if v is None:
+            continue
+        if f.type is int:
+            out[f.name] = _int_field(d, f.name, minimum=0, where="case.")
+        elif f.type is bool:
+            if not isinstance(v, bool):
+                raise tornado.web.HTTPError(400, f"case.{f.name} は true / false にしてください")
+            out[f.name] = v
+        elif f.type is str:
+            if isinstance(v, bool) or not isinstance(v, (str, int, float)):
+                raise tornado.web.HTTPError(400, f"case.{f.name} は文字列にしてください")
+            out[f.name] = str(v)
+        else:  # List[str]
+            if not isinstance(v, list) or any(isinstance(x, (dict, list)) for x in v):
+                raise tornado.web.HTTPError(400, f"case.{f.name} は文字列の配列にしてください")
+            out[f.name] = [str(x) for x in v if x is not None]
+    if out.get("delivery_date"):
+        try:
+            date.fromisoformat(out["delivery_date"])
+        except ValueError:
+            raise tornado.web.HTTPError(400, "case.delivery_date は YYYY-MM-DD にしてください")
+    return CaseSpec(**out)
+
+def _options(body: dict, rate_card: Optional[RateCard]) -> Tuple[CaseSpec, EstimateOptions]:
+    """要求本文を検証して (案件条件, オプション) にする。target_days もここで決めておく（LLM の後で失敗しないように）。"""
+    if body.get("format", "json") not in FORMATS:
+        raise tornado.web.HTTPError(400, f"format は {' / '.join(FORMATS)} のいずれかです")
+    mode = body.get("rate_card_mode")
+    if mode is not None and mode not in RATE_CARD_MODES:
+        raise tornado.web.HTTPError(400, f"rate_card_mode は {' / '.join(RATE_CARD_MODES)} のいずれかです")
+    if mode is not None and rate_card is None:
+        raise tornado.web.HTTPError(400, "単価表が開かれていません（--rate-card で起動してください）")
+    _int_field(body, "max_pages", minimum=1)
+    case = _case(body.get("case"))
+    target_days = _int_field(body, "target_days")
+    options = EstimateOptions(normalize=bool(body.get("normalize", True)),
+                              infer_from_notes=bool(body.get("infer_from_notes", True)),
+                              rate_card_mode=mode,
+                              target_days=target_days if target_days is not None else target_days_for(case))
+    return case, options
+
+class EstimateHandler(_Handler):
+    async def post(self):
+        body = self.body_json()
+        case, options = _options(body, self.application.rate_card)
+        app = self.application
+        try:
+            provider = app.provider(body.get("provider") or API_PROVIDER, body.get("model"))
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, str(e))
+        try:
+            async with app.limiter.slot():
+                result = await run_estimate_async(case, provider, options, app.rate_card)
+        except Busy:
+            self.set_header("Retry-After", str(RETRY_AFTER_S))
+            raise tornado.web.HTTPError(503, "混み合っています。しばらくしてから再試行してください")
+        except ProviderError as e:
+            log.warning("%s LLM call failed: %s", self.request_id, e)
+            raise tornado.web.HTTPError(502, f"LLM 呼び出しに失敗しました: {type(e.__cause__).__name__}")
+        await self.respond(body, result_to_dict(result), result.df, result.meta)
+
+class TotalsHandler(_Handler):
+    async def post(self):
+        body = self.body_json()
+        case, options = _options(body, self.application.rate_card)
+        if not isinstance(body.get("items"), list):
+            raise tornado.web.HTTPError(400, "items（明細の配列）が必要です")
+        # pandas と予算寄せはイベントループを止めないようスレッドで（実行中の見積の応答待ちを遅らせない）
+        _, df_calc, meta, report = await self.run_blocking(
+            finalize_items, to_items(body["items"]), case, options.target_days,
+            self.application.rate_card, options.rate_card_mode)
+        await self.respond(body, {"lines": estimate_lines(df_calc), "meta": meta, "rate_card": report},
+                           df_calc, meta)
+
+class HealthHandler(_Handler):
+    def get(self):
+        lim = self.application.limiter
+        self.send_json({"ok": True, "running": lim.running, "waiting": lim.waiting,
+                        "concurrency": lim.concurrency, "queue": lim.queue})
+
+def _log_request(handler: tornado.web.RequestHandler):
+    log.info("%s %d %s %s %.0fms", getattr(handler, "request_id", "-"), handler.get_status(),
+             handler.request.method, handler.request.uri, 1000.0 * handler.request.request_time())
+
+class EstimateAPI(tornado.web.Application):
+    def __init__(self, concurrency: int = API_CONCURRENCY, queue: int = API_QUEUE,
+                 rate_card: Optional[RateCard] = None,
+                 provider_factory: Callable[[str, Optional[str]], LLMProvider] = make_provider,
+                 models: Iterable[str] = API_MODELS):
+        super().__init__([
+            (r"/v1/estimates", EstimateHandler),
+            (r"/v1/totals", TotalsHandler),
+            (r"/healthz", HealthHandler),
+        ], log_function=_log_request)
+        self.limiter = Limiter(concurrency, queue)
+        self.pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+        self.rate_card = rate_card
+        self._factory = provider_factory
+        self._providers: Dict[Tuple[str, Optional[str]], LLMProvider] = {}
+        self._providers_lock = threading.Lock()
+        self.models = frozenset(models)
+
+    def provider(self, name: str, model: Optional[str] = None) -> LLMProvider:
+        # SDK クライアント（接続プール）はプロバイダ・モデルごとに 1 つを使い回す（このサーバのイベントループ専用）。
+        # 使い回す数が要求次第で増えないよう、モデルは許可したものだけ（省略はプロバイダの既定）
+        if model is not None and (not isinstance(model, str) or model not in self.models):
+            raise ValueError(f"model は {' / '.join(sorted(self.models))} のいずれかです（MITSUMORI_API_MODELS）")
+        with self._providers_lock:
+            p = self._providers.get((name, model))
+            if p is None:
+                p = self._providers[(name, model)] = self._factory(name, model)
+            return p
+
+async def serve(host: str, port: int, **kwargs):
+    app = EstimateAPI(**kwargs)
+    app.listen(port, host, max_body_size=MAX_BODY_BYTES)
+    log.info("listening on http://%s:%d", host, port)
+    await asyncio.Event().wait()
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m mitsumori.api", description="見積 HTTP API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8600)
+    ap.add_argument("--concurrency", type=int, default=API_CONCURRENCY, help="LLM を呼ぶ見積の同時実行数")
+    ap.add_argument("--queue", type=int, default=API_QUEUE, help="同時実行数を超えたときに待たせる件数")
+    ap.add_argument("--rate-card", action="store_true", help="単価表（mitsumori/ratecard.py）を開いて rate_card_mode を使えるようにする")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    rate_card = None
+    if args.rate_card:
+        from mitsumori.ratecard import open_rate_card
+        rate_card = open_rate_card()
+    try:
+        asyncio.run(serve(args.host, args.port, concurrency=args.concurrency, queue=args.queue, rate_card=rate_card))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+# ---------- 見積アーカイブ（ローカル SQLite + FTS5） ----------
+# 確定した見積（CaseSpec・items・meta・モデル情報）を保存し、項目名／備考の全文検索と
+# カテゴリ・合計額での絞り込みで引けるようにする。複製は保存済み items から再計算するだけで LLM は呼ばない。
+# 全文索引は trigram トークナイザ（日本語は分かち書きがないため）。2 文字以下の語は LIKE で探す。
+# 過去の xlsx から取り込んだ見積（mitsumori/ddimport.py）は元ファイルの SHA-256 も持ち、同じファイルは二度入れない。
+# 接続は Streamlit の全セッションで 1 つを共有する（@st.cache_resource）ので、接続を使う処理はすべてロックの内側で行う。
+
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+from mitsumori.case import CaseSpec
+from mitsumori.items import Item, items_to_json, parse_items
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parent.parent / "data" / "estimates.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS estimates (
+    id         INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    app        TEXT,
+    model      TEXT,
+    title      TEXT,
+    case_json  TEXT NOT NULL,
+    items_json TEXT NOT NULL,
+    meta_json  TEXT NOT NULL,
+    model_json TEXT,
+    n_items    INTEGER,
+    taxable    INTEGER,
+    tax        INTEGER,
+    total      INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_estimates_created ON estimates(created_at);
+CREATE INDEX IF NOT EXISTS idx_estimates_total ON estimates(total);
+CREATE TABLE IF NOT EXISTS estimate_categories (
+    category    TEXT NOT NULL,
+    estimate_id INTEGER NOT NULL REFERENCES estimates(id) ON DELETE CASCADE,
+    amount      INTEGER NOT NULL,
+    PRIMARY KEY (category, estimate_id)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS estimates_fts USING fts5(tasks, notes, remarks, tokenize='trigram');
+CREATE TABLE IF NOT EXISTS imported_files (
+    sha256      TEXT PRIMARY KEY,
+    estimate_id INTEGER NOT NULL REFERENCES estimates(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+"""
+
+_SUMMARY_COLS = "e.id, e.created_at, e.app, e.model, e.title, e.n_items, e.taxable, e.total"
+
+class EstimateArchive:
+    def __init__(self, path=None):
+        self.path = str(path or os.getenv("MITSUMORI_ARCHIVE_DB") or DEFAULT_DB_PATH)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        # 保存は複数文のトランザクションなので、別スレッドの文が間に入らないよう接続ごと直列化する
+        self._lock = threading.RLock()
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM estimates").fetchone()[0]
+
+    # ---------- 保存 ----------
+    def save(self, case: CaseSpec, items: List[Item], meta: dict, model_info: Optional[dict] = None,
+             created_at: Optional[str] = None, source_sha256: Optional[str] = None,
+             amounts: Optional[Sequence[int]] = None) -> int:
+        """
+        items は確定後（予算寄せ・単価表適用後）の明細。meta は compute_totals の戻り値。
+        source_sha256: 取り込み元ファイルの SHA-256（imported_hashes で重複を飛ばすのに使う）。
+        amounts: 行ごとの金額（compute_totals の小計列。短納期係数・管理費の上限込み）。
+                 省略時は 数量×単価 で、カテゴリ別の合計は短納期の見積だと meta["taxable"] と合わない。
+        """
+        model_info = model_info or {}
+        if amounts is None:
+            amounts = [round(x.qty * x.unit_price) for x in items]
+        by_cat = {}
+        for x, a in zip(items, amounts):
+            by_cat[x.category] = by_cat.get(x.category, 0) + int(a)
+        with self._lock, self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO estimates (created_at, app, model, title, case_json, items_json, meta_json, "
+                "model_json, n_items, taxable, tax, total) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (created_at or datetime.now().isoformat(timespec="seconds"),
+                 model_info.get("app"), model_info.get("model"), case.title(),
+                 json.dumps(case.to_dict(), ensure_ascii=False), items_to_json(items),
+                 json.dumps(meta, ensure_ascii=False), json.dumps(model_info, ensure_ascii=False),
+                 len(items), meta.get("taxable"), meta.get("tax"), meta.get("total")),
+            )
+            est_id = cur.lastrowid
+            self.conn.executemany(
+                "INSERT INTO estimate_categories (category, estimate_id, amount) VALUES (?, ?, ?)",
+                [(c, est_id, a) for c, a in by_cat.items()],
+            )
+            self.conn.execute(
+                "INSERT INTO estimates_fts (rowid, tasks, notes, remarks) VALUES (?, ?, ?, ?)",
+                (est_id, "\n".join(x.task for x in items), "\n".join(x.note for x in items if x.note),
+                 "\n".join(s for s in (case.extra_notes, case.shoot_location) if s)),
+            )
+            if source_sha256:
+                self.conn.execute("INSERT INTO imported_files (sha256, estimate_id) VALUES (?, ?)",
+                                  (source_sha256, est_id))
+        return est_id
+
+    def imported_hashes(self) -> set:
+        with self._lock:
+            return {r[0] for r in self.conn.execute("SELECT sha256 FROM imported_files")}
+
+    # ---------- 検索 ----------
+    def search(self, query: str = "", category: Optional[str] = None,
+               min_total: Optional[int] = None, max_total: Optional[int] = None,
+               limit: int = 20) -> List[dict]:
+        """空白区切りの語をすべて含む見積を返す（新しい順。全文検索語があれば関連度順）。"""
+        where, args = [], []
+        terms = [t for t in (query or "").split() if t]
+        long_terms = [t for t in terms if len(t) >= 3]
+        if long_terms:
+            where.append("estimates_fts MATCH ?")
+            args.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in long_terms))
+        for t in terms:
+            if len(t) < 3:
+                like = f"%{t}%"
+                where.append("e.id IN (SELECT rowid FROM estimates_fts "
+                             "WHERE tasks LIKE ? OR notes LIKE ? OR remarks LIKE ?)")
+                args += [like, like, like]
+        if category:
+            where.append("e.id IN (SELECT estimate_id FROM estimate_categories WHERE category = ?)")
+            args.append(category)
+        if min_total is not None:
+            where.append("e.total >= ?")
+            args.append(min_total)
+        if max_total is not None:
+            where.append("e.total <= ?")
+            args.append(max_total)
+        if long_terms:
+            # FTS 側から引いて結合すると関連度（bm25 の rank 列）でそのまま並べられる
+            sql = f"SELECT {_SUMMARY_COLS} FROM estimates_fts JOIN estimates e ON e.id = estimates_fts.rowid"
+        else:
+            sql = f"SELECT {_SUMMARY_COLS} FROM estimates e"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY estimates_fts.rank, e.id DESC" if long_terms else " ORDER BY e.id DESC"
+        sql += " LIMIT ?"
+        args.append(limit)
+        keys = ["id", "created_at", "app", "model", "title", "n_items", "taxable", "total"]
+        with self._lock:
+            return [dict(zip(keys, row)) for row in self.conn.execute(sql, args)]
+
+    def categories(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self.conn.execute("SELECT DISTINCT category FROM estimate_categories ORDER BY category")]
+
+    def cases(self) -> List[Tuple[int, CaseSpec]]:
+        """全件の (ID, 案件条件)。類似案件の索引（mitsumori/retrieval.py）を作るときに使う。"""
+        with self._lock:
+            rows = self.conn.execute("SELECT id, case_json FROM estimates ORDER BY id").fetchall()
+        return [(r[0], CaseSpec.from_dict(json.loads(r[1]))) for r in rows]
+
+    def get(self, est_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id, created_at, case_json, items_json, meta_json, model_json FROM estimates WHERE id = ?",
+                (est_id,),
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            "id": row[0],
+            "created_at": row[1],
+            "case": CaseSpec.from_dict(json.loads(row[2])),
+            "items": parse_items(row[3]),
+            "meta": json.loads(row[4]),
+            "model_info": json.loads(row[5] or "{}"),
+        }
+
+def open_archive(path=None) -> EstimateArchive:
+    return EstimateArchive(path)
+
+def record_estimate(archive: EstimateArchive, case: CaseSpec, df_calc, meta: dict, app: str,
+                    model: Optional[str] = None, index=None) -> int:
+    """
+    確定した見積（compute_totals 後の表）をアーカイブと分析用 Parquet（mitsumori/columnar.py）に保存する。
+    index（mitsumori.retrieval.CaseIndex）を渡すと類似案件の索引にも足す。戻り値はアーカイブの ID。
+    """
+    from mitsumori.columnar import append_estimate  # pyarrow は保存するときだけ読む
+    from mitsumori.estimate import AMOUNT_COLUMN
+    from mitsumori.items import df_to_items
+    est_id = archive.save(case, df_to_items(df_calc), meta, {"app": app, "model": model},
+                          amounts=df_calc[AMOUNT_COLUMN].tolist())
+    if index is not None:
+        index.add(est_id, case)
+    append_estimate(df_calc, meta, app, model or "", est_id)
+    return est_id
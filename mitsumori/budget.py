@@ -0,0 +1,223 @@
+# ---------- 予算フィッティング（税抜合計を参考予算に合わせる） ----------
+# 旧 scale_prices_to_budget は「単一倍率を掛けて ¥1,000 丸め」で、管理費上限を常に満額と仮定し、
+# 丸め誤差も見ていなかったため、結果の税抜合計が目標から数万円ずれることがあった。
+# ここでは次の順に解く（いずれも単価は丸めグリッド上に置く）。
+#   1. 管理費（min(現状, 上限)）込みで目標に最も近くなる非管理費小計 S* を整数で求める
+#   2. カテゴリ上下限つきの倍率 s を区分線形方程式として解く（ロック行は動かさない）
+#   3. 単価を丸めグリッドに切り下げ、残差を端数の大きい行から 1 グリッドずつ配る（O(n log n)）
+# 1〜3 は NumPy の配列演算で書いてあり、先頭に格子の次元を持たせれば What-if 格子でもそのまま使える。
+
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from mitsumori.items import to_items
+from mitsumori.estimate import (
+    EstimateTable, compute_totals_table, rush_coeff, MGMT_CATEGORY, MGMT_FEE_CAP_RATE,
+)
+
+def line_amounts(qty, price, accel):
+    """compute_totals と同じ丸め：round(round(qty*unit_price) * 短納期係数)。"""
+    return np.rint(np.rint(qty * price) * accel)
+
+def mgmt_fee(subtotal, mgmt_current: float):
+    cap = np.rint(subtotal * MGMT_FEE_CAP_RATE)
+    return np.minimum(mgmt_current, cap) if mgmt_current > 0 else cap
+
+def target_subtotal(target_taxable, mgmt_current: float, mgmt_rest: float):
+    """税抜合計 = S + 管理費(S) + 2 行目以降の管理費 が目標に最も近くなる整数 S（配列可）。"""
+    target = np.asarray(target_taxable, dtype=np.float64)
+    lo = np.zeros_like(target)
+    hi = np.maximum(target, 0.0)
+
+    def f(s):
+        return s + mgmt_fee(s, mgmt_current) + mgmt_rest
+
+    # f は単調非減少：f(S) >= 目標 となる最小の S を二分探索
+    while np.any(lo < hi):
+        mid = np.floor((lo + hi) / 2)
+        ok = f(mid) >= target
+        hi = np.where(ok, mid, hi)
+        lo = np.where(ok, lo, mid + 1)
+    below = np.maximum(hi - 1, 0)
+    return np.where(np.abs(f(below) - target) <= np.abs(f(hi) - target), below, hi)
+
+def apportion(qty, price, p_cont, accel, free, round_to: int):
+    """
+    連続解 p_cont を丸めグリッドに切り下げ、非管理費小計の残差を端数の大きい行から配る。
+    先頭次元は格子（バッチ）として扱う。戻り値は新しい単価（float 配列）。
+    """
+    grid = float(round_to) if round_to and round_to > 1 else 1.0
+    free = np.broadcast_to(free, p_cont.shape)
+    p_new = np.where(free, np.floor(p_cont / grid) * grid, price)
+    amount = line_amounts(qty, p_new, accel)
+    step = line_amounts(qty, p_new + grid, accel) - amount
+    residue = np.where(free, qty * p_cont * accel - amount, 0.0).sum(axis=-1)
+
+    frac = np.where(free, (p_cont - p_new) / grid, -1.0)
+    order = np.argsort(-frac, axis=-1, kind="stable")
+    for k in range(p_cont.shape[-1]):
+        idx = order[..., k:k + 1]
+        st = np.take_along_axis(step, idx, axis=-1)[..., 0]
+        ok = np.take_along_axis(free, idx, axis=-1)[..., 0]
+        bump = ok & (st > 0) & (st < 2 * residue)
+        residue = residue - np.where(bump, st, 0.0)
+        p_k = np.take_along_axis(p_new, idx, axis=-1)
+        np.put_along_axis(p_new, idx, p_k + grid * bump[..., None], axis=-1)
+
+    # 仕上げ：刻みの大きい行から順に、残差を打ち消す方向へグリッド数を切り下げて動かす
+    # （残差は 0 以上・その行の刻み未満で細かい行へ渡る。単価は上げる側には必ず動けるので、
+    # 0 円の下限で吸収しきれず取り残されることがない）。
+    # 刻みの最も細かい行だけは四捨五入で残りを吸収し、|残差| は最小刻みの半分程度に収まる。
+    amount = line_amounts(qty, p_new, accel)
+    step = line_amounts(qty, p_new + grid, accel) - amount
+    movable = free & (step > 0)
+    order = np.argsort(-np.where(movable, step, -np.inf), axis=-1, kind="stable")
+    last = movable.sum(axis=-1) - 1
+    for k in range(p_cont.shape[-1]):
+        idx = order[..., k:k + 1]
+        st = np.take_along_axis(step, idx, axis=-1)[..., 0]
+        ok = np.take_along_axis(movable, idx, axis=-1)[..., 0]
+        ratio = residue / np.where(ok, st, 1.0)
+        moves = np.where(ok, np.where(k == last, np.rint(ratio), np.floor(ratio)), 0.0)
+        p_k = np.take_along_axis(p_new, idx, axis=-1)[..., 0]
+        q_k = np.take_along_axis(np.broadcast_to(qty, p_new.shape), idx, axis=-1)[..., 0]
+        a_k = np.take_along_axis(amount, idx, axis=-1)[..., 0]
+        p_moved = np.maximum(p_k + grid * moves, np.minimum(p_k, 0.0))  # 正の単価はマイナスにしない
+        a_moved = line_amounts(q_k, p_moved, accel[..., 0] if np.ndim(accel) else accel)
+        residue = residue - (a_moved - a_k)
+        np.put_along_axis(p_new, idx, p_moved[..., None], axis=-1)
+        np.put_along_axis(amount, idx, a_moved[..., None], axis=-1)
+    return p_new
+
+def _solve_scale(b_free, cats, free_target: float, low: float, high: float,
+                 locked_by_cat: Dict[str, float], category_limits) -> Tuple[float, np.ndarray]:
+    """Σ_c B_c * clip(s, lo_c, hi_c) = free_target を解き、(s, 行ごとの倍率) を返す。"""
+    total = float(b_free.sum())
+    if not category_limits:
+        s = min(high, max(low, free_target / total))
+        return s, np.full(len(cats), s)
+
+    bounds = {}
+    for c in dict.fromkeys(cats):
+        base = float(b_free[cats == c].sum())
+        lo_c, hi_c = low, high
+        mn, mx = category_limits.get(c, (None, None))
+        if base > 0:
+            # 明示したカテゴリ上下限は全体の倍率範囲 [low, high] より優先する
+            fixed = locked_by_cat.get(c, 0.0)
+            if mn is not None:
+                lo_c = max(0.0, (mn - fixed) / base)
+                hi_c = max(hi_c, lo_c)
+            if mx is not None:
+                hi_c = max(0.0, (mx - fixed) / base)
+                lo_c = min(lo_c, hi_c) if mn is None else lo_c
+        if lo_c > hi_c:
+            hi_c = lo_c  # 下限と上限が矛盾する場合は下限を優先
+        bounds[c] = (base, lo_c, hi_c)
+
+    def g(s):
+        return sum(base * min(hi_c, max(lo_c, s)) for base, lo_c, hi_c in bounds.values())
+
+    points = sorted({v for _, lo_c, hi_c in bounds.values() for v in (lo_c, hi_c)})
+    if free_target <= g(points[0]):
+        s = points[0]
+    elif free_target >= g(points[-1]):
+        s = points[-1]
+    else:
+        i, j = 0, len(points) - 1
+        while j - i > 1:
+            m = (i + j) // 2
+            if g(points[m]) <= free_target:
+                i = m
+            else:
+                j = m
+        g0, g1 = g(points[i]), g(points[j])
+        s = points[i] if g1 <= g0 else points[i] + (free_target - g0) * (points[j] - points[i]) / (g1 - g0)
+    per_line = np.array([min(bounds[c][2], max(bounds[c][1], s)) for c in cats], dtype=np.float64)
+    return s, per_line
+
+def fit_prices_table(t: EstimateTable,
+                     base_days: int,
+                     target_days: int,
+                     target_taxable_jpy: int,
+                     low: float = 0.6,
+                     high: float = 5.0,
+                     round_to: int = 1000,
+                     locked: Optional[Iterable[int]] = None,
+                     category_limits: Optional[Dict[str, Tuple[Optional[int], Optional[int]]]] = None,
+                     ) -> Tuple[EstimateTable, dict]:
+    """
+    非管理費行の単価を動かして、compute_totals 後の税抜合計（taxable）を目標額に合わせる。
+    locked: 単価を動かさない行番号。
+    category_limits: {カテゴリ: (下限, 上限)}。短納期係数適用後のカテゴリ小計（円）の範囲。None は制約なし。
+    戻り値: (新しいテーブル, {"scale", "target_subtotal", "taxable", "error", "clamped"})
+    """
+    accel = rush_coeff(base_days, target_days)
+    n = len(t)
+    cats = np.array(t.category, dtype=object)
+    is_mgmt = cats == MGMT_CATEGORY
+    qty = np.asarray(t.qty, dtype=np.float64)
+    price = np.frombuffer(t.unit_price, dtype=np.int64).astype(np.float64)
+    lock = np.zeros(n, dtype=bool)
+    for i in locked or ():
+        if 0 <= i < n:
+            lock[i] = True
+    free = ~is_mgmt & ~lock
+
+    amount = line_amounts(qty, price, accel)
+    mgmt_raw = np.rint(qty[is_mgmt] * price[is_mgmt])  # 管理費行に短納期係数は掛からない
+    mgmt_current = float(mgmt_raw.sum())
+    mgmt_rest = float(mgmt_raw[1:].sum())  # 先頭行以外は compute_totals でもそのまま残る
+
+    b_free = np.where(free, qty * price * accel, 0.0)
+    if float(b_free.sum()) <= 0:
+        out = t.copy()
+        _, meta = compute_totals_table(out, base_days, target_days)
+        return out, {"scale": 1.0, "target_subtotal": None, "taxable": meta["taxable"],
+                     "error": meta["taxable"] - target_taxable_jpy, "clamped": True}
+
+    s_target = float(target_subtotal(target_taxable_jpy, mgmt_current, mgmt_rest))
+    locked_amount = np.where(~is_mgmt & lock, amount, 0.0)
+    locked_by_cat = {}
+    for c, a in zip(cats[~is_mgmt & lock], locked_amount[~is_mgmt & lock]):
+        locked_by_cat[c] = locked_by_cat.get(c, 0.0) + float(a)
+    free_target = s_target - float(locked_amount.sum())
+
+    s, scale = _solve_scale(b_free[free], cats[free], free_target, low, high,
+                            locked_by_cat, category_limits)
+    per_line = np.ones(n)
+    per_line[free] = scale
+    p_new = apportion(qty, price, price * per_line, accel, free, round_to)
+
+    out = t.copy()
+    out.amount = None
+    for i in np.flatnonzero(free):
+        out.unit_price[i] = int(p_new[i])
+    _, meta = compute_totals_table(out, base_days, target_days)
+    return out, {
+        "scale": s,
+        "target_subtotal": int(s_target),
+        "taxable": meta["taxable"],
+        "error": meta["taxable"] - target_taxable_jpy,
+        "clamped": not (low < s < high),
+    }
+
+# ---------- 予算に（税抜）で寄せる（DataFrame API） ----------
+def scale_prices_to_budget(df_items: pd.DataFrame,
+                           base_days: int,
+                           target_days: int,
+                           target_taxable_jpy: int,
+                           low: float = 0.6,
+                           high: float = 5.0,
+                           round_to: int = 1000,
+                           locked: Optional[Iterable[int]] = None,
+                           category_limits: Optional[Dict[str, Tuple[Optional[int], Optional[int]]]] = None,
+                           ) -> pd.DataFrame:
+    t = EstimateTable.from_df(df_items)
+    if t is None:
+        t = EstimateTable.from_items(to_items(df_items.to_dict("records")))
+    out, _ = fit_prices_table(t, base_days, target_days, target_taxable_jpy, low, high, round_to,
+                              locked, category_limits)
+    return out.to_df()
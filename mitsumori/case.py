@@ -0,0 +1,47 @@
+# ---------- 案件条件（CaseSpec） ----------
+# 入力フォームの値をひとまとめにしたもの。アーカイブ保存・複製や、画面を通さない呼び出しで使う。
+
+from dataclasses import dataclass, field, fields
+from typing import List
+
+@dataclass(slots=True)
+class CaseSpec:
+    final_duration: str = "30秒"
+    num_versions: int = 1
+    shoot_days: int = 2
+    edit_days: int = 3
+    delivery_date: str = ""  # ISO 形式（YYYY-MM-DD）
+    cast_main: int = 1
+    cast_extra: int = 0
+    talent_use: bool = False
+    staff_roles: List[str] = field(default_factory=list)
+    shoot_location: str = ""
+    kizai: List[str] = field(default_factory=list)
+    set_design_quality: str = "なし"
+    use_cg: bool = False
+    use_narration: bool = False
+    use_music: str = "未定"
+    ma_needed: bool = False
+    deliverables: List[str] = field(default_factory=list)
+    subtitle_langs: List[str] = field(default_factory=list)
+    usage_region: str = "日本国内"
+    usage_period: str = "未定"
+    budget_hint: str = ""
+    extra_notes: str = ""
+
+    def to_dict(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "CaseSpec":
+        # 未知のキーは捨てる（古いアーカイブや手書き JSON でも読めるように）
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in (d or {}).items() if k in names})
+
+    @property
+    def base_days(self) -> int:
+        return int(self.shoot_days + self.edit_days + 5)
+
+    def title(self) -> str:
+        head = (self.extra_notes or "").strip().splitlines()[0][:40] if (self.extra_notes or "").strip() else ""
+        return head or f"{self.final_duration} × {self.num_versions}本"
@@ -0,0 +1,183 @@
+# ---------- コマンドラインの見積 ----------
+# ブラウザ・パスワード・st.secrets なしで見積を作る（スクリプト・CI 向け）。案件条件は JSON / YAML ファイル（- で標準入力）か
+# フラグ（--shoot-days 3 など。ファイルと併用するとフラグが優先）で渡し、Streamlit 版と同じ 生成 → 正規化 → 単価表 → 計算
+# （mitsumori/service.py）を通して HTML / xlsx / JSON を書く。
+# --cache-dir を付けると LLM の応答をプロンプトのハッシュごとに保存し、--offline ではその応答だけで再実行する（API キー不要）。
+# 起動を速くするため streamlit は import せず、pandas と LLM の SDK（使うプロバイダの分だけ）は引数を読んでから import する。
+# API キーは環境変数（OPENAI_API_KEY / GEMINI_API_KEY）から読む。
+# 実行: python -m mitsumori.cli case.yaml --provider gemini -o out/
+
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+from dataclasses import fields
+from typing import List, Optional
+
+from mitsumori.case import CaseSpec
+
+PROVIDER_CHOICES = ("openai", "gemini")    # mitsumori.service.PROVIDERS（ここでは import しない）
+RATE_CARD_CHOICES = ("fill", "clamp", "replace")
+FORMATS = ("html", "xlsx", "json")
+CLI_PROVIDER = os.getenv("MITSUMORI_CLI_PROVIDER", "openai")
+
+_YAML_SUFFIXES = (".yaml", ".yml")
+
+# =========================
+# 案件条件
+# =========================
+def _split_list(s: str) -> List[str]:
+    return [x.strip() for x in s.replace("、", ",").split(",") if x.strip()]
+
+def _add_case_flags(ap: argparse.ArgumentParser):
+    """CaseSpec の項目をそのままフラグにする（--final-duration 30秒 / --talent-use / --kizai 'ドローン,ジンバル'）。"""
+    g = ap.add_argument_group("案件条件（ファイルより優先）")
+    for f in fields(CaseSpec):
+        flag = "--" + f.name.replace("_", "-")
+        if f.type is bool:
+            g.add_argument(flag, dest=f"case_{f.name}", action=argparse.BooleanOptionalAction, default=None)
+        elif f.type is int:
+            g.add_argument(flag, dest=f"case_{f.name}", type=int, default=None, metavar="N")
+        elif f.type is str:
+            g.add_argument(flag, dest=f"case_{f.name}", default=None, metavar="TEXT")
+        else:  # List[str]
+            g.add_argument(flag, dest=f"case_{f.name}", type=_split_list, default=None, metavar="A,B")
+
+def _parse_case_text(text: str, yaml_hint: bool) -> dict:
+    if not yaml_hint:
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass  # 標準入力は JSON でなければ YAML として読む
+    try:
+        import yaml
+    except ImportError:
+        raise SystemExit("YAML を読むには PyYAML が必要です（pip install pyyaml）")
+    return yaml.safe_load(text)
+
+def load_case(path: Optional[str], args: argparse.Namespace) -> CaseSpec:
+    d = {}
+    if path:
+        text = sys.stdin.read() if path == "-" else Path(path).read_text(encoding="utf-8")
+        d = _parse_case_text(text, path != "-" and Path(path).suffix.lower() in _YAML_SUFFIXES) or {}
+        if not isinstance(d, dict):
+            raise SystemExit(f"{path}: 案件条件はオブジェクト（キー: 値）で書いてください")
+        d = d.get("case", d)  # API の要求本文（{"case": {...}}）や出力 JSON もそのまま読めるように
+    for f in fields(CaseSpec):
+        v = getattr(args, f"case_{f.name}")
+        if v is not None:
+            d[f.name] = v
+    if d.get("delivery_date") is not None:
+        d["delivery_date"] = str(d["delivery_date"])  # YAML は日付を date 型で読む
+    return CaseSpec.from_dict(d)
+
+# =========================
+# 出力
+# =========================
+def _html_document(case: CaseSpec, body: str) -> str:
+    from html import escape
+    return ("<!DOCTYPE html>\n<html lang='ja'><head><meta charset='utf-8'>"
+            f"<title>{escape(case.title())}</title></head>\n<body>\n{body}\n</body></html>\n")
+
+def write_outputs(result, case: CaseSpec, provider_name: str, out_dir: Path, name: str,
+                  formats: List[str]) -> List[Path]:
+    from mitsumori.export import estimate_xlsx
+    from mitsumori.render import render_html
+    from mitsumori.service import result_to_dict
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for fmt in formats:
+        path = out_dir / f"{name}.{fmt}"
+        if fmt == "html":
+            path.write_text(_html_document(case, render_html(result.df, result.meta)), encoding="utf-8")
+        elif fmt == "xlsx":
+            path.write_bytes(estimate_xlsx(result.df, result.meta))
+        else:
+            payload = {"case": case.to_dict(), "provider": provider_name, **result_to_dict(result)}
+            path.write_text(json.dumps(payload, ensure_ascii=False, indent=2,
+                                       default=lambda v: v.item() if hasattr(v, "item") else str(v)),
+                            encoding="utf-8")
+        written.append(path)
+    return written
+
+# =========================
+# エントリポイント
+# =========================
+def _parse_formats(s: str) -> List[str]:
+    out = [x.strip().lower() for x in s.split(",") if x.strip()]
+    bad = [x for x in out if x not in FORMATS]
+    if bad or not out:
+        raise argparse.ArgumentTypeError(f"出力形式は {' / '.join(FORMATS)} をカンマ区切りで指定してください")
+    return out
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="python -m mitsumori.cli",
+                                 description="案件条件から概算見積を作り、HTML / xlsx / JSON に書き出す")
+    ap.add_argument("case", nargs="?", help="案件条件の JSON / YAML ファイル（- で標準入力）。省略時はフラグと既定値のみ")
+    ap.add_argument("--provider", choices=PROVIDER_CHOICES, default=CLI_PROVIDER,
+                    help="LLM プロバイダ（既定: $MITSUMORI_CLI_PROVIDER または openai）")
+    ap.add_argument("--model", default=None, help="モデル名（既定: プロバイダごとの既定モデル）")
+    ap.add_argument("-o", "--out-dir", default=".", help="出力先ディレクトリ（既定: カレント）")
+    ap.add_argument("--name", default="estimate", help="出力ファイル名（拡張子なし。既定: estimate）")
+    ap.add_argument("--formats", type=_parse_formats, default=list(FORMATS), help="html,xlsx,json のうち書くもの")
+    ap.add_argument("--cache-dir", default=None, help="LLM 応答のキャッシュ先（プロンプトのハッシュごとに保存）")
+    ap.add_argument("--offline", action="store_true", help="--cache-dir の応答だけで実行する（LLM を呼ばない）")
+    ap.add_argument("--no-normalize", action="store_true", help="正規化パスを省く")
+    ap.add_argument("--no-infer", action="store_true", help="備考からの未指定項目の推論をさせない")
+    ap.add_argument("--rate-card", choices=RATE_CARD_CHOICES, default=None,
+                    help="単価表（mitsumori/ratecard.py）の適用: fill=0円の行だけ / clamp=範囲外を補正 / replace=標準単価で置換")
+    ap.add_argument("--target-days", type=int, default=None, help="納品までの日数（既定: 納品希望日と今日から）")
+    _add_case_flags(ap)
+    return ap
+
+def main(argv=None) -> int:
+    ap = build_parser()
+    args = ap.parse_args(argv)
+    if args.offline and not args.cache_dir:
+        ap.error("--offline には --cache-dir が必要です")
+    case = load_case(args.case, args)
+
+    # ここから pandas・SDK を読む（--help や引数エラーでは読まない）
+    from mitsumori.service import (
+        CacheMiss, CachedProvider, EstimateOptions, ProviderError, make_provider, run_estimate,
+    )
+
+    rate_card = None
+    if args.rate_card:
+        from mitsumori.ratecard import open_rate_card
+        rate_card = open_rate_card()
+    provider = inner = None if args.offline else make_provider(args.provider, args.model)
+    if args.cache_dir:
+        provider = CachedProvider(args.cache_dir, args.provider, args.model, inner)
+    options = EstimateOptions(normalize=not args.no_normalize, infer_from_notes=not args.no_infer,
+                              rate_card_mode=args.rate_card, target_days=args.target_days)
+    try:
+        result = run_estimate(case, provider, options, rate_card)
+    except CacheMiss as e:
+        print(f"エラー: {e.args[0]}。--offline を外して一度 LLM を呼んでください", file=sys.stderr)
+        return 1
+    except ProviderError as e:  # SDK の例外（認証・通信・レート制限）
+        print(f"エラー: LLM 呼び出しに失敗しました: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if rate_card is not None:
+            rate_card.close()
+
+    written = write_outputs(result, case, args.provider, Path(args.out_dir), args.name, args.formats)
+    meta = result.meta
+    print(f"{case.title()}  モデル {result.model} / {len(result.df)} 行 / "
+          f"税抜 {int(meta['taxable']):,} 円 / 税込 {int(meta['total']):,} 円")
+    if result.continuation.get("truncated"):
+        print("  ⚠️ 出力上限で途中切れのため、閉じている項目までを採用しました")
+    if isinstance(provider, CachedProvider):
+        print(f"  応答キャッシュ: ヒット {provider.hits} / 取得 {provider.misses}（{provider.cache_dir}）")
+        if args.offline and provider.misses:
+            print("  ⚠️ 正規化の応答がキャッシュに無かったため、正規化前の明細を使いました")
+    for path in written:
+        print(f"  → {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
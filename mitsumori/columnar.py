@@ -0,0 +1,194 @@
+# ---------- 分析用の列指向ストア（Parquet） ----------
+# 見積ごとに明細 1 行 = 1 レコードで Parquet を追記する（既存ファイルは書き換えない）。
+# 配置: <root>/date=YYYY-MM-DD/app=<アプリ名>/part-*.parquet（Hive 形式のパーティション）
+# 各ファイルは category 順に並べて書くので、category の絞り込みは行グループ統計で読み飛ばせる。
+# 追記は見積 1 件 = 1 ファイルで細かくなるため、compact でパーティションごとに 1 ファイルへまとめる。
+# 圧縮:  python -m mitsumori.columnar compact [--root DIR] [--date YYYY-MM-DD]
+# 参照:  python -m mitsumori.columnar query [--start ...] [--end ...] [--app ...] [--category ...]
+
+import os
+import sys
+import uuid
+import argparse
+from datetime import date, datetime
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from mitsumori.estimate import AMOUNT_COLUMN
+
+DEFAULT_ROOT = Path(__file__).resolve().parent.parent / "data" / "estimates_parquet"
+
+# パーティション列（date, app）はディレクトリ名で持つのでファイルには書かない
+SCHEMA = pa.schema([
+    ("estimate_id", pa.int64()),
+    ("created_at", pa.timestamp("s")),
+    ("model", pa.string()),
+    ("line_no", pa.int32()),
+    ("category", pa.string()),
+    ("task", pa.string()),
+    ("qty", pa.float64()),
+    ("unit", pa.string()),
+    ("unit_price", pa.int64()),
+    ("amount", pa.int64()),
+    ("note", pa.string()),
+    ("rush_coeff", pa.float64()),
+    ("mgmt_fee", pa.int64()),
+    ("taxable", pa.int64()),
+    ("total", pa.int64()),
+    ("mgmt_share", pa.float64()),
+])
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string()), ("app", pa.string())]), flavor="hive")
+
+def store_root(root=None) -> Path:
+    return Path(root or os.getenv("MITSUMORI_PARQUET_DIR") or DEFAULT_ROOT)
+
+def _partition_dir(root: Path, day: str, app: str) -> Path:
+    # app 名にパス区切りが混ざってもパーティションが壊れないようにする
+    return root / f"date={day}" / f"app={str(app or 'unknown').replace('/', '_').replace('=', '_')}"
+
+def estimate_to_table(df_calc: pd.DataFrame, meta: dict, estimate_id: Optional[int] = None,
+                      model: str = "", created_at: Optional[datetime] = None) -> pa.Table:
+    """compute_totals の戻り値（df_calc, meta）を 1 見積分の Arrow テーブルにする。"""
+    created_at = (created_at or datetime.now()).replace(microsecond=0)
+    n = len(df_calc)
+    taxable = int(meta.get("taxable", 0))
+    mgmt = int(meta.get("mgmt_fee_final", 0))
+    cols = {
+        "estimate_id": pa.array([estimate_id] * n, pa.int64()),
+        "created_at": pa.array([created_at] * n, pa.timestamp("s")),
+        "model": pa.array([model or ""] * n, pa.string()),
+        "line_no": pa.array(np.arange(n, dtype=np.int32)),
+        "category": pa.array(df_calc["category"].astype(str).tolist(), pa.string()),
+        "task": pa.array(df_calc["task"].astype(str).tolist(), pa.string()),
+        "qty": pa.array(df_calc["qty"].to_numpy(dtype=np.float64)),
+        "unit": pa.array(df_calc["unit"].astype(str).tolist(), pa.string()),
+        "unit_price": pa.array(df_calc["unit_price"].to_numpy(dtype=np.int64)),
+        "amount": pa.array(df_calc[AMOUNT_COLUMN].to_numpy(dtype=np.int64)),
+        "note": pa.array(df_calc["note"].fillna("").astype(str).tolist(), pa.string()),
+        "rush_coeff": pa.array([float(meta.get("rush_coeff", 1.0))] * n, pa.float64()),
+        "mgmt_fee": pa.array([mgmt] * n, pa.int64()),
+        "taxable": pa.array([taxable] * n, pa.int64()),
+        "total": pa.array([int(meta.get("total", 0))] * n, pa.int64()),
+        "mgmt_share": pa.array([mgmt / taxable if taxable else 0.0] * n, pa.float64()),
+    }
+    t = pa.table(cols, schema=SCHEMA)
+    return t.sort_by([("category", "ascending"), ("line_no", "ascending")])
+
+def append_estimate(df_calc: pd.DataFrame, meta: dict, app: str, model: str = "",
+                    estimate_id: Optional[int] = None, created_at: Optional[datetime] = None,
+                    root=None) -> Path:
+    """1 見積を新しい part ファイルとして追記する。書きかけのファイルが読まれないよう一時名から rename する。"""
+    created_at = created_at or datetime.now()
+    part_dir = _partition_dir(store_root(root), created_at.date().isoformat(), app)
+    part_dir.mkdir(parents=True, exist_ok=True)
+    table = estimate_to_table(df_calc, meta, estimate_id, model, created_at)
+    path = part_dir / f"part-{created_at:%H%M%S}-{uuid.uuid4().hex[:12]}.parquet"
+    tmp = part_dir / f".{path.name}.tmp"  # 先頭が "." のファイルは dataset の探索対象外
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, path)
+    return path
+
+# =========================
+# 圧縮（パーティションごとに 1 ファイルへ）
+# =========================
+def compact(root=None, day: Optional[str] = None, min_files: int = 2) -> List[Path]:
+    """
+    part ファイルが min_files 以上あるパーティションを 1 ファイルにまとめる（category, created_at 順）。
+    読み込んだファイルだけを消すので、圧縮中に追記された part は次回に回る。戻り値は書いたファイル。
+    """
+    root = store_root(root)
+    written = []
+    for date_dir in sorted(root.glob(f"date={day}" if day else "date=*")):
+        for app_dir in sorted(p for p in date_dir.glob("app=*") if p.is_dir()):
+            parts = sorted(app_dir.glob("*.parquet"))
+            if len(parts) < min_files:
+                continue
+            table = pa.concat_tables([pq.read_table(p, schema=SCHEMA) for p in parts])
+            table = table.sort_by([("category", "ascending"), ("created_at", "ascending"),
+                                   ("estimate_id", "ascending"), ("line_no", "ascending")])
+            path = app_dir / f"compact-{uuid.uuid4().hex[:12]}.parquet"
+            tmp = app_dir / f".{path.name}.tmp"
+            pq.write_table(table, tmp, compression="zstd", row_group_size=64_000)
+            os.replace(tmp, path)
+            for p in parts:
+                p.unlink()
+            written.append(path)
+    return written
+
+# =========================
+# 参照（述語プッシュダウン付き）
+# =========================
+def _day(v) -> str:
+    return v.isoformat() if isinstance(v, (date, datetime)) else str(v)
+
+def query(root=None, start=None, end=None, app=None, category=None,
+          columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    期間（date の両端を含む）・アプリ・カテゴリで絞り込んだ明細を DataFrame で返す。
+    date / app はディレクトリ単位で、category は行グループ統計で読み飛ばされる。
+    app / category は文字列かそのリスト。
+    """
+    root = store_root(root)
+    if not root.exists():
+        return pd.DataFrame(columns=list(columns) if columns else ["date", "app", *SCHEMA.names])
+    dataset = ds.dataset(root, format="parquet", schema=SCHEMA.append(pa.field("date", pa.string()))
+                         .append(pa.field("app", pa.string())), partitioning=PARTITIONING)
+    conds = []
+    if start is not None:
+        conds.append(ds.field("date") >= _day(start))
+    if end is not None:
+        conds.append(ds.field("date") <= _day(end))
+    for name, v in (("app", app), ("category", category)):
+        if v is not None:
+            conds.append(ds.field(name).isin([v] if isinstance(v, str) else list(v)))
+    cond = None
+    for c in conds:
+        cond = c if cond is None else cond & c
+    return dataset.to_table(columns=list(columns) if columns else None, filter=cond).to_pandas()
+
+def summarize(df: pd.DataFrame) -> pd.DataFrame:
+    """カテゴリ別の件数・単価分位・金額合計（管理費行を含む）。query の戻り値にそのまま使う。"""
+    if df.empty:
+        return pd.DataFrame()
+    g = df.groupby("category")
+    out = pd.DataFrame({
+        "lines": g.size(),
+        "estimates": g["estimate_id"].nunique(),
+        "unit_price_p10": g["unit_price"].quantile(0.1).round().astype("int64"),
+        "unit_price_p50": g["unit_price"].quantile(0.5).round().astype("int64"),
+        "unit_price_p90": g["unit_price"].quantile(0.9).round().astype("int64"),
+        "amount_sum": g["amount"].sum(),
+    })
+    return out.sort_values("amount_sum", ascending=False)
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m mitsumori.columnar")
+    ap.add_argument("--root", default=None, help=f"保存先（既定: $MITSUMORI_PARQUET_DIR または {DEFAULT_ROOT}）")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_cmp = sub.add_parser("compact", help="パーティションごとに part ファイルをまとめる")
+    p_cmp.add_argument("--date", default=None, help="対象日（YYYY-MM-DD）。省略時は全期間")
+    p_q = sub.add_parser("query", help="カテゴリ別の集計を表示する")
+    p_q.add_argument("--start", default=None)
+    p_q.add_argument("--end", default=None)
+    p_q.add_argument("--app", action="append", default=None)
+    p_q.add_argument("--category", action="append", default=None)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "compact":
+        paths = compact(args.root, args.date)
+        print(f"{len(paths)} パーティションを圧縮（{store_root(args.root)}）")
+        return 0
+    df = query(args.root, args.start, args.end, args.app, args.category)
+    print(f"{len(df):,} 行 / {df['estimate_id'].nunique() if len(df) else 0:,} 見積")
+    if len(df):
+        print(summarize(df).to_string())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+# ---------- 途中切れ検出 & 継続生成 ----------
+# max_output_tokens / max_tokens に達して JSON が途中で切れた場合、
+# 最後まで閉じている item までを確定させ、その続きだけを追加リクエストで生成して継ぎ足す。
+
+import json
+from typing import Awaitable, Callable, List, Tuple
+
+from mitsumori.parsing import scan_json_like, extract_items
+from mitsumori.items import Item, to_items
+
+MAX_CONTINUATIONS = 2
+
+def finish_reason_truncated(resp) -> bool:
+    """SDK 応答の終了理由がトークン上限かどうか（OpenAI: "length" / Gemini: MAX_TOKENS）。"""
+    try:
+        choices = getattr(resp, "choices", None)
+        if choices:
+            return getattr(choices[0], "finish_reason", None) == "length"
+        candidates = getattr(resp, "candidates", None)
+        if candidates:
+            fr = getattr(candidates[0], "finish_reason", None)
+            name = getattr(fr, "name", fr)
+            return name == 2 or str(name).upper().endswith("MAX_TOKENS")
+    except Exception:
+        pass
+    return False
+
+def parse_items_truncation(raw: str) -> Tuple[list, bool]:
+    """(閉じている item のリスト, JSON が途中で切れているか) を返す。"""
+    if not raw:
+        return [], False
+    try:
+        return extract_items(json.loads(raw)), False
+    except Exception:
+        pass
+    obj, truncated = scan_json_like(raw)
+    return extract_items(obj), truncated
+
+def _item_key(x) -> tuple:
+    if not isinstance(x, dict):
+        return ("", json.dumps(x, ensure_ascii=False))
+    return (str(x.get("category", "")), str(x.get("task", "")))
+
+def stitch_items(done: list, more: list) -> list:
+    """継続出力を継ぎ足す。(category, task) が既出の item は重複とみなして捨てる。"""
+    seen = {_item_key(x) for x in done}
+    out = list(done)
+    for x in more:
+        k = _item_key(x)
+        if k in seen:
+            continue
+        seen.add(k)
+        out.append(x)
+    return out
+
+def build_continuation_prompt(prompt: str, done_items: list) -> str:
+    done_brief = [{"category": x.get("category", ""), "task": x.get("task", "")}
+                  for x in done_items if isinstance(x, dict)]
+    return f"""{prompt}
+
+【継続指示】
+前回の出力は出力上限で途中で切れました。以下の項目は出力済みです（再出力禁止）。
+{json.dumps(done_brief, ensure_ascii=False)}
+この続きの項目だけを {{"items": [...]}} 形式の JSON で返してください。追加する項目がなければ {{"items": []}} を返してください。
+"""
+
+def _continuation_steps(prompt: str, max_rounds: int):
+    """
+    継続生成の手順だけを持つジェネレータ。次に投げるプロンプトを yield し、(生テキスト, 上限到達) を send で受ける。
+    同期版・非同期版の呼び出し方の違いは generate_with_continuation / agenerate_with_continuation 側で吸収する。
+    """
+    raw, hit_limit = yield prompt
+    raws = [raw]
+    items, broken = parse_items_truncation(raw)
+    truncated = hit_limit or broken
+    rounds = 0
+    while truncated and rounds < max_rounds:
+        rounds += 1
+        raw, hit_limit = yield build_continuation_prompt(prompt, items)
+        raws.append(raw)
+        more, broken = parse_items_truncation(raw)
+        n_before = len(items)
+        items = stitch_items(items, more)
+        truncated = hit_limit or broken
+        if len(items) == n_before:
+            break  # 進捗なし：打ち切り
+    info = {"continuations": rounds, "truncated": truncated}
+    return to_items(items), raws, info
+
+def generate_with_continuation(call: Callable[[str], Tuple[str, bool]],
+                               prompt: str,
+                               max_rounds: int = MAX_CONTINUATIONS) -> Tuple[List[Item], list, dict]:
+    """
+    call(prompt) -> (生テキスト, 終了理由が上限だったか) を受け取り、途中切れなら継続リクエストを出す。
+    戻り値: (Item のリスト, 各回の生テキスト, {"continuations": 回数, "truncated": 最終的に切れたままか})
+    """
+    steps = _continuation_steps(prompt, max_rounds)
+    p = next(steps)
+    try:
+        while True:
+            p = steps.send(call(p))
+    except StopIteration as done:
+        return done.value
+
+async def agenerate_with_continuation(acall: Callable[[str], Awaitable[Tuple[str, bool]]],
+                                      prompt: str,
+                                      max_rounds: int = MAX_CONTINUATIONS) -> Tuple[List[Item], list, dict]:
+    """generate_with_continuation の非同期版（acall はコルーチン関数）。"""
+    steps = _continuation_steps(prompt, max_rounds)
+    p = next(steps)
+    try:
+        while True:
+            p = steps.send(await acall(p))
+    except StopIteration as done:
+        return done.value
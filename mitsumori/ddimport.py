@@ -0,0 +1,243 @@
+# ---------- 過去の DD見積書（xlsx）の一括取り込み ----------
+# 出力済みの DD見積書から明細を読み戻し、見積アーカイブ（mitsumori/archive.py）に入れる。
+# 読み方は書き込み側（mitsumori/template.py）と同じ決まり：COLMAP の列、金額列の最後の SUM 式が小計行、
+# 明細枠は SUM の範囲の先頭（記入済みのファイルには {{ITEMS_START}} が残っていない）から小計行の手前まで。
+# 小計式が続きのシート（'御見積書 (2)'!W72 …）を足していれば、そのシートも同じ枠で読む。
+# 読み込みは openpyxl の read_only（スタイル・結合セルを組み立てずにセル値だけを流し読み）。
+# ファイルはプロセスプールで並列に読み、SHA-256 で重複（複製・再取り込み）を飛ばす。
+# アーカイブへは 1 ファイルずつコミットするので、途中で止めても再実行すれば続きから入る。
+
+import re
+import sys
+import time
+import hashlib
+import argparse
+from io import BytesIO
+from datetime import datetime
+from pathlib import Path
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
+from openpyxl import load_workbook
+from openpyxl.utils import column_index_from_string
+
+from mitsumori.archive import EstimateArchive, open_archive, DEFAULT_DB_PATH
+from mitsumori.case import CaseSpec
+from mitsumori.estimate import TAX_RATE
+from mitsumori.items import Item
+from mitsumori.template import BASE_START_ROW, BASE_SUBTOTAL_ROW, COLMAP
+
+IMPORT_APP = "dd_import"
+REPORT_EVERY = 100   # 進捗（files/s）を出す間隔（ファイル数）
+
+_COLS = {k: column_index_from_string(v) for k, v in COLMAP.items()}
+_SUM_RE = re.compile(r"SUM\(\$?%s\$?(\d+):" % COLMAP["amount"], re.I)
+_SHEET_REF_RE = re.compile(r"(?:'((?:[^']|'')+)'|([^'!+\-*/=(),\s]+))!\$?%s\$?\d+" % COLMAP["amount"], re.I)
+
+@dataclass
+class DDWorkbook:
+    title: str                 # 「件名」欄（無ければファイル名）
+    items: List[Item]
+    sheets: int = 1            # 明細を読んだシート数（続きのシートを含む）
+
+@dataclass
+class ImportStats:
+    files: int = 0
+    imported: int = 0
+    duplicates: int = 0        # 取り込み済み・今回の中での重複（SHA-256 が同じ）
+    empty: int = 0             # 明細が 1 行も読めなかった
+    errors: List[Tuple[str, str]] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def files_per_sec(self) -> float:
+        return self.files / self.seconds if self.seconds else 0.0
+
+# =========================
+# 1 ファイルの読み取り
+# =========================
+def _cell(rows: List[tuple], r: int, c: int):
+    if r <= len(rows) and c <= len(rows[r - 1]):
+        return rows[r - 1][c - 1]
+    return None
+
+def _number(v):
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return v
+    if isinstance(v, str):
+        t = v.replace(",", "").replace("円", "").replace("¥", "").strip()
+        try:
+            return float(t) if "." in t else int(t)
+        except ValueError:
+            return None
+    return None
+
+def _subtotal(rows: List[tuple]) -> Tuple[Optional[int], str]:
+    """金額列の最後の SUM 式の (行, 式)。template._find_subtotal_anchor_auto と同じ決め方。"""
+    c = _COLS["amount"]
+    found, formula = None, ""
+    for r in range(1, len(rows) + 1):
+        v = _cell(rows, r, c)
+        if isinstance(v, str) and v.strip().startswith("=") and "SUM(" in v.upper():
+            found, formula = r, v
+    return found, formula
+
+def _read_page(rows: List[tuple], category: str = "") -> Tuple[List[Item], str, List[str], int]:
+    """戻り値: (明細, 最後のカテゴリ, 小計式が足している続きのシート名, 明細の開始行)"""
+    sub_r, formula = _subtotal(rows)
+    m = _SUM_RE.search(formula)
+    start = int(m.group(1)) if m else BASE_START_ROW
+    sub_r = sub_r or BASE_SUBTOTAL_ROW
+    refs = [(q or b).replace("''", "'") for q, b in _SHEET_REF_RE.findall(formula)]
+
+    items = []
+    c_task, c_qty, c_unit, c_price = (_COLS[k] for k in ("task", "qty", "unit", "unit_price"))
+    for r in range(start, sub_r):
+        task = _cell(rows, r, c_task)
+        if task is None or not str(task).strip():
+            continue
+        qty, price = _number(_cell(rows, r, c_qty)), _number(_cell(rows, r, c_price))
+        if qty is None and price is None:
+            category = str(task).strip()  # 見出し行（カテゴリ）
+            continue
+        unit = _cell(rows, r, c_unit)
+        items.append(Item(category, str(task).strip(), float(qty or 0), "" if unit is None else str(unit).strip(),
+                          int(round(price or 0))))
+    return items, category, refs, start
+
+def _title(rows: List[tuple], start: int) -> str:
+    for row in rows[:start - 1]:
+        for i, v in enumerate(row):
+            if isinstance(v, str) and v.strip() == "件名":
+                rest = [x for x in row[i + 1:] if x is not None and str(x).strip()]
+                return str(rest[0]).strip() if rest else ""
+    return ""
+
+def read_dd_workbook(data: bytes) -> DDWorkbook:
+    """記入済みの DD見積書から明細を読む（アクティブシート＋小計式が参照している続きのシート）。"""
+    wb = load_workbook(BytesIO(data), read_only=True)
+    try:
+        rows = list(wb.active.iter_rows(values_only=True))
+        items, category, refs, start = _read_page(rows)
+        sheets = 1
+        for name in refs:
+            if name not in wb.sheetnames:
+                continue
+            more, category, _, _ = _read_page(list(wb[name].iter_rows(values_only=True)), category)
+            items += more
+            sheets += 1
+        return DDWorkbook(_title(rows, start), items, sheets)
+    finally:
+        wb.close()
+
+# =========================
+# 並列読み取り（プロセスプール）
+# =========================
+_known: frozenset = frozenset()
+
+def _init_worker(known: frozenset):
+    global _known
+    _known = known
+
+def _load_file(path: str):
+    """戻り値: (パス, SHA-256, DDWorkbook or None, エラー文 or None)。取り込み済みの SHA-256 は読まない。"""
+    try:
+        data = Path(path).read_bytes()
+    except OSError as e:
+        return path, "", None, str(e)
+    sha = hashlib.sha256(data).hexdigest()
+    if sha in _known:
+        return path, sha, None, None
+    try:
+        return path, sha, read_dd_workbook(data), None
+    except Exception as e:  # 壊れた xlsx・想定外の形式はそのファイルだけ飛ばす
+        return path, sha, None, f"{type(e).__name__}: {e}"
+
+def expand_paths(paths: Iterable[str]) -> List[str]:
+    """ファイルはそのまま、ディレクトリは配下の *.xlsx（Excel のロックファイル ~$ は除く）。"""
+    out = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            out += sorted(str(x) for x in p.rglob("*.xlsx") if not x.name.startswith("~$"))
+        else:
+            out.append(str(p))
+    return out
+
+def _meta(items: List[Item]) -> dict:
+    taxable = sum(int(round(x.qty * x.unit_price)) for x in items)
+    tax = int(round(taxable * TAX_RATE))
+    return {"taxable": taxable, "tax": tax, "total": taxable + tax}
+
+def _save(archive: EstimateArchive, path: str, sha: str, book: DDWorkbook) -> int:
+    p = Path(path)
+    case = CaseSpec(extra_notes=book.title or p.stem)
+    created = datetime.fromtimestamp(p.stat().st_mtime).isoformat(timespec="seconds")
+    return archive.save(case, book.items, _meta(book.items), {"app": IMPORT_APP, "source": p.name},
+                        created_at=created, source_sha256=sha)
+
+def import_files(archive: EstimateArchive, paths: List[str], workers: Optional[int] = None,
+                 report=None) -> ImportStats:
+    """
+    paths を並列に読み、読めたものから順にアーカイブへ入れる。
+    workers: プロセス数（既定は CPU 数。1 ならプールを作らずこのプロセスで読む）。
+    report: 進捗を受け取る関数（ImportStats, 全件数）。REPORT_EVERY 件ごとと最後に呼ぶ。
+    """
+    stats = ImportStats()
+    seen = set(archive.imported_hashes())
+    known = frozenset(seen)
+    t0 = time.perf_counter()
+
+    def _consume(results):
+        for path, sha, book, err in results:
+            stats.files += 1
+            if err:
+                stats.errors.append((path, err))
+            elif sha in seen:
+                stats.duplicates += 1
+            elif not book.items:
+                stats.empty += 1
+            else:
+                _save(archive, path, sha, book)
+                seen.add(sha)
+                stats.imported += 1
+            if report and stats.files % REPORT_EVERY == 0:
+                stats.seconds = time.perf_counter() - t0
+                report(stats, len(paths))
+
+    if workers == 1 or len(paths) <= 1:
+        _init_worker(known)
+        _consume(map(_load_file, paths))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(known,)) as ex:
+            _consume(ex.map(_load_file, paths, chunksize=4))
+    stats.seconds = time.perf_counter() - t0
+    if report:
+        report(stats, len(paths))
+    return stats
+
+def _print_progress(stats: ImportStats, total: int):
+    print(f"{stats.files}/{total} files  取り込み {stats.imported} / 重複 {stats.duplicates} / "
+          f"明細なし {stats.empty} / エラー {len(stats.errors)}  {stats.files_per_sec:.1f} files/s", flush=True)
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m mitsumori.ddimport",
+                                 description="記入済みの DD見積書（xlsx）を見積アーカイブに取り込む")
+    ap.add_argument("paths", nargs="+", help="xlsx ファイルまたはディレクトリ（配下の *.xlsx）")
+    ap.add_argument("--db", default=None, help=f"アーカイブ DB（既定: $MITSUMORI_ARCHIVE_DB または {DEFAULT_DB_PATH}）")
+    ap.add_argument("--workers", type=int, default=None, help="読み取りのプロセス数（既定: CPU 数）")
+    args = ap.parse_args(argv)
+
+    paths = expand_paths(args.paths)
+    archive = open_archive(args.db)
+    try:
+        stats = import_files(archive, paths, args.workers, _print_progress)
+        for path, err in stats.errors:
+            print(f"  ✗ {path}: {err}")
+        print(f"アーカイブ: {len(archive)} 件（{archive.path}）")
+        return 1 if stats.errors else 0
+    finally:
+        archive.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+# ---------- 計算（短納期係数・管理費上限・消費税） ----------
+# 15〜40 行程度の通常の見積は、DataFrame ではなく整数円の列配列（EstimateTable）で計算する。
+# 行数が FAST_PATH_MAX_ROWS を超える場合や想定外の列構成の場合は従来の pandas 実装を使う。
+# 予算寄せ（scale_prices_to_budget）は mitsumori/budget.py。
+
+from array import array
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from mitsumori.items import Item, ITEM_COLUMNS
+
+TAX_RATE = 0.10
+MGMT_FEE_CAP_RATE = 0.15
+RUSH_K = 0.75
+
+MGMT_CATEGORY = "管理費"
+MGMT_TASK = "管理費（固定）"
+AMOUNT_COLUMN = "小計"
+FAST_PATH_MAX_ROWS = 200
+
+def rush_coeff(base_days: int, target_days: int) -> float:
+    if target_days >= base_days or base_days <= 0:
+        return 1.0
+    r = (base_days - target_days) / base_days
+    return round(1 + RUSH_K * r, 2)
+
+# =========================
+# 列配列テーブル
+# =========================
+class EstimateTable:
+    """見積明細の列配列。unit_price / amount（小計）は整数円の array('q')。"""
+    __slots__ = ("category", "task", "qty", "unit", "unit_price", "note", "amount")
+
+    def __init__(self, category: list, task: list, qty: list, unit: list,
+                 unit_price: array, note: list, amount: Optional[array] = None):
+        self.category = category
+        self.task = task
+        self.qty = qty
+        self.unit = unit
+        self.unit_price = unit_price
+        self.note = note
+        self.amount = amount
+
+    def __len__(self) -> int:
+        return len(self.category)
+
+    def copy(self) -> "EstimateTable":
+        return EstimateTable(
+            list(self.category), list(self.task), list(self.qty), list(self.unit),
+            array("q", self.unit_price), list(self.note),
+            None if self.amount is None else array("q", self.amount),
+        )
+
+    @classmethod
+    def from_items(cls, items: List[Item]) -> "EstimateTable":
+        return cls(
+            [x.category for x in items], [x.task for x in items], [x.qty for x in items],
+            [x.unit for x in items], array("q", [x.unit_price for x in items]),
+            [x.note for x in items],
+        )
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame) -> Optional["EstimateTable"]:
+        """高速経路に載せられる DataFrame なら変換する（載せられなければ None）。"""
+        cols = list(df.columns)
+        if cols != ITEM_COLUMNS and cols != ITEM_COLUMNS + [AMOUNT_COLUMN]:
+            return None
+        idx = df.index
+        if not (isinstance(idx, pd.RangeIndex) and idx.start == 0 and idx.step == 1):
+            return None
+        if not (pd.api.types.is_integer_dtype(df["unit_price"].dtype)
+                and pd.api.types.is_numeric_dtype(df["qty"].dtype)):
+            return None
+        qty = df["qty"].tolist()
+        if df["qty"].dtype.kind == "f" and not np.isfinite(df["qty"].to_numpy()).all():
+            return None
+        return cls(
+            df["category"].tolist(), df["task"].tolist(), qty, df["unit"].tolist(),
+            array("q", df["unit_price"].tolist()), df["note"].tolist(),
+        )
+
+    def to_items(self) -> List[Item]:
+        return [Item(*row) for row in zip(self.category, self.task, self.qty, self.unit,
+                                          self.unit_price, self.note)]
+
+    def to_df(self) -> pd.DataFrame:
+        """st.dataframe / Excel 出力用。"""
+        data = {
+            "category": np.array(self.category, dtype=object),
+            "task": np.array(self.task, dtype=object),
+            "qty": np.array(self.qty) if self.qty else np.array([], dtype=np.int64),
+            "unit": np.array(self.unit, dtype=object),
+            "unit_price": np.frombuffer(self.unit_price, dtype=np.int64).copy(),
+            "note": np.array(self.note, dtype=object),
+        }
+        if self.amount is not None:
+            data[AMOUNT_COLUMN] = np.frombuffer(self.amount, dtype=np.int64).copy()
+        return pd.DataFrame(data, copy=False)
+
+# =========================
+# 合計カーネル
+# =========================
+def compute_totals_table(t: EstimateTable, base_days: int, target_days: int) -> Tuple[EstimateTable, dict]:
+    accel = rush_coeff(base_days, target_days)
+    category, qty, price = t.category, t.qty, t.unit_price
+
+    amount = array("q")
+    mgmt_idx = -1
+    mgmt_current = 0
+    subtotal_after_rush = 0
+    for i in range(len(category)):
+        a = round(qty[i] * price[i])
+        if category[i] == MGMT_CATEGORY:
+            if mgmt_idx < 0:
+                mgmt_idx = i
+            mgmt_current += a
+        else:
+            a = round(a * accel)
+            subtotal_after_rush += a
+        amount.append(a)
+
+    mgmt_cap = int(round(subtotal_after_rush * MGMT_FEE_CAP_RATE))
+    mgmt_final = min(mgmt_current, mgmt_cap) if mgmt_current > 0 else mgmt_cap
+
+    out = t.copy()
+    out.amount = amount
+    if mgmt_idx >= 0:
+        out.unit_price[mgmt_idx] = mgmt_final
+        out.qty[mgmt_idx] = 1
+        amount[mgmt_idx] = mgmt_final
+    else:
+        out.category.append(MGMT_CATEGORY)
+        out.task.append(MGMT_TASK)
+        out.qty.append(1)
+        out.unit.append("式")
+        out.unit_price.append(mgmt_final)
+        out.note.append(np.nan)  # pandas.concat で欠損になるのと揃える
+        amount.append(mgmt_final)
+
+    taxable = sum(amount)
+    tax = int(round(taxable * TAX_RATE))
+    meta = {
+        "rush_coeff": accel,
+        "subtotal_after_rush_excl_mgmt": subtotal_after_rush,
+        "mgmt_fee_final": mgmt_final,
+        "taxable": taxable,
+        "tax": tax,
+        "total": taxable + tax,
+    }
+    return out, meta
+
+# =========================
+# DataFrame API（従来の呼び出し口）
+# =========================
+def _compute_totals_df(df_items: pd.DataFrame, base_days: int, target_days: int):
+    accel = rush_coeff(base_days, target_days)
+    df_items = df_items.copy()
+    df_items["小計"] = (df_items["qty"] * df_items["unit_price"]).round().astype(int)
+
+    is_mgmt = (df_items["category"] == "管理費")
+    df_items.loc[~is_mgmt, "小計"] = (df_items.loc[~is_mgmt, "小計"] * accel).round().astype(int)
+
+    mgmt_current = int(df_items.loc[is_mgmt, "小計"].sum()) if is_mgmt.any() else 0
+    subtotal_after_rush = int(df_items.loc[~is_mgmt, "小計"].sum())
+    mgmt_cap = int(round(subtotal_after_rush * MGMT_FEE_CAP_RATE))
+    mgmt_final = min(mgmt_current, mgmt_cap) if mgmt_current > 0 else mgmt_cap
+
+    if is_mgmt.any():
+        idx = df_items[is_mgmt].index[0]
+        df_items.at[idx, "unit_price"] = mgmt_final
+        df_items.at[idx, "qty"] = 1
+        df_items.at[idx, "小計"] = mgmt_final
+    else:
+        df_items = pd.concat([df_items, pd.DataFrame([{
+            "category": "管理費", "task": "管理費（固定）", "qty": 1, "unit": "式",
+            "unit_price": mgmt_final, "小計": mgmt_final
+        }])], ignore_index=True)
+
+    taxable = int(df_items["小計"].sum())
+    tax = int(round(taxable * TAX_RATE))
+    total = taxable + tax
+
+    meta = {
+        "rush_coeff": accel,
+        "subtotal_after_rush_excl_mgmt": subtotal_after_rush,
+        "mgmt_fee_final": mgmt_final,
+        "taxable": taxable,
+        "tax": tax,
+        "total": total,
+    }
+    return df_items, meta
+
+def _fast_table(df_items: pd.DataFrame) -> Optional[EstimateTable]:
+    if len(df_items) > FAST_PATH_MAX_ROWS:
+        return None
+    return EstimateTable.from_df(df_items)
+
+def compute_totals(df_items: pd.DataFrame, base_days: int, target_days: int):
+    t = _fast_table(df_items)
+    if t is None:
+        return _compute_totals_df(df_items, base_days, target_days)
+    out, meta = compute_totals_table(t, base_days, target_days)
+    return out.to_df(), meta
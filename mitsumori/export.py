@@ -0,0 +1,214 @@
+# ---------- Excel 出力（簡易フォーマット） ----------
+# st.download_button は再実行のたびに呼ばれるので、ブックの生成は内容ハッシュで覚えておき、
+# 表と meta が変わったときだけ作り直す。キャッシュには bytes をそのまま持ち、ヒット時はコピーせずに返す。
+# （download_button は memoryview を受け付けないため bytes で渡す。BytesIO を渡すと毎回 getvalue でコピーされる）
+# 数千行を超える見積は DataFrame.to_excel を通さず、列配列から 1 行ずつ書き出すストリーミング経路を使う
+# （xlsxwriter の constant_memory / openpyxl の write_only。書式はセル単位ではなく列単位で指定する）。
+
+import json
+import hashlib
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Optional, TypeVar, Union
+
+import pandas as pd
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+XLSX_CACHE_SIZE = 16
+STREAMING_MIN_ROWS = 2000  # これ以上の行数は estimate_xlsx が自動でストリーミング経路を使う
+
+EXPORT_COLUMNS = ["category", "task", "unit_price", "qty", "unit", "小計"]
+EXPORT_HEADERS = ["カテゴリ", "項目", "単価（円）", "数量", "単位", "金額（円）"]
+
+T = TypeVar("T")
+
+_xlsx_cache: "OrderedDict[str, object]" = OrderedDict()
+_xlsx_lock = threading.Lock()
+
+def content_digest(df: pd.DataFrame, meta: Optional[dict] = None, salt: str = "") -> str:
+    """列名・値・meta から作る内容ハッシュ。salt は出力形式の違い（簡易／テンプレ等）を区別するのに使う。"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(salt.encode("utf-8"))
+    h.update(repr(list(map(str, df.columns))).encode("utf-8"))
+    h.update(repr([df[c].tolist() for c in df.columns]).encode("utf-8"))
+    if meta is not None:
+        h.update(json.dumps(meta, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+def cached_bytes(digest: str, build: Callable[[], T]) -> T:
+    """
+    digest に対応する bytes を返す。無ければ build() で作って覚える（直近 XLSX_CACHE_SIZE 件）。
+    テンプレ出力のように (bytes, 付帯情報) の組を覚えたい場合もそのまま使える。
+    """
+    with _xlsx_lock:
+        data = _xlsx_cache.get(digest)
+        if data is not None:
+            _xlsx_cache.move_to_end(digest)
+            return data
+    data = build()
+    with _xlsx_lock:
+        _xlsx_cache[digest] = data
+        while len(_xlsx_cache) > XLSX_CACHE_SIZE:
+            _xlsx_cache.popitem(last=False)
+    return data
+
+def estimate_xlsx_bytes(df_items: pd.DataFrame, meta: dict) -> bytes:
+    """compute_totals 後の表を「見積もり」シート 1 枚の xlsx にする（合計 3 行付き）。"""
+    out = df_items.copy()
+    out = out[EXPORT_COLUMNS]
+    out.columns = EXPORT_HEADERS
+
+    buf = BytesIO()
+    try:
+        import xlsxwriter  # noqa: F401
+        engine = "xlsxwriter"
+    except ModuleNotFoundError:
+        engine = "openpyxl"
+
+    with pd.ExcelWriter(buf, engine=engine) as writer:
+        out.to_excel(writer, index=False, sheet_name="見積もり")
+
+        if engine == "xlsxwriter":
+            wb = writer.book
+            ws = writer.sheets["見積もり"]
+            fmt_int = wb.add_format({"num_format": "#,##0"})
+            ws.set_column("A:B", 20)
+            ws.set_column("C:C", 14, fmt_int)
+            ws.set_column("D:D", 8)
+            ws.set_column("E:E", 8)
+            ws.set_column("F:F", 14, fmt_int)
+            last_row = len(out) + 2
+            ws.write(last_row,   4, "小計（税抜）")
+            ws.write_number(last_row,   5, int(meta["taxable"]), fmt_int)
+            ws.write(last_row+1, 4, "消費税")
+            ws.write_number(last_row+1, 5, int(meta["tax"]), fmt_int)
+            ws.write(last_row+2, 4, "合計")
+            ws.write_number(last_row+2, 5, int(meta["total"]), fmt_int)
+        else:
+            ws = writer.book["見積もり"]
+            widths = {"A": 20, "B": 20, "C": 14, "D": 8, "E": 8, "F": 14}
+            for col, w in widths.items():
+                ws.column_dimensions[col].width = w
+            for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=3, max_col=3):
+                for cell in row:
+                    cell.number_format = '#,##0'
+            for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=6, max_col=6):
+                for cell in row:
+                    cell.number_format = '#,##0'
+            last_row = ws.max_row + 2
+            ws.cell(row=last_row, column=5, value="小計（税抜）")
+            ws.cell(row=last_row, column=6, value=int(meta["taxable"])).number_format = '#,##0'
+            ws.cell(row=last_row+1, column=5, value="消費税")
+            ws.cell(row=last_row+1, column=6, value=int(meta["tax"])).number_format = '#,##0'
+            ws.cell(row=last_row+2, column=5, value="合計")
+            ws.cell(row=last_row+2, column=6, value=int(meta["total"])).number_format = '#,##0'
+
+    return buf.getvalue()
+
+# =========================
+# ストリーミング出力（大きな見積向け）
+# =========================
+_COL_WIDTHS = (20, 20, 14, 8, 8, 14)
+_INT_COLS = (2, 5)  # 単価・金額
+
+def _stream_rows(df_items: pd.DataFrame):
+    # 列ごとに Python のリストへ一度だけ変換し、行は zip で組む（行ごとの Series を作らない）
+    cols = [df_items[c].tolist() for c in EXPORT_COLUMNS]
+    for cat, task, price, qty, unit, amt in zip(*cols):
+        yield (str(cat), str(task), int(price), qty, str(unit), int(amt))
+
+def _stream_xlsxwriter(df_items: pd.DataFrame, meta: dict, target):
+    import xlsxwriter
+    wb = xlsxwriter.Workbook(target, {"constant_memory": True})
+    ws = wb.add_worksheet("見積もり")
+    fmt_int = wb.add_format({"num_format": "#,##0"})
+    fmt_head = wb.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    for c, w in enumerate(_COL_WIDTHS):
+        ws.set_column(c, c, w, fmt_int if c in _INT_COLS else None)
+    ws.write_row(0, 0, EXPORT_HEADERS, fmt_head)
+    # write_row は値ごとに型を判定するので、型の決まっている列は write_string / write_number を直接呼ぶ
+    ws_str, ws_num = ws.write_string, ws.write_number
+    r = 0
+    for r, (cat, task, price, qty, unit, amt) in enumerate(_stream_rows(df_items), start=1):
+        ws_str(r, 0, cat)
+        ws_str(r, 1, task)
+        ws_num(r, 2, price)
+        ws_num(r, 3, qty)
+        ws_str(r, 4, unit)
+        ws_num(r, 5, amt)
+    last_row = r + 2
+    for i, (label, key) in enumerate((("小計（税抜）", "taxable"), ("消費税", "tax"), ("合計", "total"))):
+        ws.write_string(last_row + i, 4, label)
+        ws.write_number(last_row + i, 5, int(meta[key]), fmt_int)
+    wb.close()
+
+def _stream_openpyxl(df_items: pd.DataFrame, meta: dict, target):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("見積もり")
+    for c, w in enumerate(_COL_WIDTHS, start=1):
+        ws.column_dimensions[get_column_letter(c)].width = w
+
+    def _int_cell(v):
+        cell = WriteOnlyCell(ws, value=v)
+        cell.number_format = "#,##0"
+        return cell
+
+    head = []
+    for h in EXPORT_HEADERS:
+        cell = WriteOnlyCell(ws, value=h)
+        cell.font = Font(bold=True)
+        head.append(cell)
+    ws.append(head)
+    for cat, task, price, qty, unit, amt in _stream_rows(df_items):
+        ws.append([cat, task, _int_cell(price), qty, unit, _int_cell(amt)])
+    ws.append([])
+    for label, key in (("小計（税抜）", "taxable"), ("消費税", "tax"), ("合計", "total")):
+        ws.append([None, None, None, None, label, _int_cell(int(meta[key]))])
+    wb.save(target)
+
+def write_estimate_xlsx_stream(df_items: pd.DataFrame, meta: dict, target: Union[str, BinaryIO],
+                               engine: Optional[str] = None) -> None:
+    """
+    見積をストリーミングで xlsx に書く。target はパスか書き込み可能なファイルオブジェクト。
+    engine: "xlsxwriter"（既定。無ければ openpyxl）/ "openpyxl"。
+    """
+    if engine is None:
+        try:
+            import xlsxwriter  # noqa: F401
+            engine = "xlsxwriter"
+        except ModuleNotFoundError:
+            engine = "openpyxl"
+    if engine == "xlsxwriter":
+        _stream_xlsxwriter(df_items, meta, target)
+    else:
+        _stream_openpyxl(df_items, meta, target)
+
+def estimate_xlsx_stream_bytes(df_items: pd.DataFrame, meta: dict, engine: Optional[str] = None) -> bytes:
+    buf = BytesIO()
+    write_estimate_xlsx_stream(df_items, meta, buf, engine)
+    return buf.getvalue()
+
+def estimate_xlsx(df_items: pd.DataFrame, meta: dict, streaming: Optional[bool] = None) -> bytes:
+    """
+    estimate_xlsx_bytes のキャッシュ付き版（同じ表・meta なら生成しない）。
+    streaming=None のときは STREAMING_MIN_ROWS 行以上でストリーミング経路に切り替える。
+    """
+    if streaming is None:
+        streaming = len(df_items) >= STREAMING_MIN_ROWS
+    digest = content_digest(df_items[EXPORT_COLUMNS], meta, salt="estimate:stream" if streaming else "estimate")
+    build = estimate_xlsx_stream_bytes if streaming else estimate_xlsx_bytes
+    return cached_bytes(digest, lambda: build(df_items, meta))
+
+def frame_xlsx(df: pd.DataFrame, sheet_name: str = "見積もり") -> bytes:
+    """DataFrame をそのまま 1 シートに書いた xlsx（書式なし）。キャッシュ付き。"""
+    def _build() -> bytes:
+        buf = BytesIO()
+        with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
+            df.to_excel(writer, index=False, sheet_name=sheet_name)
+        return buf.getvalue()
+    return cached_bytes(content_digest(df, salt=f"frame:{sheet_name}"), _build)
@@ -0,0 +1,121 @@
+# ---------- 見積項目（型付き） ----------
+# LLM 応答 → Item のリスト → DataFrame の順に、途中で JSON 文字列に戻さずに受け渡す。
+# 文字列化は LLM に渡すとき（正規化パスのプロンプト）と保存するときだけ。
+
+import json
+import math
+import unicodedata
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from mitsumori.parsing import coerce_json_like, extract_items
+
+ITEM_COLUMNS = ["category", "task", "qty", "unit", "unit_price", "note"]
+TEXT_COLUMNS = ["category", "task", "unit", "note"]
+
+@dataclass(slots=True)
+class Item:
+    category: str = ""
+    task: str = ""
+    qty: float = 0.0
+    unit: str = ""
+    unit_price: int = 0
+    note: str = ""
+
+    def to_dict(self) -> dict:
+        # dataclasses.asdict は deepcopy を挟むので遅い。フィールドは全てスカラーなので直接組み立てる
+        return {"category": self.category, "task": self.task, "qty": self.qty,
+                "unit": self.unit, "unit_price": self.unit_price, "note": self.note}
+
+def _numeric_text(v):
+    # 「５０，０００円」「¥120,000」のような全角・桁区切り付きの数値文字列を数値化できる形に寄せる
+    if isinstance(v, str):
+        t = unicodedata.normalize("NFKC", v)
+        return t.replace(",", "").replace("円", "").replace("¥", "").strip()
+    return v
+
+def _to_number(v):
+    # pd.to_numeric(errors="coerce").fillna(0) 相当（int はそのまま保つ）
+    if isinstance(v, bool):
+        return int(v)
+    if isinstance(v, int):
+        return v
+    if isinstance(v, float):
+        return 0 if math.isnan(v) else v
+    if isinstance(v, str):
+        t = _numeric_text(v)
+        try:
+            return int(t)
+        except ValueError:
+            pass
+        try:
+            f = float(t)
+        except ValueError:
+            return 0
+        return 0 if math.isnan(f) else f
+    return 0
+
+def _to_int(v) -> int:
+    n = _to_number(v)
+    try:
+        return int(n)
+    except (OverflowError, ValueError):
+        return 0
+
+def to_item(x: dict) -> Item:
+    qty = x.get("qty", 0)
+    price = x.get("unit_price", 0)
+    return Item(
+        str(x.get("category", "")),
+        str(x.get("task", "")),
+        qty if type(qty) is int else _to_number(qty),
+        str(x.get("unit", "")),
+        price if type(price) is int else _to_int(price),
+        str(x.get("note", "")),
+    )
+
+def to_items(raw_items) -> List[Item]:
+    # 文字列や None が混じっても安全に拾う（dict 以外の要素は捨てる）
+    return [to_item(x) for x in raw_items or [] if isinstance(x, dict)]
+
+def parse_items(raw: str) -> List[Item]:
+    """LLM の生テキストから Item のリストを直接作る（中間の JSON 文字列なし）。"""
+    return to_items(extract_items(coerce_json_like(raw or "")))
+
+def items_to_json(items: List[Item]) -> str:
+    """LLM プロンプト・保存用の境界でだけ使う直列化。"""
+    return json.dumps({"items": [x.to_dict() for x in items]}, ensure_ascii=False)
+
+def items_to_df(items: List[Item]) -> pd.DataFrame:
+    if not items:
+        return pd.DataFrame({c: pd.Series([], dtype=object if c in TEXT_COLUMNS else "int64")
+                             for c in ITEM_COLUMNS})
+    # 列配列を直接作って渡す（行 dict からの推論や astype のコピーを避ける）
+    category, task, qty, unit, unit_price, note = zip(
+        *[(x.category, x.task, x.qty, x.unit, x.unit_price, x.note) for x in items]
+    )
+    return pd.DataFrame({
+        "category": np.array(category, dtype=object),
+        "task": np.array(task, dtype=object),
+        "qty": np.array(qty),
+        "unit": np.array(unit, dtype=object),
+        "unit_price": np.array(unit_price, dtype=np.int64),
+        "note": np.array(note, dtype=object),
+    }, copy=False)
+
+def df_from_items_json(items_json: str) -> pd.DataFrame:
+    # 保存済み JSON 文字列からの復元用（JSONの壊れに耐える）
+    try:
+        data = json.loads(items_json) if items_json else {}
+    except Exception:
+        data = {}
+    return items_to_df(to_items(extract_items(data)))
+
+def df_to_items(df: pd.DataFrame) -> List[Item]:
+    # compute_totals 後の表（小計列・追加された管理費行の欠損 note を含む）からも戻せるようにする
+    cols = [c for c in ITEM_COLUMNS if c in df.columns]
+    recs = df[cols].to_dict("records")
+    return to_items([{k: ("" if k in TEXT_COLUMNS and pd.isna(v) else v) for k, v in r.items()} for r in recs])
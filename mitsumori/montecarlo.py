@@ -0,0 +1,150 @@
+# ---------- 価格レンジ（複数サンプルの P10 / P50 / P90） ----------
+# 同じプロンプトで N 個の応答を取り（OpenAI は n-choices の 1 リクエスト、Gemini は並列呼び出し）、
+# (category, task) で行を揃えて、行ごと・合計の分位点を NumPy でまとめて求める。
+# 合計は compute_totals と同じ丸め（短納期係数・管理費上限・消費税）をサンプルごとに適用する。予算寄せは行わない。
+
+import asyncio
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from mitsumori.items import Item, to_items
+from mitsumori.continuation import parse_items_truncation
+from mitsumori.estimate import rush_coeff, MGMT_CATEGORY, MGMT_FEE_CAP_RATE, TAX_RATE
+from mitsumori.budget import line_amounts
+
+RANGE_SAMPLES = 5
+RANGE_TEMPERATURE = 0.7
+PERCENTILES = (10, 50, 90)
+
+def sample_parallel(call: Callable[[str], str], prompt: str, n: int) -> List[str]:
+    """n-choices が使えないプロバイダ向け：同じプロンプトを n 本並列に投げる（失敗した回は空文字）。"""
+    def _one(_):
+        try:
+            return call(prompt) or ""
+        except Exception:
+            return ""
+    with ThreadPoolExecutor(max_workers=max(1, n)) as ex:
+        return list(ex.map(_one, range(n)))
+
+async def asample_parallel(acall: Callable[[str], Awaitable[str]], prompt: str, n: int) -> List[str]:
+    """sample_parallel の非同期版：n 本を同じイベントループで同時に待つ（スレッドは立てない）。"""
+    async def _one():
+        try:
+            return await acall(prompt) or ""
+        except Exception:
+            return ""
+    return list(await asyncio.gather(*(_one() for _ in range(n))))
+
+def samples_to_items(raws: Sequence[str]) -> List[List[Item]]:
+    # 途中切れのサンプルも閉じている item までは使う。1 件も取れなかったサンプルは捨てる
+    out = []
+    for raw in raws:
+        items = to_items(parse_items_truncation(raw)[0])
+        if items:
+            out.append(items)
+    return out
+
+def _key(x: Item) -> Tuple[str, str]:
+    return (unicodedata.normalize("NFKC", x.category).strip(),
+            unicodedata.normalize("NFKC", x.task).strip())
+
+def align_samples(samples: Sequence[List[Item]]):
+    """
+    (category, task) で行を揃える。戻り値: (keys, units, qty, unit_price)。
+    qty / unit_price は shape (サンプル数, 行数) で、そのサンプルに無い行は NaN。
+    同じサンプル内で同じキーが重複した場合は数量を足し、単価は金額加重で 1 行にまとめる。
+    """
+    index, keys, units = {}, [], []
+    for items in samples:
+        for x in items:
+            k = _key(x)
+            if k not in index:
+                index[k] = len(keys)
+                keys.append(k)
+                units.append(x.unit)
+    qty = np.full((len(samples), len(keys)), np.nan)
+    amount = np.full((len(samples), len(keys)), np.nan)
+    for s, items in enumerate(samples):
+        for x in items:
+            j = index[_key(x)]
+            if np.isnan(qty[s, j]):
+                qty[s, j] = 0.0
+                amount[s, j] = 0.0
+            qty[s, j] += float(x.qty)
+            amount[s, j] += float(x.qty) * float(x.unit_price)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price = np.where(qty > 0, amount / qty, 0.0)
+    price = np.where(np.isnan(qty), np.nan, np.rint(price))
+    return keys, units, qty, price
+
+def _nan_percentile(a: np.ndarray, pct: Sequence[int]) -> np.ndarray:
+    """np.nanpercentile(a, pct, axis=0)（linear 補間）と同じ値。列ごとの Python ループを避けるため並べ替えで求める。"""
+    srt = np.sort(a, axis=0)  # NaN は末尾に寄る
+    cnt = (~np.isnan(a)).sum(axis=0)
+    cols = np.arange(a.shape[1])
+    out = np.empty((len(pct), a.shape[1]))
+    for i, p in enumerate(pct):
+        pos = np.maximum(cnt - 1, 0) * (p / 100.0)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, np.maximum(cnt - 1, 0))
+        w = pos - lo
+        out[i] = srt[lo, cols] * (1 - w) + srt[hi, cols] * w
+    out[:, cnt == 0] = np.nan
+    return out
+
+def price_bands(samples: Sequence[List[Item]], base_days: int, target_days: int,
+                percentiles: Sequence[int] = PERCENTILES) -> dict:
+    """
+    戻り値:
+      "n": サンプル数,
+      "lines": 行ごとの DataFrame（category, task, unit, 出現率, 単価/金額の各分位点）,
+      "taxable" / "total": {p: 値} の分位点（サンプルごとに compute_totals 相当で合計したもの）
+    """
+    keys, units, qty, price = align_samples(samples)
+    n = qty.shape[0]
+    if n == 0 or not keys:
+        return {"n": n, "lines": pd.DataFrame(), "taxable": {}, "total": {}}
+
+    accel = rush_coeff(base_days, target_days)
+    is_mgmt = np.array([k[0] == MGMT_CATEGORY for k in keys])
+    present = ~np.isnan(qty)
+    q0 = np.nan_to_num(qty)
+    p0 = np.nan_to_num(price)
+
+    # サンプルごとの合計（compute_totals と同じ丸め）。行の無いサンプルは金額 0
+    amount = np.where(is_mgmt, np.rint(q0 * p0), line_amounts(q0, p0, accel))
+    sub = np.where(is_mgmt, 0.0, amount).sum(axis=1)
+    # 管理費は先頭行が min(現状, 上限) に置き換わり、2 行目以降はそのまま残る
+    mgmt_mask = is_mgmt & present
+    current = np.where(mgmt_mask, amount, 0.0).sum(axis=1)
+    first = np.where(mgmt_mask.any(axis=1), amount[np.arange(n), mgmt_mask.argmax(axis=1)], 0.0)
+    cap = np.rint(sub * MGMT_FEE_CAP_RATE)
+    taxable = sub + np.where(current > 0, np.minimum(current, cap), cap) + (current - first)
+    total = taxable + np.rint(taxable * TAX_RATE)
+
+    pct = list(percentiles)
+    line_amount = np.where(present, amount, np.nan)
+    price_q = _nan_percentile(price, pct)
+    amount_q = _nan_percentile(line_amount, pct)
+    lines = {
+        "category": [k[0] for k in keys],
+        "task": [k[1] for k in keys],
+        "unit": units,
+        "出現率": present.mean(axis=0),
+    }
+    for i, p in enumerate(pct):
+        lines[f"単価P{p}"] = np.rint(price_q[i]).astype(np.int64)
+    for i, p in enumerate(pct):
+        lines[f"金額P{p}"] = np.rint(amount_q[i]).astype(np.int64)
+    tq = np.percentile(taxable, pct)
+    gq = np.percentile(total, pct)
+    return {
+        "n": n,
+        "lines": pd.DataFrame(lines),
+        "taxable": {p: int(round(v)) for p, v in zip(pct, tq)},
+        "total": {p: int(round(v)) for p, v in zip(pct, gq)},
+    }
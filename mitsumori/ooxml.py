@@ -0,0 +1,568 @@
+# ---------- DD見積書テンプレ出力：シート XML の直接書き換え ----------
+# openpyxl はテンプレの全セル・スタイル・結合セルを読み込んで保存し直すので、明細 50 行ほどを書くだけでも
+# 重いテンプレでは秒単位かかる。ここでは xlsx（zip）の中で対象シートの明細行と小計セルだけを書き換え、
+# ほかのパーツ（別シート・画像・テーマ・結合セル定義など）は圧縮済みのバイト列をそのまま写す。
+# 書く内容（値・式・#,##0・見出しの太字）は mitsumori/template.py の openpyxl 版と同じ。
+# 見出しの太字はセルの既存フォントに <b/> を足したスタイルを追加する（書体・サイズは変えない）。
+# cache_values=True では金額・小計の式にキャッシュ値（<v>）も書く（式が計算するのと同じ 数量×単価 の値。丸めない）。
+# 再計算しない読み手（pandas・会計取込・プレビュー）でも金額が見える。金額列にテンプレ独自の式がある行は値を書かない。
+# 対象シートのそれ以外の式（税・総額など）は、テンプレに残っていた古いキャッシュ値を落として書く（Excel は開くときに再計算）。
+# テンプレごとの下準備（対象シートの特定・明細行の分解・スタイル追加・calcChain の除去）は SHA-256 ごとに 1 回。
+# 枠を超えた分を続きのシートに送るとき（max_pages > 1）は、下準備済みの書き込み前シートを複製して使う
+# （画像・ハイパーリンク等の別パーツ参照は続きのシートには持たせない）。
+# 共有式の親セルを消す必要がある等、ここで扱わない構造のテンプレは UnsupportedTemplate を投げる
+# （fill_template は openpyxl 版に切り替える）。
+
+import re
+import zlib
+import struct
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from xml.sax.saxutils import escape, unescape
+
+import pandas as pd
+from openpyxl.utils import get_column_letter
+
+from mitsumori.template import (
+    TemplateError, TemplateExport, TemplateInfo, continuation_titles, layout_pages, sheet_ref,
+    template_digest, template_info,
+)
+
+PLAN_CACHE_SIZE = 8
+DEFLATE_LEVEL = 6
+NUMFMT_THOUSANDS = "3"  # 組み込み表示形式 #,##0
+
+class UnsupportedTemplate(Exception):
+    """XML 直接書き換えでは扱えないテンプレ（openpyxl 版で出力する）。"""
+
+# =========================
+# zip（圧縮済みバイト列のまま写す）
+# =========================
+_LOCAL = struct.Struct("<4s5H3L2H")      # ローカルヘッダ（30 バイト）
+_CENTRAL = struct.Struct("<4s6H3L5H2L")  # 中央ディレクトリ（46 バイト）
+_EOCD = struct.Struct("<4s4H2LH")        # 終端レコード（22 バイト）
+
+@dataclass
+class _Member:
+    name: str
+    local: memoryview   # ローカルヘッダ＋圧縮データ（＋データ記述子）
+    central: bytes      # 中央ディレクトリのエントリ（オフセットは書き出し時に差し替える）
+
+def _read_members(raw: bytes) -> List[_Member]:
+    eocd = raw.rfind(b"PK\x05\x06", max(0, len(raw) - 65557))
+    if eocd < 0:
+        raise UnsupportedTemplate("zip の終端レコードがありません")
+    _, _, _, _, count, cd_size, cd_off, _ = _EOCD.unpack_from(raw, eocd)
+    if count == 0xFFFF or cd_off == 0xFFFFFFFF:
+        raise UnsupportedTemplate("zip64 は未対応")
+    entries = []
+    p = cd_off
+    for _ in range(count):
+        f = _CENTRAL.unpack_from(raw, p)
+        if f[0] != b"PK\x01\x02":
+            raise UnsupportedTemplate("zip の中央ディレクトリが壊れています")
+        flags, name_len, extra_len, cmt_len, local_off = f[3], f[10], f[11], f[12], f[16]
+        name = raw[p + 46:p + 46 + name_len].decode("utf-8" if flags & 0x800 else "cp437")
+        end = p + 46 + name_len + extra_len + cmt_len
+        entries.append((local_off, name, raw[p:end]))
+        p = end
+    # 各メンバーのローカル部分は「次のメンバーの先頭（最後は中央ディレクトリ）」まで
+    entries.sort()
+    view = memoryview(raw)
+    bounds = [e[0] for e in entries[1:]] + [cd_off]
+    return [_Member(name, view[off:stop], central) for (off, name, central), stop in zip(entries, bounds)]
+
+def _read_part(m: _Member) -> bytes:
+    f = _LOCAL.unpack_from(m.local, 0)
+    method, csize, name_len, extra_len = f[3], f[7], f[9], f[10]
+    csize = struct.unpack_from("<L", m.central, 20)[0] or csize  # データ記述子付きはローカル側が 0
+    data = bytes(m.local[30 + name_len + extra_len:30 + name_len + extra_len + csize])
+    if method == 0:
+        return data
+    if method == 8:
+        return zlib.decompress(data, -15)
+    raise UnsupportedTemplate(f"未対応の圧縮方式: {method}")
+
+def _new_member(name: str, data: bytes, like: _Member) -> _Member:
+    """data を deflate して、like と同じ日時のメンバーを作る。"""
+    nb = name.encode("utf-8")
+    flags = 0x800 if not nb.isascii() else 0
+    c = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15)
+    cdata = c.compress(data) + c.flush()
+    crc = zlib.crc32(data)
+    mtime, mdate = struct.unpack_from("<2H", like.central, 12)
+    local = _LOCAL.pack(b"PK\x03\x04", 20, flags, 8, mtime, mdate, crc, len(cdata), len(data), len(nb), 0) + nb + cdata
+    central = _CENTRAL.pack(b"PK\x01\x02", 20, 20, flags, 8, mtime, mdate, crc, len(cdata), len(data),
+                            len(nb), 0, 0, 0, 0, 0, 0) + nb
+    return _Member(name, memoryview(local), central)
+
+def _write_zip(members: List[_Member]) -> bytes:
+    parts, central, off = [], [], 0
+    for m in members:
+        parts.append(m.local)
+        central.append(m.central[:42] + struct.pack("<L", off) + m.central[46:])
+        off += len(m.local)
+    cd = b"".join(central)
+    parts.append(cd)
+    parts.append(_EOCD.pack(b"PK\x05\x06", 0, 0, len(central), len(central), len(cd), off, 0))
+    return b"".join(parts)
+
+# =========================
+# XML の小道具（正規表現で必要な要素だけ触る）
+# =========================
+_ATTR_RE = re.compile(r'([\w:]+)="([^"]*)"')
+_ROW_RE = re.compile(r'<row\b([^>]*?)(?:/>|>(.*?)</row>)', re.S)
+_CELL_RE = re.compile(r'<c\b([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+_COL_RE = re.compile(r'[A-Z]+')
+_ILLEGAL_XML = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _attrs(s: str) -> Dict[str, str]:
+    return dict(_ATTR_RE.findall(s))
+
+def _set_attr(tag: str, name: str, value: str) -> str:
+    """開始タグ（"<xf ...>" / "<xf .../>"）の属性を上書き／追加する。"""
+    pat = re.compile(r'(\s%s=")[^"]*(")' % re.escape(name))
+    if pat.search(tag):
+        return pat.sub(lambda m: m.group(1) + value + m.group(2), tag, count=1)
+    end = len(tag) - (2 if tag.endswith("/>") else 1)
+    return f'{tag[:end]} {name}="{value}"{tag[end:]}'
+
+def _col_index(letters: str) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+def _text(v: str) -> str:
+    v = _ILLEGAL_XML.sub("", v)
+    space = ' xml:space="preserve"' if v != v.strip() else ""
+    return f"<is><t{space}>{escape(v)}</t></is>"
+
+# =========================
+# テンプレごとの下準備
+# =========================
+@dataclass
+class _Row:
+    attrs: str                 # <row> の属性（r 以外。spans は書き換え後にずれるので落とす）
+    cells: Dict[int, str]      # 列番号 → <c> 要素（そのまま書き戻す）
+    styles: Dict[int, str]     # 列番号 → s 属性
+
+@dataclass
+class _Plan:
+    info: TemplateInfo
+    members: List[_Member]
+    sheet_index: int           # members の中の対象シート
+    head: str                  # 明細枠より前（<sheetData> の手前の行まで）
+    tail: str                  # 小計行より後
+    rows: Dict[int, _Row]      # 明細枠〜小計行の既存の行
+    bold: Dict[str, str]       # s → 太字にした s
+    thousands: Dict[str, str]  # s → #,##0 にした s
+    foreign: FrozenSet[int]    # 金額列の既存の式が「同じ行の 数量×単価」ではない行（キャッシュ値を計算できない）
+    book: Dict[str, str]       # 書き換え後の workbook.xml / rels / [Content_Types].xml（続きのシートを足すときの元）
+    sheet_names: List[str]
+    sheet_rel: Dict[str, str]  # 対象シートの Relationship 属性（Type を続きのシートに使う）
+    rid_attr: str              # <sheet> の r:id 属性名（接頭辞付き）
+    clone: Optional[Tuple[str, str]] = None  # 続きのシート用の head / tail（初回に作って覚える）
+
+_plans: "OrderedDict[str, _Plan]" = OrderedDict()
+_plans_lock = threading.Lock()
+
+def _active_sheet(parts: Dict[str, bytes], title: str):
+    """戻り値: (シートのパーツ名, 全シート名, シートの Relationship 属性, r:id の属性名)"""
+    wb = parts["xl/workbook.xml"].decode("utf-8")
+    m = re.search(r'<workbookView\b[^>]*?\bactiveTab="(\d+)"', wb)
+    tab = int(m.group(1)) if m else 0
+    sheets = [_attrs(a) for a in re.findall(r'<sheet\b([^>]*?)/?>', wb)]
+    if tab >= len(sheets):
+        raise UnsupportedTemplate("アクティブシートが見つかりません")
+    names = [unescape(a.get("name", ""), {"&quot;": '"', "&apos;": "'"}) for a in sheets]
+    rid_attr = next((k for k in sheets[tab] if k.endswith(":id")), None)
+    if names[tab] != title or rid_attr is None:
+        raise UnsupportedTemplate("アクティブシートの対応が取れません")
+    rels = parts["xl/_rels/workbook.xml.rels"].decode("utf-8")
+    for tag in re.findall(r'<Relationship\b[^>]*?/?>', rels):
+        ra = _attrs(tag)
+        if ra.get("Id") == sheets[tab][rid_attr]:
+            if not ra.get("Type", "").endswith("/worksheet"):
+                raise UnsupportedTemplate("アクティブシートがワークシートではありません")
+            target = ra["Target"]
+            part = target.lstrip("/") if target.startswith("/") else "xl/" + target
+            return part, names, ra, rid_attr
+    raise UnsupportedTemplate("シートのリレーションが見つかりません")
+
+def _drop_cached_value(cell: str) -> str:
+    """式セルの古いキャッシュ値（<v>）と結果の型（t）を落とす。式のないセルはそのまま。"""
+    if "<f" not in cell:
+        return cell
+    cell = re.sub(r'<v>.*?</v>|<v\s*/>', "", cell, flags=re.S)
+    i = cell.index(">") + 1
+    return re.sub(r'\st="[^"]*"', "", cell[:i], count=1) + cell[i:]
+
+def _drop_cached_values(xml: str) -> str:
+    return _CELL_RE.sub(lambda m: _drop_cached_value(m.group(0)), xml)
+
+def _split_sheet(xml: str, first: int, last: int):
+    """sheetData のうち first〜last 行を分解し、前後は文字列のまま残す。"""
+    sd = xml.find("<sheetData>")
+    sd_end = xml.find("</sheetData>")
+    if sd < 0 or sd_end < 0:
+        raise UnsupportedTemplate("sheetData が見つかりません")
+    pos = sd + len("<sheetData>")
+    cut_from, cut_to = None, None
+    rows: Dict[int, _Row] = {}
+    for m in _ROW_RE.finditer(xml, pos, sd_end):
+        a = _attrs(m.group(1))
+        if "r" not in a:
+            raise UnsupportedTemplate("行番号の無い行があります")
+        r = int(a["r"])
+        if r < first:
+            continue
+        if r > last:
+            cut_to = m.start()
+            break
+        if cut_from is None:
+            cut_from = m.start()
+        cells, styles = {}, {}
+        for cm in _CELL_RE.finditer(m.group(2) or ""):
+            ca = _attrs(cm.group(1))
+            if "r" not in ca:
+                raise UnsupportedTemplate("セル番地の無いセルがあります")
+            c = _col_index(_COL_RE.match(ca["r"]).group(0))
+            cells[c] = cm.group(0)
+            styles[c] = ca.get("s", "0")
+        keep = " ".join(f'{k}="{v}"' for k, v in a.items() if k not in ("r", "spans"))
+        rows[r] = _Row(keep, cells, styles)
+    if cut_from is None:
+        cut_from = cut_to if cut_to is not None else sd_end
+    if cut_to is None:
+        cut_to = sd_end
+    return xml[:cut_from], xml[cut_to:], rows
+
+def _derive_styles(styles_xml: str, want_bold, want_thousands):
+    """cellXfs に「太字」「#,##0」の派生スタイルを足す。戻り値: (新しい styles.xml, 太字 map, #,##0 map)"""
+    m = re.search(r'(<cellXfs\b[^>]*>)(.*?)(</cellXfs>)', styles_xml, re.S)
+    f = re.search(r'(<fonts\b[^>]*>)(.*?)(</fonts>)', styles_xml, re.S)
+    if not m or not f:
+        raise UnsupportedTemplate("styles.xml の cellXfs / fonts が見つかりません")
+    xfs = re.findall(r'<xf\b[^>]*?(?:/>|>.*?</xf>)', m.group(2), re.S)
+    fonts = re.findall(r'<font\b[^>]*?(?:/>|>.*?</font>)', f.group(2), re.S)
+    new_xfs, new_fonts = [], []
+    bold, thousands = {}, {}
+
+    def xf_of(s: str) -> str:
+        i = int(s)
+        if i >= len(xfs):
+            raise UnsupportedTemplate(f"スタイル番号 {s} が cellXfs にありません")
+        return xfs[i]
+
+    def add_xf(xf: str) -> str:
+        new_xfs.append(xf)
+        return str(len(xfs) + len(new_xfs) - 1)
+
+    for s in sorted(set(want_bold), key=int):
+        xf = xf_of(s)
+        font_id = int(_attrs(xf[:xf.index(">") + 1]).get("fontId", "0"))
+        font = fonts[font_id] if font_id < len(fonts) else "<font/>"
+        if re.search(r'<b(?:\s+val="(?:1|true)")?\s*/>', font):
+            bold[s] = s
+            continue
+        font = re.sub(r'<b\b[^>]*/>', "", font)  # <b val="0"/> など
+        if "</font>" not in font:
+            bfont = font[:font.rindex("/>")].rstrip() + "><b/></font>"
+        else:
+            i = font.index(">") + 1
+            bfont = font[:i] + "<b/>" + font[i:]
+        new_fonts.append(bfont)
+        head_end = xf.index(">") + 1
+        head = _set_attr(_set_attr(xf[:head_end], "fontId", str(len(fonts) + len(new_fonts) - 1)), "applyFont", "1")
+        bold[s] = add_xf(head + xf[head_end:])
+    for s in sorted(set(want_thousands), key=int):
+        xf = xf_of(s)
+        head_end = xf.index(">") + 1
+        if _attrs(xf[:head_end]).get("numFmtId") == NUMFMT_THOUSANDS:
+            thousands[s] = s
+            continue
+        head = _set_attr(_set_attr(xf[:head_end], "numFmtId", NUMFMT_THOUSANDS), "applyNumberFormat", "1")
+        thousands[s] = add_xf(head + xf[head_end:])
+
+    if not new_xfs:
+        return None, bold, thousands
+    out = styles_xml
+    if new_fonts:
+        fonts_open = _set_attr(f.group(1), "count", str(len(fonts) + len(new_fonts)))
+        out = out.replace(f.group(0), fonts_open + f.group(2) + "".join(new_fonts) + f.group(3), 1)
+    m = re.search(r'(<cellXfs\b[^>]*>)(.*?)(</cellXfs>)', out, re.S)
+    xfs_open = _set_attr(m.group(1), "count", str(len(xfs) + len(new_xfs)))
+    out = out.replace(m.group(0), xfs_open + m.group(2) + "".join(new_xfs) + m.group(3), 1)
+    return out, bold, thousands
+
+def _full_calc_on_load(wb: str) -> str:
+    """数式のキャッシュ値を持たないので、Excel で開いたときに再計算させる。"""
+    m = re.search(r'<calcPr\b[^>]*?/?>', wb)
+    if m:
+        return wb.replace(m.group(0), _set_attr(m.group(0), "fullCalcOnLoad", "1"), 1)
+    # calcPr は definedNames の直後（無ければ externalReferences → functionGroups → sheets の直後）に置く
+    for tag in ("definedNames", "externalReferences", "functionGroups", "sheets"):
+        m = re.search(r'</%s>|<%s\b[^>]*/>' % (tag, tag), wb)
+        if m:
+            return wb[:m.end()] + '<calcPr fullCalcOnLoad="1"/>' + wb[m.end():]
+    raise UnsupportedTemplate("workbook.xml に sheets がありません")
+
+def _is_line_product(formula: str, r: int, q: str, p: str) -> bool:
+    f = re.sub(r"\$(?=[A-Z])", "", unescape(formula).replace(" ", "").upper()).lstrip("=")
+    return f in (f"{q}{r}*{p}{r}", f"{p}{r}*{q}{r}")
+
+def _foreign_amount_rows(rows: Dict[int, _Row], info: TemplateInfo) -> FrozenSet[int]:
+    c_amt = info.cols["amount"]
+    q, p = get_column_letter(info.cols["qty"]), get_column_letter(info.cols["unit_price"])
+    # 共有式の子（<f t="shared" si=".."/>）は親の式を行だけずらしたものなので、親の式と行で判定する
+    masters = {}
+    for r, row in rows.items():
+        m = re.search(r'<f\b([^>]*)>(.*?)</f>', row.cells.get(c_amt, ""), re.S)
+        if m and _attrs(m.group(1)).get("t") == "shared" and "ref=" in m.group(1):
+            masters[_attrs(m.group(1)).get("si")] = (r, m.group(2))
+    foreign = set()
+    for r in range(info.start_row, info.end_row + 1):
+        m = re.search(r'<f\b([^>]*?)(?:/>|>(.*?)</f>)', rows[r].cells.get(c_amt, "") if r in rows else "", re.S)
+        if m is None:
+            continue  # 式なし（O*S を書く）
+        a, text = _attrs(m.group(1)), m.group(2) or ""
+        if a.get("t") == "shared" and not text.strip():
+            mr, text = masters.get(a.get("si"), (0, ""))
+            ok = mr > 0 and _is_line_product(text, mr, q, p)
+        else:
+            ok = a.get("t") != "array" and _is_line_product(text, r, q, p)
+        if not ok:
+            foreign.add(r)
+    return frozenset(foreign)
+
+def _build_plan(template_bytes: bytes, info: TemplateInfo) -> _Plan:
+    members = _read_members(template_bytes)
+    by_name = {m.name: m for m in members}
+    need = ("xl/workbook.xml", "xl/_rels/workbook.xml.rels", "xl/styles.xml", "[Content_Types].xml")
+    if any(n not in by_name for n in need):
+        raise UnsupportedTemplate("workbook / styles / Content_Types が揃っていません")
+    parts = {n: _read_part(by_name[n]) for n in need}
+    sheet_name, sheet_names, sheet_rel, rid_attr = _active_sheet(parts, info.sheet)
+    if sheet_name not in by_name:
+        raise UnsupportedTemplate(f"{sheet_name} がありません")
+
+    c_task, c_amt = info.cols["task"], info.cols["amount"]
+    writable = {info.cols[k] for k in ("task", "qty", "unit", "unit_price")}
+    head, tail, rows = _split_sheet(_read_part(by_name[sheet_name]).decode("utf-8"), info.start_row, info.subtotal_row)
+    # 明細が変わると税・総額など小計に依存する式のキャッシュ値も古くなる。金額・小計以外の式セルは値を持たせず、
+    # Excel では fullCalcOnLoad で、再計算しない読み手には「値なし」で見せる（古い 0 を見せない）
+    head, tail = _drop_cached_values(head), _drop_cached_values(tail)
+    for row in rows.values():
+        row.cells = {c: _drop_cached_value(cell) for c, cell in row.cells.items()}
+    for r, row in rows.items():
+        for c in writable | {c_amt}:
+            cell = row.cells.get(c, "")
+            if "<f" in cell and ('t="shared"' in cell and "ref=" in cell or 't="array"' in cell):
+                # 共有式・配列式の親を消すと他のセルの式が壊れる
+                if c != c_amt or r == info.subtotal_row:
+                    raise UnsupportedTemplate(f"{get_column_letter(c)}{r} に共有式／配列式の親があります")
+
+    want_bold = [rows[r].styles.get(c_task, "0") if r in rows else "0" for r in range(info.start_row, info.end_row + 1)]
+    want_thousands = [rows[r].styles.get(c_amt, "0") if r in rows else "0"
+                      for r in range(info.start_row, info.subtotal_row + 1)]
+    styles_xml, bold, thousands = _derive_styles(parts["xl/styles.xml"].decode("utf-8"), want_bold, want_thousands)
+
+    # calcChain は数式セルの一覧。明細行の式が変わると食い違うので落とす（openpyxl も書き出さない）
+    book = {n: parts[n].decode("utf-8") for n in ("xl/workbook.xml", "xl/_rels/workbook.xml.rels", "[Content_Types].xml")}
+    book["xl/workbook.xml"] = _full_calc_on_load(book["xl/workbook.xml"])
+    if "xl/calcChain.xml" in by_name:
+        book["xl/_rels/workbook.xml.rels"] = re.sub(r'<Relationship\b[^>]*?Target="/?(?:xl/)?calcChain\.xml"[^>]*?/>',
+                                                    "", book["xl/_rels/workbook.xml.rels"])
+        book["[Content_Types].xml"] = re.sub(r'<Override\b[^>]*?PartName="/xl/calcChain\.xml"[^>]*?/>', "",
+                                             book["[Content_Types].xml"])
+    out = []
+    for m in members:
+        if m.name == "xl/calcChain.xml":
+            continue
+        if m.name == "xl/styles.xml" and styles_xml is not None:
+            m = _new_member(m.name, styles_xml.encode("utf-8"), m)
+        elif m.name in book and (m.name == "xl/workbook.xml" or "xl/calcChain.xml" in by_name):
+            m = _new_member(m.name, book[m.name].encode("utf-8"), m)
+        out.append(m)
+    sheet_index = next(i for i, m in enumerate(out) if m.name == sheet_name)
+    return _Plan(info, out, sheet_index, head, tail, rows, bold, thousands, _foreign_amount_rows(rows, info),
+                 book, sheet_names, sheet_rel, rid_attr)
+
+def _plan(template_bytes: bytes) -> _Plan:
+    sha = template_digest(template_bytes)
+    with _plans_lock:
+        plan = _plans.get(sha)
+        if plan is not None:
+            _plans.move_to_end(sha)
+            return plan
+    plan = _build_plan(template_bytes, template_info(template_bytes, digest=sha))
+    with _plans_lock:
+        _plans[sha] = plan
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
+
+# =========================
+# 出力
+# =========================
+def _cell(ref: str, s: str, body: str = "", t: Optional[str] = None) -> str:
+    sa = f' s="{s}"' if s != "0" else ""
+    ta = f' t="{t}"' if t else ""
+    return f'<c r="{ref}"{sa}{ta}>{body}</c>' if body else f'<c r="{ref}"{sa}{ta}/>'
+
+def _num(value: float) -> str:
+    # 整数はそのまま、小数は往復で同じ double になる最短表記（Excel が式を計算した値と一致させる）
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def _restyle_formula(cell: str, s: str, value: Optional[float] = None) -> str:
+    # 既存の式セルは式だけ残し、古いキャッシュ値と型を落として表示形式（s）を差し替える（value があれば新しいキャッシュ値）
+    cell = _drop_cached_value(cell)
+    if value is not None:
+        cell = re.sub(r'(<f\b[^>]*?/>|</f>)', lambda m: f"{m.group(1)}<v>{_num(value)}</v>", cell, count=1)
+    i = cell.index(">") + 1
+    return _set_attr(cell[:i], "s", s) + cell[i:]
+
+def _formula(f: str, value: Optional[float]) -> str:
+    return f"<f>{escape(f)}</f>" + (f"<v>{_num(value)}</v>" if value is not None else "")
+
+def _page_amounts(plan: _Plan, layout: List[tuple]) -> Tuple[Dict[int, float], Optional[float]]:
+    """明細行ごとの金額のキャッシュ値と、そのページの小計（計算できない行があれば None）。
+    セルの式（=数量*単価、=SUM(...)）を評価した値と同じにするため丸めない（端数のある数量でもずれない）。"""
+    items = {r: item for r, _, item in layout if item is not None}
+    amounts = {}
+    for r in range(plan.info.start_row, plan.info.end_row + 1):
+        if r not in plan.foreign:
+            item = items.get(r)
+            amounts[r] = item[1] * item[3] if item else 0
+    subtotal = None if plan.foreign else sum(amounts.values())
+    return amounts, subtotal
+
+def _render_page(plan: _Plan, head: str, tail: str, layout: List[tuple], extra_refs=(),
+                 values: Optional[Tuple[Dict[int, float], Optional[float]]] = None) -> bytes:
+    info = plan.info
+    cols = info.cols
+    c_task, c_qty, c_unit, c_price, c_amt = (cols[k] for k in ("task", "qty", "unit", "unit_price", "amount"))
+    L = {c: get_column_letter(c) for c in (c_task, c_qty, c_unit, c_price, c_amt)}
+    token = info.token_cell
+    by_row = {r: (heading, item) for r, heading, item in layout}
+    last_detail_row = layout[-1][0] if layout else info.start_row
+    plus = "".join(f"+{ref}" for ref in extra_refs)
+    amounts, subtotal = values if values is not None else ({}, None)
+    empty = _Row("", {}, {})
+
+    out = [head]
+    rows = sorted(set(plan.rows) | set(range(info.start_row, info.subtotal_row + 1)))
+    for r in rows:
+        row = plan.rows.get(r, empty)
+        cells = dict(row.cells)
+        st = row.styles
+        if r == info.subtotal_row:
+            ac = L[c_amt]
+            s = plan.thousands[st.get(c_amt, "0")]
+            if last_detail_row < info.start_row:
+                cells[c_amt] = _cell(f"{ac}{r}", s, _formula("0" + plus, subtotal) if plus else "<v>0</v>")
+            else:
+                cells[c_amt] = _cell(f"{ac}{r}", s, _formula(f"SUM({ac}{info.start_row}:{ac}{last_detail_row}){plus}", subtotal))
+        else:
+            if token and token[0] == r and token[1] not in (c_task, c_qty, c_unit, c_price):
+                tc = token[1]
+                cells[tc] = _cell(f"{get_column_letter(tc)}{r}", st.get(tc, "0"))
+            for c in (c_task, c_qty, c_unit, c_price):
+                cells[c] = _cell(f"{L[c]}{r}", st.get(c, "0"))
+            heading, item = by_row.get(r, (None, None))
+            if heading is not None:
+                cells[c_task] = _cell(f"{L[c_task]}{r}", plan.bold[st.get(c_task, "0")], _text(heading), "inlineStr")
+            elif item is not None:
+                task, qty, unit, price = item
+                cells[c_task] = _cell(f"{L[c_task]}{r}", st.get(c_task, "0"), _text(task), "inlineStr")
+                cells[c_qty] = _cell(f"{L[c_qty]}{r}", st.get(c_qty, "0"), f"<v>{_num(qty)}</v>")
+                cells[c_unit] = _cell(f"{L[c_unit]}{r}", st.get(c_unit, "0"), _text(unit), "inlineStr")
+                cells[c_price] = _cell(f"{L[c_price]}{r}", st.get(c_price, "0"), f"<v>{price}</v>")
+            s = plan.thousands[st.get(c_amt, "0")]
+            old = row.cells.get(c_amt, "")
+            if "<f" in old:
+                cells[c_amt] = _restyle_formula(old, s, amounts.get(r))
+            else:
+                cells[c_amt] = _cell(f"{L[c_amt]}{r}", s, _formula(f"{L[c_qty]}{r}*{L[c_price]}{r}", amounts.get(r)))
+        attrs = f" {row.attrs}" if row.attrs else ""
+        out.append(f'<row r="{r}"{attrs}>' + "".join(cells[c] for c in sorted(cells)) + "</row>")
+    out.append(tail)
+    return "".join(out).encode("utf-8")
+
+# 続きのシートには持たせない別パーツ参照（画像・図形・コメント・テーブル・ハイパーリンク等）
+_REL_BLOCKS = ("hyperlinks", "oleObjects", "controls", "tableParts", "customProperties")
+_REL_SINGLE = ("drawing", "legacyDrawing", "legacyDrawingHF", "drawingHF", "picture")
+
+def _clone_page(plan: _Plan) -> Tuple[str, str]:
+    if plan.clone is None:
+        head = re.sub(r'\stabSelected="[^"]*"', "", plan.head)  # 複数シート選択（グループ編集）にならないよう外す
+        tail = plan.tail
+        for tag in _REL_BLOCKS:
+            tail = re.sub(r'<%s\b[^>]*?(?:/>|>.*?</%s>)' % (tag, tag), "", tail, flags=re.S)
+        for tag in _REL_SINGLE:
+            tail = re.sub(r'<%s\b[^>]*?/>' % tag, "", tail)
+        tail = re.sub(r'(<pageSetup\b[^>]*?)\s\w+:id="[^"]*"', r"\1", tail)
+        if re.search(r'\s\w+:id="', head + tail):
+            raise UnsupportedTemplate("続きのシートに複製できない参照があります")
+        plan.clone = (head, tail)
+    return plan.clone
+
+def _add_sheets(plan: _Plan, titles: List[str]) -> Tuple[Dict[str, str], List[str]]:
+    """続きのシートを workbook.xml / rels / [Content_Types].xml に足す。戻り値: (書き換え後の 3 パーツ, シートのパーツ名)"""
+    book = dict(plan.book)
+    wb, rels, ct = book["xl/workbook.xml"], book["xl/_rels/workbook.xml.rels"], book["[Content_Types].xml"]
+    if "</sheets>" not in wb or "</Relationships>" not in rels or "</Types>" not in ct:
+        raise UnsupportedTemplate("workbook.xml / rels / Content_Types の形式が想定外です")
+    sheet_part = plan.members[plan.sheet_index].name
+    m = re.search(r'<Override\b[^>]*?PartName="/%s"[^>]*?ContentType="([^"]+)"' % re.escape(sheet_part), ct)
+    next_id = max([int(x) for x in re.findall(r'<sheet\b[^>]*?\bsheetId="(\d+)"', wb)] or [0]) + 1
+    used = {mm.name for mm in plan.members}
+    k, paths, sheets, rel_tags, overrides = 1, [], [], [], []
+    for i, title in enumerate(titles):
+        while f"xl/worksheets/sheet{k}.xml" in used:
+            k += 1
+        path = f"xl/worksheets/sheet{k}.xml"
+        used.add(path)
+        paths.append(path)
+        rid = f"rIdMitsumori{i + 1}"
+        sheets.append(f'<sheet name="{escape(title, {chr(34): "&quot;"})}" sheetId="{next_id + i}" {plan.rid_attr}="{rid}"/>')
+        rel_tags.append(f'<Relationship Id="{rid}" Type="{plan.sheet_rel["Type"]}" Target="/{path}"/>')
+        if m:
+            overrides.append(f'<Override PartName="/{path}" ContentType="{m.group(1)}"/>')
+    book["xl/workbook.xml"] = wb.replace("</sheets>", "".join(sheets) + "</sheets>", 1)
+    book["xl/_rels/workbook.xml.rels"] = rels.replace("</Relationships>", "".join(rel_tags) + "</Relationships>", 1)
+    book["[Content_Types].xml"] = ct.replace("</Types>", "".join(overrides) + "</Types>", 1)
+    return book, paths
+
+def fill_template_xml(template_bytes: bytes, df_items: pd.DataFrame, max_pages: int = 1,
+                      cache_values: bool = False) -> TemplateExport:
+    """fill_template（openpyxl 版）と同じ内容の xlsx を返す。cache_values=True なら金額・小計のキャッシュ値も書く。"""
+    plan = _plan(template_bytes)
+    info = plan.info
+    if info.capacity <= 0:
+        raise TemplateError("テンプレートの明細枠が不正です（小計行が ITEMS_START より上）。")
+    pages, dropped = layout_pages(df_items, info, max_pages)
+    titles = continuation_titles(info.sheet, len(pages) - 1, plan.sheet_names)
+    sub = f"{get_column_letter(info.cols['amount'])}{info.subtotal_row}"
+    values = [_page_amounts(plan, rows) for rows in pages] if cache_values else [None] * len(pages)
+    if cache_values and titles:
+        # 1 枚目の小計は続きのシートの小計も足した値
+        subtotals = [v[1] for v in values]
+        values[0] = (values[0][0], None if None in subtotals else sum(subtotals))
+
+    members = list(plan.members)
+    sheet = members[plan.sheet_index]
+    members[plan.sheet_index] = _new_member(
+        sheet.name, _render_page(plan, plan.head, plan.tail, pages[0], [sheet_ref(t, sub) for t in titles], values[0]),
+        sheet)
+    if titles:
+        head, tail = _clone_page(plan)
+        book, paths = _add_sheets(plan, titles)
+        extra = [_new_member(path, _render_page(plan, head, tail, rows, values=v), sheet)
+                 for path, rows, v in zip(paths, pages[1:], values[1:])]
+        members[plan.sheet_index + 1:plan.sheet_index + 1] = extra
+        members = [_new_member(m.name, book[m.name].encode("utf-8"), m) if m.name in book else m for m in members]
+    return TemplateExport(_write_zip(members), info, dropped, len(pages))
@@ -0,0 +1,210 @@
+# ---------- JSON ロバストパース ----------
+# LLM 出力（コードフェンス付き・末尾カンマ・Python リテラル・シングルクォート・途中切れ）を
+# 1 パスのトークン走査で Python オブジェクトに復元する。
+# ast.literal_eval は使わない（巨大な未検証テキストを Python パーサに通さない）。
+
+import re
+import json
+from typing import Any, Tuple
+
+# 文字列は unrolled-loop 形式（バックトラックなし・線形時間）。閉じクォートは任意＝途中切れも拾う。
+# 空白とコロンは意味を持たないので、トークン先頭でまとめて読み飛ばす。
+# 文字列の外に出てくる全角の括弧・カンマ・コロン・“”も半角と同じ扱いにする。
+_TOKEN = re.compile(r"""
+  [\s:：]*
+  (?:
+    "(?P<dq>[^"\\]*(?:\\.[^"\\]*)*)(?P<dqc>")?
+  | '(?P<sq>[^'\\]*(?:\\.[^'\\]*)*)(?P<sqc>')?
+  | “(?P<fq>[^”]*)(?P<fqc>”)?
+  | (?P<num>-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_\-]*)
+  | (?P<open>[{\[｛［])
+  | (?P<close>[}\]｝］])
+  | (?P<comma>[,，、])
+  | (?P<other>.)
+  )
+""", re.VERBOSE | re.DOTALL)
+
+_ESC = re.compile(r"\\(u[0-9a-fA-F]{4}|.)", re.DOTALL)
+_ESC_MAP = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+_SURROGATE = re.compile("[\ud800-\udfff]")
+_WORDS = {"true": True, "false": False, "null": None,
+          "True": True, "False": False, "None": None}
+
+def _unescape_one(m) -> str:
+    e = m.group(1)
+    if len(e) == 5 and e[0] == "u":
+        return chr(int(e[1:], 16))
+    return _ESC_MAP.get(e, e)
+
+def _decode_string(body: str) -> str:
+    if "\\" not in body:
+        return body
+    s = _ESC.sub(_unescape_one, body)
+    if _SURROGATE.search(s):
+        s = s.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+    return s
+
+# ルート候補はオブジェクトか「オブジェクトを並べた配列」。前置きの "[see below]" や "[注]" はルートにしない。
+_ROOT = re.compile(r"[{｛]|[\[［]\s*[{｛]")
+_ROOT_ANY = re.compile(r"[{\[｛［]")
+_OPEN_DICT = ("{", "｛")
+
+def _find_root(s: str) -> int:
+    m = _ROOT.search(s) or _ROOT_ANY.search(s)
+    return m.start() if m else -1
+
+def scan_json_like(s: str) -> Tuple[Any, bool]:
+    """
+    JSON 風テキストを 1 パスで走査して (値, 途中切れフラグ) を返す。
+    - ルートは最初の { か [{ から（どちらも無ければ最初の [）。前後の説明文・コードフェンスは読み飛ばす。
+    - 末尾カンマ／カンマ抜け、True/False/None、シングルクォート、クォートなしキーを許容。
+    - 途中切れ: 閉じていない配列要素（書きかけの item）は捨て、外側の容器は閉じて返す。
+    """
+    if not s:
+        return None, False
+    start = _find_root(s)
+    if start < 0:
+        return None, False
+
+    # フレーム: [容器, 保留中のキー, 親が配列か]
+    stack = []
+    root = None
+    last_scalar = None  # (容器, キー or None, 終了位置)
+    end_pos = len(s.rstrip())
+
+    def _emit(value, scalar_end=None):
+        nonlocal last_scalar
+        frame = stack[-1]
+        cont = frame[0]
+        if type(cont) is list:
+            cont.append(value)
+            last_scalar = (cont, None, scalar_end) if scalar_end is not None else None
+            return
+        if frame[1] is None:
+            # dict のキー位置：スカラーのみキーとして採用
+            if scalar_end is not None:
+                frame[1] = value if isinstance(value, str) else json.dumps(value)
+            last_scalar = None
+            return
+        key = frame[1]
+        cont[key] = value
+        frame[1] = None
+        last_scalar = (cont, key, scalar_end) if scalar_end is not None else None
+
+    for m in _TOKEN.finditer(s, start):
+        kind = m.lastgroup
+        if kind == "other":
+            continue
+        if kind == "open":
+            cont = {} if m.group("open") in _OPEN_DICT else []
+            parent_is_list = bool(stack) and type(stack[-1][0]) is list
+            stack.append([cont, None, parent_is_list])
+            continue
+        if kind == "close":
+            cont = stack.pop()[0]
+            if not stack:
+                root = cont
+                break
+            _emit(cont)
+            continue
+        if kind == "comma":
+            # 値のないキーは破棄（{"a": , "b": 1} 対策）
+            if stack and type(stack[-1][0]) is dict:
+                stack[-1][1] = None
+            continue
+        if not stack:
+            continue
+        if kind == "dqc" or kind == "dq":
+            if m.group("dqc") is None:
+                break  # 閉じクォートなし＝途中切れ
+            _emit(_decode_string(m.group("dq")), m.end())
+        elif kind == "sqc" or kind == "sq":
+            if m.group("sqc") is None:
+                break
+            _emit(_decode_string(m.group("sq")), m.end())
+        elif kind == "fqc" or kind == "fq":
+            if m.group("fqc") is None:
+                break
+            _emit(m.group("fq"), m.end())
+        elif kind == "num":
+            t = m.group("num")
+            v = float(t) if ("." in t or "e" in t or "E" in t) else int(t)
+            _emit(v, m.end())
+        elif kind == "word":
+            w = m.group("word")
+            _emit(_WORDS[w] if w in _WORDS else w, m.end())
+
+    if root is not None:
+        return root, False
+    if not stack:
+        return None, True
+
+    # ---- 途中切れ：末尾のスカラーが文末ぴったりで終わっていれば書きかけとみなして捨てる ----
+    if last_scalar is not None and last_scalar[2] is not None and last_scalar[2] >= end_pos:
+        cont, key, _ = last_scalar
+        if type(cont) is list:
+            if cont:
+                cont.pop()
+        else:
+            cont.pop(key, None)
+
+    # 内側から閉じる。親が配列の未完容器（書きかけ item）は捨てる
+    while stack:
+        cont, _, parent_is_list = stack.pop()
+        if not stack:
+            root = cont
+            break
+        if not parent_is_list:
+            _emit(cont)
+    return root, True
+
+def _root_slice(s: str) -> str:
+    start = _find_root(s)
+    if start < 0:
+        return ""
+    end = s.rfind("}" if s[start] == "{" else "]")  # 全角ルートはスキャナに任せる
+    return s[start:end + 1] if end > start else ""
+
+def coerce_json_like(s: str):
+    """
+    json.loads（C 実装）を先に試す：全文 → 最初の括弧から対応する閉じ括弧まで（フェンス・前置き除去）。
+    どちらもだめなら寛容スキャナで 1 パス復元する。
+    """
+    if not s:
+        return None
+    try:
+        return json.loads(s)
+    except Exception:
+        pass
+    frag = _root_slice(s)
+    if frag and len(frag) < len(s):
+        try:
+            return json.loads(frag)
+        except Exception:
+            pass
+    obj, _ = scan_json_like(s)
+    return obj
+
+def extract_items(obj) -> list:
+    """パース結果から items 配列を取り出す（ルート配列・result.items・data も許容）。"""
+    if isinstance(obj, list):
+        return obj
+    if not isinstance(obj, dict):
+        return []
+    items = obj.get("items")
+    if isinstance(items, list):
+        return items
+    if isinstance(obj.get("result"), dict) and isinstance(obj["result"].get("items"), list):
+        return obj["result"]["items"]
+    if isinstance(obj.get("data"), list):
+        return obj["data"]
+    return []
+
+def robust_parse_items_json(raw: str) -> str:
+    obj = coerce_json_like(raw or "")
+    if not isinstance(obj, dict):
+        obj = {"items": extract_items(obj)}
+    else:
+        obj["items"] = extract_items(obj)
+    return json.dumps(obj, ensure_ascii=False)
@@ -0,0 +1,250 @@
+# ---------- 単価表（ローカル SQLite） ----------
+# ディレクター・カメラマン・ヘアメイク等の定番項目は、LLM に毎回単価を考えさせずに社内単価表から引く。
+# 索引: (別名, 単位, カテゴリ) の複合主キー。別名は NFKC・小文字化・空白除去で正規化して持つ。
+# 取り込み: python -m mitsumori.ratecard import 単価表.xlsx [--db PATH] [--source 名前]
+# 確認:     python -m mitsumori.ratecard lookup カメラマン --unit 日 [--category 撮影費]
+
+import os
+import re
+import sys
+import sqlite3
+import argparse
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from mitsumori.items import Item, _to_int
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parent.parent / "data" / "rate_card.sqlite3"
+
+MODE_FILL = "fill"        # 単価 0 の行だけ標準単価で埋める
+MODE_CLAMP = "clamp"      # 埋める + 下限〜上限の外にある単価を範囲内へ寄せる
+MODE_REPLACE = "replace"  # 単価表にある行は標準単価で置き換える
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rates (
+    id            INTEGER PRIMARY KEY,
+    category      TEXT NOT NULL,
+    task          TEXT NOT NULL,
+    unit          TEXT NOT NULL,
+    min_price     INTEGER,
+    typical_price INTEGER NOT NULL,
+    max_price     INTEGER,
+    source        TEXT,
+    updated_at    TEXT,
+    UNIQUE (category, task, unit)
+);
+CREATE TABLE IF NOT EXISTS rate_aliases (
+    alias    TEXT NOT NULL,
+    unit     TEXT NOT NULL,
+    category TEXT NOT NULL,
+    rate_id  INTEGER NOT NULL REFERENCES rates(id) ON DELETE CASCADE,
+    PRIMARY KEY (alias, unit, category)
+) WITHOUT ROWID;
+"""
+
+# 取り込み時の列名（社内シートの日本語見出しも受ける）
+_HEADER_ALIASES = {
+    "category": ["category", "カテゴリ", "区分"],
+    "task": ["task", "項目", "品目", "役割"],
+    "aliases": ["aliases", "別名", "エイリアス"],
+    "unit": ["unit", "単位"],
+    "min_price": ["min", "min_price", "下限", "最低"],
+    "typical_price": ["typical", "typical_price", "標準", "単価", "標準単価"],
+    "max_price": ["max", "max_price", "上限", "最高"],
+}
+_ALIAS_SEP = re.compile(r"[|｜,，、/／;；]")
+
+def normalize_key(s) -> str:
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", str(s or ""))).casefold()
+
+@dataclass(slots=True)
+class Rate:
+    category: str
+    task: str
+    unit: str
+    min_price: Optional[int]
+    typical_price: int
+    max_price: Optional[int]
+
+class RateCard:
+    """単価表への接続。Streamlit のスレッドからも使えるよう check_same_thread=False で開く。"""
+
+    def __init__(self, path=None):
+        self.path = str(path or os.getenv("MITSUMORI_RATECARD_DB") or DEFAULT_DB_PATH)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM rates").fetchone()[0]
+
+    # ---------- 登録 ----------
+    def upsert(self, category: str, task: str, unit: str, typical_price: int,
+               min_price: Optional[int] = None, max_price: Optional[int] = None,
+               aliases: Optional[List[str]] = None, source: str = "") -> int:
+        cur = self.conn.execute(
+            "INSERT INTO rates (category, task, unit, min_price, typical_price, max_price, source, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (category, task, unit) DO UPDATE SET "
+            "min_price=excluded.min_price, typical_price=excluded.typical_price, max_price=excluded.max_price, "
+            "source=excluded.source, updated_at=excluded.updated_at "
+            "RETURNING id",
+            (category, task, unit, min_price, typical_price, max_price, source,
+             datetime.now().isoformat(timespec="seconds")),
+        )
+        rate_id = cur.fetchone()[0]
+        unit_key, cat_key = normalize_key(unit), normalize_key(category)
+        for a in dict.fromkeys(normalize_key(x) for x in [task, *(aliases or [])]):
+            if a:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO rate_aliases (alias, unit, category, rate_id) VALUES (?, ?, ?, ?)",
+                    (a, unit_key, cat_key, rate_id),
+                )
+        return rate_id
+
+    # ---------- 参照 ----------
+    def lookup(self, category: str, task: str, unit: str) -> Optional[Rate]:
+        """
+        (別名, 単位) で引き、同じカテゴリの行を優先する。単位が違う単価は比べられないので使わない。
+        単位が空の item は、別名がカテゴリ内で 1 件に定まる場合だけ返す。
+        """
+        alias, unit_key, cat_key = normalize_key(task), normalize_key(unit), normalize_key(category)
+        if not alias:
+            return None
+        if unit_key:
+            row = self.conn.execute(
+                "SELECT r.category, r.task, r.unit, r.min_price, r.typical_price, r.max_price "
+                "FROM rate_aliases a JOIN rates r ON r.id = a.rate_id "
+                "WHERE a.alias = ? AND a.unit = ? ORDER BY a.category = ? DESC LIMIT 1",
+                (alias, unit_key, cat_key),
+            ).fetchone()
+        else:
+            rows = self.conn.execute(
+                "SELECT r.category, r.task, r.unit, r.min_price, r.typical_price, r.max_price "
+                "FROM rate_aliases a JOIN rates r ON r.id = a.rate_id "
+                "WHERE a.alias = ? AND a.category = ? LIMIT 2",
+                (alias, cat_key),
+            ).fetchall()
+            row = rows[0] if len(rows) == 1 else None
+        return Rate(*row) if row else None
+
+def open_rate_card(path=None) -> RateCard:
+    return RateCard(path)
+
+# =========================
+# item への適用
+# =========================
+def apply_rate_card(items: List[Item], card: RateCard, mode: str = MODE_FILL) -> Tuple[List[Item], dict]:
+    """
+    単価表で unit_price を埋める／検証する。管理費は対象外（compute_totals が上限で決める）。
+    戻り値: (新しい Item のリスト, {"matched", "filled", "clamped", "replaced", "novel", "lines"})
+    lines は変更した行の (task, 動作, 変更前, 変更後)。
+    """
+    report = {"matched": 0, "filled": 0, "clamped": 0, "replaced": 0, "novel": 0, "lines": []}
+    out = []
+    for x in items:
+        rate = None if x.category == "管理費" else card.lookup(x.category, x.task, x.unit)
+        if rate is None:
+            report["novel"] += int(x.category != "管理費")
+            out.append(x)
+            continue
+        report["matched"] += 1
+        price, action = x.unit_price, None
+        if mode == MODE_REPLACE:
+            price, action = rate.typical_price, "replaced"
+        elif price <= 0:
+            price, action = rate.typical_price, "filled"
+        elif mode == MODE_CLAMP:
+            if rate.min_price is not None and price < rate.min_price:
+                price, action = rate.min_price, "clamped"
+            elif rate.max_price is not None and price > rate.max_price:
+                price, action = rate.max_price, "clamped"
+        if action and price != x.unit_price:
+            report[action] += 1
+            report["lines"].append((x.task, action, x.unit_price, price))
+            x = Item(x.category, x.task, x.qty, x.unit, price, x.note)
+        out.append(x)
+    return out, report
+
+# =========================
+# 取り込み（社内単価シート）
+# =========================
+def _read_sheet(path: str) -> pd.DataFrame:
+    if str(path).lower().endswith((".csv", ".txt")):
+        return pd.read_csv(path, dtype=str)
+    return pd.read_excel(path, dtype=str)
+
+def _map_columns(df: pd.DataFrame) -> dict:
+    found = {}
+    heads = {normalize_key(c): c for c in df.columns}
+    for key, names in _HEADER_ALIASES.items():
+        for n in names:
+            if normalize_key(n) in heads:
+                found[key] = heads[normalize_key(n)]
+                break
+    missing = [k for k in ("category", "task", "unit", "typical_price") if k not in found]
+    if missing:
+        raise ValueError(f"単価シートに必須列がありません: {missing}（見出し: {list(df.columns)}）")
+    return found
+
+def import_price_sheet(card: RateCard, path: str, source: Optional[str] = None) -> int:
+    """CSV / xlsx の単価シートを取り込む（同じ category/task/unit は上書き）。取り込んだ行数を返す。"""
+    df = _read_sheet(path)
+    cols = _map_columns(df)
+    source = source or Path(path).name
+    n = 0
+    with card.conn:
+        for rec in df.to_dict("records"):
+            def val(k):
+                v = rec.get(cols[k]) if k in cols else None
+                return None if v is None or (isinstance(v, float) and pd.isna(v)) else str(v).strip()
+            category, task, unit = val("category"), val("task"), val("unit")
+            typical = _to_int(val("typical_price"))
+            if not (category and task and unit) or typical <= 0:
+                continue
+            lo, hi = val("min_price"), val("max_price")
+            aliases = [a.strip() for a in _ALIAS_SEP.split(val("aliases") or "") if a.strip()]
+            card.upsert(category, task, unit, typical,
+                        _to_int(lo) if lo else None, _to_int(hi) if hi else None,
+                        aliases, source)
+            n += 1
+    return n
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m mitsumori.ratecard")
+    ap.add_argument("--db", default=None, help=f"単価表 DB（既定: $MITSUMORI_RATECARD_DB または {DEFAULT_DB_PATH}）")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_imp = sub.add_parser("import", help="単価シート（CSV/xlsx）を取り込む")
+    p_imp.add_argument("paths", nargs="+")
+    p_imp.add_argument("--source", default=None)
+    p_look = sub.add_parser("lookup", help="単価を引く")
+    p_look.add_argument("task")
+    p_look.add_argument("--unit", default="")
+    p_look.add_argument("--category", default="")
+    args = ap.parse_args(argv)
+
+    card = open_rate_card(args.db)
+    try:
+        if args.cmd == "import":
+            for p in args.paths:
+                print(f"{p}: {import_price_sheet(card, p, args.source)} 行")
+            print(f"単価表: {len(card)} 件（{card.path}）")
+            return 0
+        rate = card.lookup(args.category, args.task, args.unit)
+        print(rate if rate else "該当なし")
+        return 0 if rate else 1
+    finally:
+        card.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+# ---------- 表示（見積 HTML） ----------
+# 行ごとに Series を作る iterrows をやめ、列リストを zip で回して組み立てる。
+# render_html_cached は (df, meta, flags) の内容ハッシュで結果を覚えておき、同じ内容なら組み立て直さない。
+
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+import pandas as pd
+
+from mitsumori.estimate import EstimateTable, MGMT_FEE_CAP_RATE, TAX_RATE, AMOUNT_COLUMN
+
+_HEAD = (
+    "<table border='1' cellspacing='0' cellpadding='6' style='border-collapse:collapse;width:100%'>",
+    "<thead><tr>"
+    "<th style='text-align:left'>カテゴリ</th>"
+    "<th style='text-align:left'>項目</th>"
+    "<th style='text-align:right'>単価</th>"
+    "<th style='text-align:left'>数量</th>"
+    "<th style='text-align:left'>単位</th>"
+    "<th style='text-align:right'>金額（円）</th>"
+    "</tr></thead>",
+    "<tbody>",
+)
+
+def _render_rows(category, task, qty, unit, unit_price, amount, meta: dict, flags=None) -> str:
+    # flags: 行ごとの警告文（mitsumori/anomaly.py の reasons。"" は警告なし）
+    flags = flags if flags is not None else [""] * len(category)
+    html = []
+    html.append("<p>以下は、映像制作にかかる各種費用をカテゴリごとに整理した概算見積書です。</p>")
+    html.append(f"<p>短納期係数：{meta['rush_coeff']} ／ 管理費上限：{int(MGMT_FEE_CAP_RATE*100)}% ／ 消費税率：{int(TAX_RATE*100)}%</p>")
+    n_flagged = sum(1 for f in flags if f)
+    if n_flagged:
+        html.append(f"<p style='color:#9a6700'>⚠ 過去の単価分布から外れた行が {n_flagged} 件あります（黄色の行）。</p>")
+    html.extend(_HEAD)
+    current_cat = None
+    for cat, task_str, q, unit_str, price, amt, flag in zip(category, task, qty, unit, unit_price, amount, flags):
+        if cat != current_cat:
+            html.append(f"<tr><td colspan='6' style='text-align:left;background:#f6f6f6;font-weight:bold'>{cat}</td></tr>")
+            current_cat = cat
+        if flag:
+            task_str = f"{task_str}<br><small style='color:#9a6700'>⚠ {flag}</small>"
+        html.append(
+            ("<tr style='background:#fff3cd'>" if flag else "<tr>")
+            + f"<td>{cat}</td>"
+            f"<td>{task_str}</td>"
+            f"<td style='text-align:right'>{int(price):,}</td>"
+            f"<td>{q}</td>"
+            f"<td>{unit_str}</td>"
+            f"<td style='text-align:right'>{int(amt):,}</td>"
+            "</tr>"
+        )
+    html.append("</tbody></table>")
+    html.append(
+        f"<p><b>小計（税抜）</b>：{meta['taxable']:,}円　／　"
+        f"<b>消費税</b>：{meta['tax']:,}円　／　"
+        f"<b>合計</b>：<span style='color:red'>{meta['total']:,}円</span></p>"
+    )
+    html.append("<p>※本見積書は自動生成された概算です。実制作内容・条件により金額が増減します。</p>")
+    return "\n".join(html)
+
+def _pad_flags(flags, n: int):
+    # compute_totals が末尾に追加した管理費行などの分は警告なしで埋める
+    return None if flags is None else (list(flags) + [""] * n)[:n]
+
+def render_html_table(t: EstimateTable, meta: dict, flags=None) -> str:
+    amount = t.amount if t.amount is not None else [0] * len(t)
+    return _render_rows(t.category, t.task, t.qty, t.unit, t.unit_price, amount, meta, _pad_flags(flags, len(t)))
+
+def _columns(df_items: pd.DataFrame) -> tuple:
+    n = len(df_items)
+
+    def col(name, default):
+        return df_items[name].tolist() if name in df_items.columns else [default] * n
+
+    return (col("category", ""), col("task", ""), col("qty", ""), col("unit", ""),
+            col("unit_price", 0), col(AMOUNT_COLUMN, 0))
+
+def render_html(df_items: pd.DataFrame, meta: dict, flags=None) -> str:
+    return _render_rows(*_columns(df_items), meta, _pad_flags(flags, len(df_items)))
+
+# ---------- 内容ハッシュでのメモ化 ----------
+RENDER_CACHE_SIZE = 64
+_render_cache: "OrderedDict[str, str]" = OrderedDict()
+_render_lock = threading.Lock()
+
+def _digest(cols: tuple, meta: dict, flags) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr(cols).encode("utf-8"))
+    h.update(json.dumps(meta, sort_keys=True, default=str).encode("utf-8"))
+    if flags is not None and any(flags):
+        h.update(repr(list(flags)).encode("utf-8"))
+    return h.hexdigest()
+
+def frame_digest(df_items: pd.DataFrame, meta: dict, flags=None) -> str:
+    """表示に使う列の値・meta・警告文から作る内容ハッシュ（同じ表なら同じ値。表示コンポーネントの再送判定にも使う）。"""
+    return _digest(_columns(df_items), meta, _pad_flags(flags, len(df_items)))
+
+def render_html_cached(df_items: pd.DataFrame, meta: dict, flags=None) -> Tuple[str, str]:
+    """(内容ハッシュ, HTML) を返す。直近 RENDER_CACHE_SIZE 件の結果をプロセス内で共有する。"""
+    cols = _columns(df_items)
+    flags = _pad_flags(flags, len(df_items))
+    digest = _digest(cols, meta, flags)
+    with _render_lock:
+        html = _render_cache.get(digest)
+        if html is not None:
+            _render_cache.move_to_end(digest)
+            return digest, html
+    html = _render_rows(*cols, meta, flags)
+    with _render_lock:
+        _render_cache[digest] = html
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return digest, html
+
+# ---------- What-if 格子（ヒートマップ表） ----------
+def _heat(v: float, lo: float, hi: float) -> str:
+    # 安い=白 → 高い=赤
+    r = 0.0 if hi <= lo else (v - lo) / (hi - lo)
+    g = int(round(255 - 120 * r))
+    return f"rgb(255,{g},{g})"
+
+def render_scenario_html(grid: dict, value: str = "total") -> str:
+    vals = grid[value]
+    if vals.size == 0:
+        return ""
+    lo, hi = float(vals.min()), float(vals.max())
+    html = ["<table border='1' cellspacing='0' cellpadding='6' style='border-collapse:collapse'>"]
+    head = "".join(
+        f"<th style='text-align:right'>{'予算なし' if b <= 0 else f'予算 {int(b):,}円'}</th>"
+        for b in grid["budgets"]
+    )
+    html.append(f"<thead><tr><th style='text-align:left'>納期（日）</th><th style='text-align:right'>短納期係数</th>{head}</tr></thead>")
+    html.append("<tbody>")
+    for i, d in enumerate(grid["target_days"]):
+        cells = "".join(
+            f"<td style='text-align:right;background:{_heat(float(v), lo, hi)}'>{int(v):,}</td>"
+            for v in vals[i]
+        )
+        html.append(f"<tr><td>{int(d)}</td><td style='text-align:right'>{grid['rush_coeff'][i]}</td>{cells}</tr>")
+    html.append("</tbody></table>")
+    return "\n".join(html)
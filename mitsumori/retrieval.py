@@ -0,0 +1,142 @@
+# ---------- 類似案件の検索（few-shot 用） ----------
+# アーカイブ済みの案件条件（CaseSpec）をベクトル化し、NumPy の内積（コサイン類似度）で近い k 件を引く。
+# ベクトル = 数値特徴（尺・本数・日数・人数・有無フラグ）＋ 選択肢と備考テキストの文字 n-gram をハッシュで畳んだもの。
+# 尺度は固定値で割るだけにしているので、件数が増えても既存ベクトルを作り直さずに追記できる。
+
+import re
+import zlib
+import unicodedata
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from mitsumori.case import CaseSpec
+from mitsumori.items import Item
+from mitsumori.estimate import MGMT_CATEGORY
+
+HASH_DIM = 1024
+NGRAM = (2, 3)
+NUM_WEIGHT = 0.6     # 数値特徴とテキスト特徴の重み（どちらも単位ベクトルにしてから掛ける）
+TEXT_WEIGHT = 0.8
+DEFAULT_K = 3
+FEW_SHOT_MAX_ITEMS = 25
+
+_SET_LEVELS = ["なし", "小（簡易装飾）", "中（通常レベル）", "大（本格セット）"]
+
+def _duration_sec(s: str) -> float:
+    s = unicodedata.normalize("NFKC", str(s or ""))
+    m = re.search(r"(\d+(?:\.\d+)?)", s)
+    if not m:
+        return 30.0
+    v = float(m.group(1))
+    return v * 60 if "分" in s or "min" in s.lower() else v
+
+def _numeric(c: CaseSpec) -> np.ndarray:
+    level = _SET_LEVELS.index(c.set_design_quality) if c.set_design_quality in _SET_LEVELS else 0
+    v = np.array([
+        np.log1p(_duration_sec(c.final_duration)) / np.log1p(120),
+        min(c.num_versions, 10) / 10,
+        min(c.shoot_days, 10) / 10,
+        min(c.edit_days, 10) / 10,
+        min(c.cast_main, 10) / 10,
+        min(c.cast_extra, 20) / 20,
+        float(c.talent_use), float(c.use_cg), float(c.use_narration), float(c.ma_needed),
+        level / 3,
+        min(len(c.deliverables), 4) / 4,
+        min(len(c.subtitle_langs), 3) / 3,
+    ], dtype=np.float32)
+    n = np.linalg.norm(v)
+    return v / n if n > 0 else v
+
+def _tokens(c: CaseSpec) -> List[str]:
+    toks = [f"k:{x}" for x in c.kizai] + [f"s:{x}" for x in c.staff_roles] + [f"d:{x}" for x in c.deliverables]
+    toks += [f"r:{c.usage_region}", f"p:{c.usage_period}", f"m:{c.use_music}"]
+    text = re.sub(r"\s+", "", unicodedata.normalize("NFKC", f"{c.extra_notes}\n{c.shoot_location}")).casefold()
+    for n in NGRAM:
+        toks += [text[i:i + n] for i in range(len(text) - n + 1)]
+    return toks
+
+def _text_vec(c: CaseSpec) -> np.ndarray:
+    v = np.zeros(HASH_DIM, dtype=np.float32)
+    toks = _tokens(c)
+    if toks:
+        # crc32 はプロセスをまたいで同じ値になる（hash() は起動ごとに変わる）
+        idx = np.fromiter((zlib.crc32(t.encode("utf-8")) % HASH_DIM for t in toks), dtype=np.int64, count=len(toks))
+        np.add.at(v, idx, 1.0)
+        v = np.sqrt(v)  # 長い備考で頻出 n-gram が支配しないよう抑える
+        v /= np.linalg.norm(v)
+    return v
+
+def case_vector(c: CaseSpec) -> np.ndarray:
+    v = np.concatenate([_numeric(c) * NUM_WEIGHT, _text_vec(c) * TEXT_WEIGHT])
+    n = np.linalg.norm(v)
+    return v / n if n > 0 else v
+
+class CaseIndex:
+    """案件ベクトルの行列（追記のたびに作り直さないよう容量を倍々で確保する）。"""
+    __slots__ = ("ids", "_mat", "_n")
+
+    def __init__(self):
+        self.ids: List[int] = []
+        self._mat = np.zeros((0, len(_numeric(CaseSpec())) + HASH_DIM), dtype=np.float32)
+        self._n = 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    def add(self, est_id: int, case: CaseSpec):
+        if self._n == self._mat.shape[0]:
+            grown = np.zeros((max(64, self._n * 2), self._mat.shape[1]), dtype=np.float32)
+            grown[:self._n] = self._mat[:self._n]
+            self._mat = grown
+        self._mat[self._n] = case_vector(case)
+        self.ids.append(est_id)
+        self._n += 1
+
+    @classmethod
+    def build(cls, cases: Sequence[Tuple[int, CaseSpec]]) -> "CaseIndex":
+        idx = cls()
+        for est_id, case in cases:
+            idx.add(est_id, case)
+        return idx
+
+    def nearest(self, case: CaseSpec, k: int = DEFAULT_K, min_score: float = 0.0,
+                exclude: Optional[Sequence[int]] = None) -> List[Tuple[int, float]]:
+        """類似度の高い順に (アーカイブ ID, コサイン類似度) を返す。"""
+        if self._n == 0 or k <= 0:
+            return []
+        scores = self._mat[:self._n] @ case_vector(case)
+        if exclude:
+            drop = np.isin(np.asarray(self.ids), list(exclude))
+            scores = np.where(drop, -np.inf, scores)
+        k = min(k, self._n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] >= min_score]
+
+# =========================
+# プロンプト用の参考例
+# =========================
+def _compact_items(items: List[Item], max_items: int) -> List[str]:
+    # 管理費は compute_totals が決めるので参考例には入れない。金額の大きい行から残す
+    lines = sorted((x for x in items if x.category != MGMT_CATEGORY), key=lambda x: -x.qty * x.unit_price)
+    out = [f"- {x.category} / {x.task} / {x.qty:g}{x.unit} × {x.unit_price:,}円" for x in lines[:max_items]]
+    if len(lines) > max_items:
+        out.append(f"- （ほか {len(lines) - max_items} 行）")
+    return out
+
+def few_shot_block(examples: Sequence[Tuple[CaseSpec, List[Item], float]],
+                   max_items: int = FEW_SHOT_MAX_ITEMS) -> str:
+    """examples: (案件条件, 確定明細, 類似度)。空なら ""。"""
+    if not examples:
+        return ""
+    parts = ["【参考：過去の類似案件の確定見積（構成と単価の目安。条件が違う部分は合わせて調整すること）】"]
+    for n, (case, items, score) in enumerate(examples, 1):
+        note = (case.extra_notes or "").strip().replace("\n", " ")[:60]
+        parts.append(
+            f"例{n}（類似度 {score:.2f}）: {case.final_duration} × {case.num_versions}本 / "
+            f"撮影{case.shoot_days}日・編集{case.edit_days}日 / キャスト{case.cast_main}+{case.cast_extra}人"
+            + (f" / 備考: {note}" if note else "")
+        )
+        parts.extend(_compact_items(items, max_items))
+    return "\n".join(parts)
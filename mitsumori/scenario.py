@@ -0,0 +1,79 @@
+# ---------- What-if（納期 × 予算）シナリオ ----------
+# 1 つの項目セットに対し、(target_days, 予算) の格子をまとめて NumPy で評価する。
+# 各セルは「予算があれば scale_prices_to_budget（mitsumori/budget.py）→ compute_totals」と同じ結果になる。
+# 予算 0（または None）のセルは予算寄せなし。
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from mitsumori.estimate import EstimateTable, rush_coeff, MGMT_CATEGORY, TAX_RATE
+from mitsumori.budget import line_amounts, mgmt_fee, target_subtotal, apportion
+
+DEFAULT_DAY_OFFSETS = (-14, -7, -3, 0, 7, 14)
+DEFAULT_BUDGET_RATIOS = (0.7, 0.85, 1.0, 1.15, 1.3)
+
+def evaluate_grid(t: EstimateTable,
+                  base_days: int,
+                  target_days: Sequence[int],
+                  budgets: Sequence[Optional[int]],
+                  low: float = 0.6,
+                  high: float = 5.0,
+                  round_to: int = 1000) -> dict:
+    """
+    戻り値の 2 次元配列は shape (len(target_days), len(budgets))。
+    keys: target_days, budgets, rush_coeff, scale, subtotal_after_rush_excl_mgmt,
+          mgmt_fee_final, taxable, tax, total
+    """
+    days = np.asarray(list(target_days), dtype=np.int64)
+    budget = np.asarray([b or 0 for b in budgets], dtype=np.float64)
+    # 係数は Python の round(x, 2) と揃えるため、納期ごとに rush_coeff で求める（T 個だけ）
+    accel = np.array([rush_coeff(base_days, int(d)) for d in days], dtype=np.float64)
+
+    cat = np.array(t.category, dtype=object)
+    is_mgmt = cat == MGMT_CATEGORY
+    free = ~is_mgmt
+    qty = np.asarray(t.qty, dtype=np.float64)
+    price = np.frombuffer(t.unit_price, dtype=np.int64).astype(np.float64)
+
+    mgmt_raw = np.rint(qty[is_mgmt] * price[is_mgmt])
+    mgmt_current = float(mgmt_raw.sum())
+    mgmt_rest = float(mgmt_raw[1:].sum())
+
+    # 予算寄せ（fit_prices_table と同じ手順を格子の次元つきで）
+    b_free = (qty * price * accel[:, None])[:, free].sum(axis=-1)                # (T,)
+    s_target = target_subtotal(budget, mgmt_current, mgmt_rest)                   # (B,)
+    scaled_cell = (budget[None, :] > 0) & (b_free[:, None] > 0)                   # (T, B)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.clip(s_target[None, :] / b_free[:, None], low, high)
+    s = np.where(scaled_cell, s, 1.0)
+
+    accel3 = accel[:, None, None]
+    p = apportion(qty, price, price * s[:, :, None], accel3, free, round_to)       # (T, B, n)
+    p = np.where(scaled_cell[:, :, None], p, price)
+
+    sub = np.where(free, line_amounts(qty, p, accel3), 0.0).sum(axis=-1)          # (T, B)
+    mgmt_final = mgmt_fee(sub, mgmt_current)
+    taxable = sub + mgmt_final + mgmt_rest
+    tax = np.rint(taxable * TAX_RATE)
+
+    return {
+        "target_days": days,
+        "budgets": budget.astype(np.int64),
+        "rush_coeff": accel,
+        "scale": s,
+        "subtotal_after_rush_excl_mgmt": sub.astype(np.int64),
+        "mgmt_fee_final": mgmt_final.astype(np.int64),
+        "taxable": taxable.astype(np.int64),
+        "tax": tax.astype(np.int64),
+        "total": (taxable + tax).astype(np.int64),
+    }
+
+def default_axes(target_days: int, budget: Optional[int], taxable_now: int) -> tuple:
+    """現在の納期・予算（なければ現在の税抜小計）を中心にした格子の軸。"""
+    days = sorted({d for d in (target_days + o for o in DEFAULT_DAY_OFFSETS) if d >= 1})
+    center = budget or taxable_now
+    budgets: List[int] = [0]
+    if center > 0:
+        budgets += [int(round(center * r / 100_000)) * 100_000 for r in DEFAULT_BUDGET_RATIOS]
+    return days, list(dict.fromkeys(budgets))
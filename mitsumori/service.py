@@ -0,0 +1,495 @@
+# ---------- 見積パイプライン（Streamlit なし） ----------
+# 案件条件（CaseSpec）→ プロンプト → LLM で items 生成（途中切れは継続生成）→ 正規化パス → 単価表 →
+# compute_totals → 参考予算への寄せ、までを画面なしで通す。HTTP API（mitsumori/api.py）や
+# スクリプトから呼ぶための入口で、Streamlit 版と同じ mitsumori/ の部品をそのまま使う。
+# LLM の SDK（openai / google.generativeai）はプロバイダを作るときに初めて import する。
+# 同期版（run_estimate）と非同期版（run_estimate_async：AsyncOpenAI / generate_content_async）の両方がある。
+
+import os
+import json
+import time
+import asyncio
+import base64
+import hashlib
+from abc import ABC, abstractmethod
+from datetime import date
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from mitsumori.budget import scale_prices_to_budget
+from mitsumori.case import CaseSpec
+from mitsumori.continuation import (
+    agenerate_with_continuation, finish_reason_truncated, generate_with_continuation, parse_items_truncation,
+)
+from mitsumori.estimate import compute_totals
+from mitsumori.items import Item, df_to_items, items_to_df, items_to_json, parse_items
+from mitsumori.ratecard import RateCard, apply_rate_card
+
+PROVIDER_OPENAI = "openai"
+PROVIDER_GEMINI = "gemini"
+DEFAULT_MODELS = {PROVIDER_OPENAI: "gpt-4.1", PROVIDER_GEMINI: "gemini-2.5-flash"}
+
+STRICT_JSON_HEADER = (
+    "必ず有効な JSON 1オブジェクトのみ（コードフェンスなし）を返してください。"
+    "説明文や前置きは禁止です。"
+    "もし要件を満たせない・生成が難しい場合でも、空にはせず、必ず {\"items\": []} を返してください。"
+)
+
+# =========================
+# プロンプト（Streamlit 版・CLI・HTTP API で共通の文面）
+# =========================
+GENERATE_ROLE = "あなたは広告映像制作の見積り項目を作成するエキスパートです。"
+
+def join_or(value_list, empty="なし", sep=", "):
+    if not value_list:
+        return empty
+    return sep.join(map(str, value_list))
+
+def parse_budget_hint_jpy(s: str) -> Optional[int]:
+    """「500万」「1.2億」「3,000,000円」などの参考予算（税抜）を円にする。読めなければ None。"""
+    if not s:
+        return None
+    t = str(s).strip().replace(",", "").replace(" ", "")
+    t = t.replace("円", "")
+    try:
+        if "億" in t:
+            n = float(t.replace("億", "") or "0")
+            return int(n * 100_000_000)
+        if "万" in t:
+            n = float(t.replace("万円", "").replace("万", "") or "0")
+            return int(n * 10_000)
+        n = float(t)
+        return int(n)
+    except Exception:
+        return None
+
+def case_block(case: CaseSpec) -> str:
+    return f"""【案件条件】
+- 尺: {case.final_duration}
+- 本数: {case.num_versions}本
+- 撮影日数: {case.shoot_days}日 / 編集日数: {case.edit_days}日
+- 納品希望日: {case.delivery_date}
+- キャスト: メイン{case.cast_main}人 / エキストラ{case.cast_extra}人 / タレント: {"あり" if case.talent_use else "なし"}
+- スタッフ候補: {join_or(case.staff_roles, empty="未指定")}
+- 撮影場所: {case.shoot_location if case.shoot_location else "未定"}
+- 撮影機材: {join_or(case.kizai, empty="未指定")}
+- 美術装飾: {case.set_design_quality}
+- CG: {"あり" if case.use_cg else "なし"} / ナレーション: {"あり" if case.use_narration else "なし"} / 音楽: {case.use_music} / MA: {"あり" if case.ma_needed else "なし"}
+- 納品形式: {join_or(case.deliverables, empty="未定")}
+- 字幕: {join_or(case.subtitle_langs, empty="なし")}
+- 使用地域: {case.usage_region} / 使用期間: {case.usage_period}
+- 参考予算（税抜）: {case.budget_hint if case.budget_hint else "未設定"}
+- 備考: {case.extra_notes if case.extra_notes else "特になし"}"""
+
+def _inference_block(infer_from_notes: bool) -> str:
+    if not infer_from_notes:
+        return ""
+    return """
+- 備考や案件概要、一般的な広告映像制作の慣行から、未指定の必須/付随項目を推論して適宜補完すること。
+"""
+
+def build_prompt(case: CaseSpec, infer_from_notes: bool = True, few_shot: str = "",
+                 role: str = GENERATE_ROLE) -> str:
+    """items 生成のプロンプト。few_shot は mitsumori.retrieval.few_shot_block の出力。role は冒頭の役割の 1 行。"""
+    return f"""{STRICT_JSON_HEADER}
+
+{role}
+以下の条件を満たし、**JSONのみ**を返してください。
+
+{case_block(case)}
+
+{few_shot}
+
+【出力仕様】
+- JSON 1オブジェクト、ルートは items 配列のみ。
+- 各要素キー: category / task / qty / unit / unit_price / note
+- category は「制作人件費」「企画」「撮影費」「出演関連費」「編集費・MA費」「諸経費」「管理費」いずれか。
+{_inference_block(infer_from_notes)}
+- qty, unit は妥当な値（日/式/人/時間/カット等）。単価は日本の広告映像相場の一般レンジで推定。
+- 管理費は固定1行（task=管理費（固定）, qty=1, unit=式）。
+- 合計/税/HTMLなどは出力しない。
+"""
+
+def normalize_prompt(items: List[Item], role: str = "") -> str:
+    """正規化パスのプロンプト。role を渡すとヘッダの次の行に入れる。"""
+    head = f"{STRICT_JSON_HEADER}\n{role}" if role else STRICT_JSON_HEADER
+    return f"""{head}
+次のJSONを検査・正規化してください。返答は**修正済みJSONのみ**で、説明は不要です。
+- スキーマ外キー削除、欠損補完（qty/unit/unit_price/note）
+- category 正規化（制作人件費/企画/撮影費/出演関連費/編集費・MA費/諸経費/管理費）
+- 単位表記のゆれを正規化
+- 管理費は固定1行（task=管理費（固定）, qty=1, unit=式）
+【入力JSON】
+{items_to_json(items)}
+"""
+
+# =========================
+# LLM プロバイダ
+# =========================
+def gemini_text(resp) -> str:
+    """Gemini 応答からテキストを取り出す（text → parts の text / JSON inline_data → to_dict の順）。"""
+    try:
+        if getattr(resp, "text", None):
+            return resp.text
+    except Exception:
+        pass
+    try:
+        buf = []
+        for c in getattr(resp, "candidates", []) or []:
+            parts = getattr(getattr(c, "content", None), "parts", None) or []
+            for p in parts:
+                t = getattr(p, "text", None)
+                if t:
+                    buf.append(t)
+                    continue
+                inline = getattr(p, "inline_data", None)
+                if inline:
+                    mime = getattr(inline, "mime_type", "") or getattr(inline, "mimeType", "")
+                    data_b64 = getattr(inline, "data", None)
+                    if data_b64 and "json" in mime:
+                        try:
+                            buf.append(base64.b64decode(data_b64).decode("utf-8", errors="ignore"))
+                        except Exception:
+                            pass
+        if buf:
+            return "".join(buf)
+    except Exception:
+        pass
+    try:
+        return json.dumps(resp.to_dict(), ensure_ascii=False)
+    except Exception:
+        return ""
+
+class LLMProvider(ABC):
+    """
+    complete(prompt) -> (生テキスト, 出力上限で切れたか)。継続生成・正規化はパイプライン側で行う。
+    acomplete は同じことを非同期で行う（SDK の非同期クライアントで待つ。スレッドプールには逃がさない）。
+    非同期クライアントは最初に acomplete を呼んだイベントループに結びつくので、1 つのプロバイダは 1 つのループで使う。
+    """
+    name = ""
+    generate_tokens = 8000
+    normalize_tokens = 4000
+
+    def __init__(self, model: Optional[str] = None):
+        self.model = model or DEFAULT_MODELS.get(self.name, "")
+
+    @abstractmethod
+    def complete(self, prompt: str, max_tokens: int, temperature: float = 0.2) -> Tuple[str, bool]:
+        ...
+
+    @abstractmethod
+    async def acomplete(self, prompt: str, max_tokens: int, temperature: float = 0.2) -> Tuple[str, bool]:
+        ...
+
+class OpenAIProvider(LLMProvider):
+    name = PROVIDER_OPENAI
+
+    def __init__(self, model: Optional[str] = None, client=None, aclient=None):
+        super().__init__(model)
+        self._client, self._aclient = client, aclient
+
+    @property
+    def client(self):
+        if self._client is None:
+            import httpx
+            from openai import OpenAI
+            self._client = OpenAI(http_client=httpx.Client(timeout=60.0))
+        return self._client
+
+    @property
+    def aclient(self):
+        if self._aclient is None:
+            import httpx
+            from openai import AsyncOpenAI
+            self._aclient = AsyncOpenAI(http_client=httpx.AsyncClient(timeout=60.0))
+        return self._aclient
+
+    def _request(self, prompt: str, max_tokens: int, temperature: float) -> dict:
+        return dict(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "You MUST return a single valid JSON object only."},
+                {"role": "user", "content": prompt},
+            ],
+            response_format={"type": "json_object"},
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+
+    def complete(self, prompt: str, max_tokens: int, temperature: float = 0.2) -> Tuple[str, bool]:
+        resp = self.client.chat.completions.create(**self._request(prompt, max_tokens, temperature))
+        return resp.choices[0].message.content or "", finish_reason_truncated(resp)
+
+    async def acomplete(self, prompt: str, max_tokens: int, temperature: float = 0.2) -> Tuple[str, bool]:
+        resp = await self.aclient.chat.completions.create(**self._request(prompt, max_tokens, temperature))
+        return resp.choices[0].message.content or "", finish_reason_truncated(resp)
+
+class GeminiProvider(LLMProvider):
+    name = PROVIDER_GEMINI
+    generate_tokens = 2500
+    normalize_tokens = 2000
+
+    def __init__(self, model: Optional[str] = None, api_key: Optional[str] = None):
+        super().__init__(model)
+        import google.generativeai as genai
+        key = api_key or os.getenv("GEMINI_API_KEY")
+        if key:
+            genai.configure(api_key=key)
+        self._genai = genai
+
+    def _model(self, max_tokens: int, temperature: float):
+        return self._genai.GenerativeModel(
+            self.model,
+            generation_config={
+                "candidate_count": 1,
+                "temperature": temperature,
+                "top_p": 0.9,
+                "max_output_tokens": max_tokens,
+                "response_mime_type": "application/json",  # 2.5 の空返しを避ける
+            },
+        )
+
+    def complete(self, prompt: str, max_tokens: int, temperature: float = 0.25) -> Tuple[str, bool]:
+        model = self._model(max_tokens, temperature)
+        resp = model.generate_content(prompt)
+        out, hit_limit = gemini_text(resp), finish_reason_truncated(resp)
+        if not out or len(out.strip()) < 3:
+            # 同モデルの chat 経路で再試行（フォールバックではない）
+            resp = model.start_chat(history=[]).send_message(prompt)
+            out, hit_limit = gemini_text(resp), finish_reason_truncated(resp)
+        return out or "", hit_limit
+
+    async def acomplete(self, prompt: str, max_tokens: int, temperature: float = 0.25) -> Tuple[str, bool]:
+        model = self._model(max_tokens, temperature)
+        resp = await model.generate_content_async(prompt)
+        out, hit_limit = gemini_text(resp), finish_reason_truncated(resp)
+        if not out or len(out.strip()) < 3:
+            resp = await model.start_chat(history=[]).send_message_async(prompt)
+            out, hit_limit = gemini_text(resp), finish_reason_truncated(resp)
+        return out or "", hit_limit
+
+PROVIDERS = {PROVIDER_OPENAI: OpenAIProvider, PROVIDER_GEMINI: GeminiProvider}
+
+def make_provider(name: str, model: Optional[str] = None) -> LLMProvider:
+    if name not in PROVIDERS:
+        raise ValueError(f"未知のプロバイダ: {name}（{PROVIDER_OPENAI} / {PROVIDER_GEMINI}）")
+    return PROVIDERS[name](model)
+
+class CacheMiss(KeyError):
+    """オフライン（応答キャッシュのみ）で、キャッシュに無いプロンプトを聞かれた。"""
+
+class CachedProvider(LLMProvider):
+    """
+    応答キャッシュ付きのプロバイダ。キーは (プロバイダ, モデル, プロンプト, max_tokens, temperature) の SHA-256 で、
+    cache_dir/<キー>.json に (生テキスト, 上限到達) を保存する。inner=None ならオフライン：キャッシュにある応答だけを返し、
+    無ければ CacheMiss（SDK は import しない）。出力上限はプロバイダ名の既定（GeminiProvider なら 2500）に揃える。
+    """
+
+    def __init__(self, cache_dir: str, name: str, model: Optional[str] = None, inner: Optional[LLMProvider] = None):
+        if name not in PROVIDERS:
+            raise ValueError(f"未知のプロバイダ: {name}（{PROVIDER_OPENAI} / {PROVIDER_GEMINI}）")
+        cls = PROVIDERS[name]
+        self.name = name
+        self.generate_tokens, self.normalize_tokens = cls.generate_tokens, cls.normalize_tokens
+        super().__init__(inner.model if inner is not None else model)
+        self.inner = inner
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.hits = self.misses = 0
+
+    def _path(self, prompt: str, max_tokens: int, temperature: Optional[float]) -> Path:
+        key = json.dumps([self.name, self.model, prompt, max_tokens, temperature], ensure_ascii=False)
+        return self.cache_dir / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+
+    def _load(self, path: Path) -> Optional[Tuple[str, bool]]:
+        try:
+            d = json.loads(path.read_text(encoding="utf-8"))
+            return d["text"], bool(d["truncated"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _store(self, path: Path, out: Tuple[str, bool]):
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"provider": self.name, "model": self.model, "text": out[0], "truncated": out[1]},
+                                  ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def _lookup(self, path: Path) -> Optional[Tuple[str, bool]]:
+        hit = self._load(path)
+        if hit is not None:
+            self.hits += 1
+            return hit
+        self.misses += 1
+        if self.inner is None:
+            raise CacheMiss(f"応答キャッシュにありません（{path.name}）")
+        return None
+
+    def complete(self, prompt: str, max_tokens: int, temperature: Optional[float] = None) -> Tuple[str, bool]:
+        path = self._path(prompt, max_tokens, temperature)
+        hit = self._lookup(path)
+        if hit is not None:
+            return hit
+        kw = {} if temperature is None else {"temperature": temperature}
+        out = self.inner.complete(prompt, max_tokens, **kw)
+        self._store(path, out)
+        return out
+
+    async def acomplete(self, prompt: str, max_tokens: int, temperature: Optional[float] = None) -> Tuple[str, bool]:
+        path = self._path(prompt, max_tokens, temperature)
+        hit = self._lookup(path)
+        if hit is not None:
+            return hit
+        kw = {} if temperature is None else {"temperature": temperature}
+        out = await self.inner.acomplete(prompt, max_tokens, **kw)
+        self._store(path, out)
+        return out
+
+# =========================
+# パイプライン
+# =========================
+@dataclass
+class EstimateOptions:
+    normalize: bool = True
+    infer_from_notes: bool = True
+    rate_card_mode: Optional[str] = None   # mitsumori.ratecard の MODE_*。None なら単価表を使わない
+    target_days: Optional[int] = None      # 納品までの日数。None なら case.delivery_date から今日基準で
+
+@dataclass
+class EstimateResult:
+    items: List[Item]          # 予算寄せ前の確定明細（単価表適用後）
+    df: pd.DataFrame           # compute_totals 後（予算寄せ後）の表
+    meta: dict
+    model: str
+    raw: str = ""
+    continuation: dict = field(default_factory=dict)
+    rate_card: Optional[dict] = None
+    timings: dict = field(default_factory=dict)
+
+class ProviderError(RuntimeError):
+    """LLM プロバイダ（SDK）の呼び出しが失敗した（認証・通信・レート制限など）。元の例外は __cause__。"""
+
+def _provider_call(fn):
+    def _call(p: str):
+        try:
+            return fn(p)
+        except CacheMiss:
+            raise
+        except Exception as e:
+            raise ProviderError(f"{type(e).__name__}: {e}") from e
+    return _call
+
+def _aprovider_call(afn):
+    async def _call(p: str):
+        try:
+            return await afn(p)
+        except CacheMiss:
+            raise
+        except Exception as e:
+            raise ProviderError(f"{type(e).__name__}: {e}") from e
+    return _call
+
+def target_days_for(case: CaseSpec, today: Optional[date] = None) -> int:
+    if not case.delivery_date:
+        return case.base_days  # 納期指定なし：短納期係数をかけない
+    return (date.fromisoformat(case.delivery_date) - (today or date.today())).days
+
+def generate_items(provider: LLMProvider, prompt: str) -> Tuple[List[Item], list, dict]:
+    """途中切れなら継続生成して継ぎ足す（mitsumori.continuation）。SDK の例外は ProviderError にして上げる。"""
+    return generate_with_continuation(_provider_call(lambda p: provider.complete(p, provider.generate_tokens)), prompt)
+
+def normalize_items(provider: LLMProvider, items: List[Item]) -> List[Item]:
+    # 正規化結果が途中切れ・失敗なら正規化前を採用（Streamlit 版と同じ）
+    try:
+        res, hit_limit = provider.complete(normalize_prompt(items), provider.normalize_tokens, 0.2)
+        if hit_limit or parse_items_truncation(res)[1]:
+            return items
+        return parse_items(res or '{"items":[]}')
+    except Exception:
+        return items
+
+async def agenerate_items(provider: LLMProvider, prompt: str) -> Tuple[List[Item], list, dict]:
+    return await agenerate_with_continuation(
+        _aprovider_call(lambda p: provider.acomplete(p, provider.generate_tokens)), prompt)
+
+async def anormalize_items(provider: LLMProvider, items: List[Item]) -> List[Item]:
+    try:
+        res, hit_limit = await provider.acomplete(normalize_prompt(items), provider.normalize_tokens, 0.2)
+        if hit_limit or parse_items_truncation(res)[1]:
+            return items
+        return parse_items(res or '{"items":[]}')
+    except Exception:
+        return items
+
+def finalize_items(items: List[Item], case: CaseSpec, target_days: int,
+                   rate_card: Optional[RateCard] = None, rate_card_mode: Optional[str] = None):
+    """単価表 → compute_totals → 参考予算への寄せ。戻り値: (単価表適用後の items, 表, meta, 単価表レポート)"""
+    report = None
+    if rate_card is not None and rate_card_mode:
+        items, rep = apply_rate_card(items, rate_card, rate_card_mode)
+        report = {k: v for k, v in rep.items() if k != "lines"}
+    df_items = items_to_df(items)
+    df_calc, meta = compute_totals(df_items, case.base_days, target_days)
+    budget = parse_budget_hint_jpy(case.budget_hint)
+    if budget:
+        df_scaled = scale_prices_to_budget(df_items=df_items, base_days=case.base_days,
+                                           target_days=target_days, target_taxable_jpy=budget)
+        df_calc, meta = compute_totals(df_scaled, case.base_days, target_days)
+    return items, df_calc, meta, report
+
+def run_estimate(case: CaseSpec, provider: LLMProvider, options: Optional[EstimateOptions] = None,
+                 rate_card: Optional[RateCard] = None, few_shot: str = "") -> EstimateResult:
+    options = options or EstimateOptions()
+    timings = {}
+    t0 = time.perf_counter()
+    items, raws, info = generate_items(provider, build_prompt(case, options.infer_from_notes, few_shot))
+    timings["generate_s"] = round(time.perf_counter() - t0, 3)
+    if options.normalize:
+        t1 = time.perf_counter()
+        items = normalize_items(provider, items)
+        timings["normalize_s"] = round(time.perf_counter() - t1, 3)
+    target_days = options.target_days if options.target_days is not None else target_days_for(case)
+    items, df_calc, meta, report = finalize_items(items, case, target_days, rate_card, options.rate_card_mode)
+    timings["total_s"] = round(time.perf_counter() - t0, 3)
+    return EstimateResult(items, df_calc, meta, provider.model, "\n\n".join(r for r in raws if r),
+                          info, report, timings)
+
+async def run_estimate_async(case: CaseSpec, provider: LLMProvider, options: Optional[EstimateOptions] = None,
+                             rate_card: Optional[RateCard] = None, few_shot: str = "") -> EstimateResult:
+    """run_estimate の非同期版。LLM の応答待ちはイベントループ上で await し、計算（pandas）だけスレッドで行う。"""
+    options = options or EstimateOptions()
+    timings = {}
+    t0 = time.perf_counter()
+    items, raws, info = await agenerate_items(provider, build_prompt(case, options.infer_from_notes, few_shot))
+    timings["generate_s"] = round(time.perf_counter() - t0, 3)
+    if options.normalize:
+        t1 = time.perf_counter()
+        items = await anormalize_items(provider, items)
+        timings["normalize_s"] = round(time.perf_counter() - t1, 3)
+    target_days = options.target_days if options.target_days is not None else target_days_for(case)
+    items, df_calc, meta, report = await asyncio.to_thread(
+        finalize_items, items, case, target_days, rate_card, options.rate_card_mode)
+    timings["total_s"] = round(time.perf_counter() - t0, 3)
+    return EstimateResult(items, df_calc, meta, provider.model, "\n\n".join(r for r in raws if r),
+                          info, report, timings)
+
+def estimate_lines(df_calc: pd.DataFrame) -> List[dict]:
+    """compute_totals 後の表を JSON 向けの行リストにする（金額は「小計」列）。"""
+    out = []
+    for x, amount in zip(df_to_items(df_calc), df_calc["小計"].tolist()):
+        d = x.to_dict()
+        d["amount"] = int(amount)
+        out.append(d)
+    return out
+
+def result_to_dict(result: EstimateResult) -> dict:
+    return {
+        "model": result.model,
+        "lines": estimate_lines(result.df),
+        "meta": {k: (v.item() if hasattr(v, "item") else v) for k, v in result.meta.items()},
+        "continuation": result.continuation,
+        "rate_card": result.rate_card,
+        "timings": result.timings,
+    }
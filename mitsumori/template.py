@@ -0,0 +1,307 @@
+# ---------- DD見積書テンプレ出力（事前拡張テンプレ：行挿入なし） ----------
+# テンプレには明細 1 行目に {{ITEMS_START}}（例：B19）を置き、金額列（W）の最後の SUM 式を小計行とみなす。
+# その間の行数が明細枠。行挿入はしない（書式・結合セルを崩さないため）。枠を超えた分は書かないか、
+# 書き込み前のシートを複製した続きのシートに送り、各シートの小計を 1 枚目の小計に足し込む（max_pages > 1）。
+# 同じ会社テンプレを何度も使うので、解析結果（開始行・小計行・枠の行数・COLMAP の検証）は
+# テンプレ bytes の SHA-256 ごとに 1 回だけ作って覚え、以降の出力では全セル走査をしない。
+# 金額・小計は式で書く。xml 版は式のキャッシュ値も書けるので（cache_values）、再計算しない読み手でも金額が見える
+# （openpyxl は式のキャッシュ値を書けないため、openpyxl 版では式のみ）。
+
+import os
+import hashlib
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.styles import Font
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+from mitsumori.export import cached_bytes, content_digest
+
+TOKEN_ITEMS = "{{ITEMS_START}}"
+COLMAP = {"task": "B", "qty": "O", "unit": "Q", "unit_price": "S", "amount": "W"}
+BASE_START_ROW    = 19
+BASE_SUBTOTAL_ROW = 72
+TEMPLATE_REGISTRY_SIZE = 32
+OVERFLOW_MAX_PAGES = 20    # 続きのシートを使うときのシート数の上限（1 枚目を含む）
+
+ENGINE_XML = "xml"
+ENGINE_OPENPYXL = "openpyxl"
+TEMPLATE_ENGINE = os.getenv("MITSUMORI_TEMPLATE_ENGINE", ENGINE_XML)
+TEMPLATE_CACHE_VALUES = os.getenv("MITSUMORI_TEMPLATE_CACHE_VALUES", "1") != "0"
+
+class TemplateError(ValueError):
+    """テンプレの明細枠が使えない（小計行が ITEMS_START より上など）。"""
+
+@dataclass(frozen=True)
+class TemplateInfo:
+    sha256: str
+    sheet: str                                # 出力先シート（テンプレのアクティブシート）
+    start_row: int                            # 明細 1 行目
+    token_cell: Optional[Tuple[int, int]]     # {{ITEMS_START}} の (行, 列)。無ければ None（既定の開始行）
+    subtotal_row: int                         # 小計 SUM の行（見つからなければ既定）
+    cols: Dict[str, int]                      # COLMAP を列番号にしたもの
+    issues: Tuple[str, ...] = ()              # 検証で見つかった注意点（出力は止めない）
+
+    @property
+    def end_row(self) -> int:
+        return self.subtotal_row - 1
+
+    @property
+    def capacity(self) -> int:
+        return self.end_row - self.start_row + 1
+
+_registry: "OrderedDict[str, TemplateInfo]" = OrderedDict()
+_registry_lock = threading.Lock()
+
+def template_digest(template_bytes: bytes) -> str:
+    return hashlib.sha256(template_bytes).hexdigest()
+
+# =========================
+# 解析（テンプレごとに 1 回）
+# =========================
+def _find_token(ws, token: str):
+    for r, row in enumerate(ws.iter_rows(values_only=True), start=1):
+        for c, v in enumerate(row, start=1):
+            if isinstance(v, str) and v.strip() == token:
+                return r, c
+    return None, None
+
+def _find_subtotal_anchor_auto(ws, amount_col_idx: int):
+    last_r = None
+    for r, (v,) in enumerate(ws.iter_rows(min_row=1, min_col=amount_col_idx, max_col=amount_col_idx,
+                                          values_only=True), start=1):
+        if isinstance(v, str):
+            s = v.strip().upper()
+            if s.startswith("=") and "SUM(" in s:
+                last_r = r
+    return last_r
+
+def _scan(ws, sha: str) -> TemplateInfo:
+    cols = {k: column_index_from_string(v) for k, v in COLMAP.items()}
+    issues = []
+    r0, c0 = _find_token(ws, TOKEN_ITEMS)
+    if r0 is None:
+        issues.append(f"{TOKEN_ITEMS} が見つからないため {COLMAP['task']}{BASE_START_ROW} から書きます。")
+    elif c0 != cols["task"]:
+        issues.append(f"{TOKEN_ITEMS} が {get_column_letter(c0)} 列にあります（項目は {COLMAP['task']} 列に書きます）。")
+    start_row = r0 or BASE_START_ROW
+
+    sub_r = _find_subtotal_anchor_auto(ws, cols["amount"])
+    if sub_r is None:
+        issues.append(f"{COLMAP['amount']} 列に SUM 式が無いため {COLMAP['amount']}{BASE_SUBTOTAL_ROW} を小計行とします。")
+        sub_r = BASE_SUBTOTAL_ROW
+
+    # 明細枠の金額セルに既存の式があれば残す仕様なので、数量・単価列を参照しているかだけ確かめる
+    q, p = COLMAP["qty"], COLMAP["unit_price"]
+    bad = []
+    for r, (v,) in enumerate(ws.iter_rows(min_row=start_row, max_row=sub_r - 1, min_col=cols["amount"],
+                                          max_col=cols["amount"], values_only=True), start=start_row):
+        if isinstance(v, str) and v.startswith("=") and not (f"{q}{r}" in v.upper() and f"{p}{r}" in v.upper()):
+            bad.append(r)
+    if bad:
+        issues.append(f"金額列の式が {q}/{p} 列を参照していない行があります（{bad[0]} 行目ほか {len(bad)} 行）。")
+
+    return TemplateInfo(sha, ws.title, start_row, (r0, c0) if r0 else None, sub_r, cols, tuple(issues))
+
+def template_info(template_bytes: bytes, ws=None, digest: Optional[str] = None) -> TemplateInfo:
+    """
+    テンプレの解析結果。SHA-256 が同じなら登録済みのものを返す。
+    ws を渡すとそのシートを走査する（読み込み済みのブックを使い回す用。未登録のときだけ使われる）。
+    """
+    sha = digest or template_digest(template_bytes)
+    with _registry_lock:
+        info = _registry.get(sha)
+        if info is not None:
+            _registry.move_to_end(sha)
+            return info
+    if ws is None:
+        wb = load_workbook(BytesIO(template_bytes), read_only=True)
+        try:
+            info = _scan(wb.active, sha)
+        finally:
+            wb.close()
+    else:
+        info = _scan(ws, sha)
+    with _registry_lock:
+        _registry[sha] = info
+        while len(_registry) > TEMPLATE_REGISTRY_SIZE:
+            _registry.popitem(last=False)
+    return info
+
+# =========================
+# 書き込み
+# =========================
+def _ensure_amount_formula(ws, row, qty_col_idx, price_col_idx, amount_col_idx):
+    c = ws.cell(row=row, column=amount_col_idx)
+    v = c.value
+    if not (isinstance(v, str) and v.startswith("=")):
+        qcol = get_column_letter(qty_col_idx)
+        pcol = get_column_letter(price_col_idx)
+        c.value = f"={qcol}{row}*{pcol}{row}"
+    c.number_format = '#,##0'
+
+def _update_subtotal_formula(ws, subtotal_row, start_row, end_row, amount_col_idx, extra_refs=()):
+    # extra_refs: 続きのシートの小計セル（1 枚目の小計に足し込む）
+    ac = get_column_letter(amount_col_idx)
+    plus = "".join(f"+{ref}" for ref in extra_refs)
+    if end_row < start_row:
+        ws.cell(row=subtotal_row, column=amount_col_idx).value = f"=0{plus}" if plus else 0
+        ws.cell(row=subtotal_row, column=amount_col_idx).number_format = '#,##0'
+    else:
+        ws.cell(row=subtotal_row, column=amount_col_idx).value = f"=SUM({ac}{start_row}:{ac}{end_row}){plus}"
+        ws.cell(row=subtotal_row, column=amount_col_idx).number_format = '#,##0'
+
+class TemplateExport(NamedTuple):
+    data: bytes          # xlsx
+    info: TemplateInfo
+    dropped: int         # 入り切らず出力しなかった明細数
+    pages: int = 1       # 明細を書いたシート数（2 以上なら続きのシートあり）
+
+def continuation_titles(base: str, n: int, existing) -> List[str]:
+    """続きのシート名（"御見積書 (2)" …）。31 文字に収め、既存のシート名とは重ねない。"""
+    taken, out, i = set(existing), [], 2
+    while len(out) < n:
+        suffix = f" ({i})"
+        title = base[:31 - len(suffix)] + suffix
+        if title not in taken:
+            taken.add(title)
+            out.append(title)
+        i += 1
+    return out
+
+def sheet_ref(title: str, cell: str) -> str:
+    return "'" + title.replace("'", "''") + "'!" + cell
+
+def layout_pages(df_items: pd.DataFrame, info: TemplateInfo,
+                 max_pages: int = 1) -> Tuple[List[List[tuple]], int]:
+    """
+    明細枠への割り付け（カテゴリが変わるたびに見出し行を 1 行挟む）。書き込みエンジンに依らず共通。
+    枠が埋まったら max_pages まで次のページ（続きのシート）へ送り、ページ先頭ではカテゴリ見出しを繰り返す。
+    戻り値: (ページごとの [(行, 見出しのカテゴリ or None, (項目, 数量, 単位, 単価) or None), ...], 入り切らなかった明細数)
+    """
+    r, end_row = info.start_row, info.end_row
+    current_cat = None
+    pages: List[List[tuple]] = [[]]
+    written = 0
+    records = df_items.to_dict("records")
+    for row in records:
+        cat = str(row.get("category", "")) or ""
+        need = 2 if cat != current_cat else 1
+        if r + need - 1 > end_row and len(pages) < max_pages:
+            pages.append([])
+            r, current_cat = info.start_row, None
+        if cat != current_cat:
+            if r > end_row:
+                break
+            pages[-1].append((r, cat, None))
+            current_cat = cat
+            r += 1
+
+        if r > end_row:
+            break
+        pages[-1].append((r, None, (str(row.get("task","")), float(row.get("qty", 0) or 0),
+                                    str(row.get("unit","")), int(float(row.get("unit_price", 0) or 0)))))
+        r += 1
+        written += 1
+    return pages, len(records) - written
+
+def layout_rows(df_items: pd.DataFrame, info: TemplateInfo) -> Tuple[List[tuple], int]:
+    """1 ページ（テンプレの明細枠だけ）に割り付ける。入り切らない分は落とす。"""
+    pages, dropped = layout_pages(df_items, info, 1)
+    return pages[0], dropped
+
+def _write_page(ws, info: TemplateInfo, rows: List[tuple], extra_refs=()):
+    if info.token_cell:
+        ws.cell(row=info.token_cell[0], column=info.token_cell[1]).value = None
+    start_row, end_row = info.start_row, info.end_row
+    c_task, c_qty, c_unit, c_price, c_amt = (info.cols[k] for k in ("task", "qty", "unit", "unit_price", "amount"))
+
+    # いったん明細範囲をクリア & 金額列に式をセット
+    for r in range(start_row, end_row + 1):
+        ws.cell(row=r, column=c_task).value  = None
+        ws.cell(row=r, column=c_qty).value   = None
+        ws.cell(row=r, column=c_unit).value  = None
+        ws.cell(row=r, column=c_price).value = None
+        _ensure_amount_formula(ws, r, c_qty, c_price, c_amt)
+
+    for r, heading, item in rows:
+        if heading is not None:
+            # 見出し行（B列のみ太字）
+            cell = ws.cell(row=r, column=c_task)
+            cell.value = heading
+            cell.font = Font(bold=True)
+            continue
+        # 通常の項目行
+        task, qty, unit, price = item
+        ws.cell(row=r, column=c_task).value  = task
+        ws.cell(row=r, column=c_qty).value   = qty
+        ws.cell(row=r, column=c_unit).value  = unit
+        ws.cell(row=r, column=c_price).value = price
+
+    last_detail_row = rows[-1][0] if rows else start_row
+    _update_subtotal_formula(ws, info.subtotal_row, start_row, last_detail_row, c_amt, extra_refs)
+
+def write_preextended(ws, df_items: pd.DataFrame, info: TemplateInfo, max_pages: int = 1) -> Tuple[int, int]:
+    """
+    明細枠にカテゴリ見出し＋項目を書き、小計の SUM 範囲を合わせる（行挿入はしない）。
+    max_pages > 1 なら、枠を超えた分は書き込み前のシートを複製した続きのシートに書き、
+    各シートの小計を 1 枚目の小計に足し込む。戻り値: (入り切らなかった明細数, 使ったシート数)
+    """
+    if info.capacity <= 0:
+        raise TemplateError("テンプレートの明細枠が不正です（小計行が ITEMS_START より上）。")
+    pages, dropped = layout_pages(df_items, info, max_pages)
+    titles = continuation_titles(info.sheet, len(pages) - 1, ws.parent.sheetnames)
+    copies = []
+    for title in titles:
+        c = ws.parent.copy_worksheet(ws)  # 1 枚目を書く前に複製する
+        c.title = title
+        c.sheet_view.tabSelected = False
+        copies.append(c)
+    sub = f"{get_column_letter(info.cols['amount'])}{info.subtotal_row}"
+    _write_page(ws, info, pages[0], [sheet_ref(t, sub) for t in titles])
+    for c, rows in zip(copies, pages[1:]):
+        _write_page(c, info, rows)
+    return dropped, len(pages)
+
+def fill_template(template_bytes: bytes, df_items: pd.DataFrame, engine: Optional[str] = None,
+                  max_pages: int = 1, cache_values: Optional[bool] = None) -> TemplateExport:
+    """
+    テンプレに明細を書いた xlsx を返す。
+    engine: "xml"（シート XML の直接書き換え。mitsumori/ooxml.py）/ "openpyxl"。既定は TEMPLATE_ENGINE。
+    xml で扱えない構造のテンプレは openpyxl で出力する。
+    max_pages: 明細枠を超えたときに使うシート数の上限（1 なら枠に入る分だけ）。
+    cache_values: 金額・小計の式にキャッシュ値も書く（xml 版のみ。既定は TEMPLATE_CACHE_VALUES）。
+    """
+    if cache_values is None:
+        cache_values = TEMPLATE_CACHE_VALUES
+    if (engine or TEMPLATE_ENGINE) == ENGINE_XML:
+        from mitsumori.ooxml import UnsupportedTemplate, fill_template_xml
+        try:
+            return fill_template_xml(template_bytes, df_items, max_pages, cache_values)
+        except UnsupportedTemplate:
+            pass
+    wb = load_workbook(filename=BytesIO(template_bytes))
+    ws = wb.active
+    info = template_info(template_bytes, ws)
+    dropped, pages = write_preextended(ws, df_items, info, max_pages)
+    out = BytesIO()
+    wb.save(out)
+    return TemplateExport(out.getvalue(), info, dropped, pages)
+
+def template_xlsx(template_bytes: bytes, df_items: pd.DataFrame, meta: Optional[dict] = None,
+                  engine: Optional[str] = None, max_pages: int = 1,
+                  cache_values: Optional[bool] = None) -> TemplateExport:
+    """
+    fill_template のキャッシュ付き版（mitsumori/export.py の xlsx キャッシュを共用）。
+    (テンプレの SHA-256, 明細, meta) が同じ再実行では読み込み・書き込み・保存をしない。
+    """
+    engine = engine or TEMPLATE_ENGINE
+    cache_values = TEMPLATE_CACHE_VALUES if cache_values is None else cache_values
+    salt = f"template:{engine}:{max_pages}:{int(cache_values)}:{template_digest(template_bytes)}"
+    key = content_digest(df_items, meta, salt=salt)
+    return cached_bytes(key, lambda: fill_template(template_bytes, df_items, engine, max_pages, cache_values))
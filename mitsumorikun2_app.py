@@ -14,6 +14,9 @@ from openpyxl.utils import column_index_from_string, get_column_letter
 from openai import OpenAI
 import httpx
 
+from mitsumori.export import cached_bytes, content_digest, frame_xlsx, XLSX_MIME
+from mitsumori.template import COLMAP, TemplateInfo, template_digest, template_info
+
 # --- 四隅インク（絶対パスで読んで、なければスキップ） ---
 import base64
 from pathlib import Path
@@ -505,15 +508,7 @@ def compute_totals(df: pd.DataFrame):
 # =========================
 # DDテンプレ出力
 # =========================
-TOKEN_ITEMS = "{{ITEMS_START}}"
-COLMAP = {"task": "B", "qty": "O", "unit": "Q", "unit_price": "S", "amount": "W"}
-
-def _find_token(ws, token: str):
-    for row in ws.iter_rows(values_only=False):
-        for cell in row:
-            if isinstance(cell.value, str) and cell.value.strip() == token:
-                return cell.row, cell.column
-    return None, None
+# COLMAP・ITEMS_START の位置は mitsumori/template.py と共通（位置はテンプレの SHA-256 ごとに 1 回だけ探す）
 
 def _ensure_amount_formula(ws, row, qty_col_idx, price_col_idx, amount_col_idx):
     c = ws.cell(row=row, column=amount_col_idx)
@@ -522,11 +517,10 @@ def _ensure_amount_formula(ws, row, qty_col_idx, price_col_idx, amount_col_idx):
     c.value = f"={qcol}{row}*{pcol}{row}"
     c.number_format = '#,##0'
 
-def _write_items_to_template(ws, df_items: pd.DataFrame):
-    r0, c0 = _find_token(ws, TOKEN_ITEMS)
-    if r0:
-        ws.cell(row=r0, column=c0).value = None
-    start_row = r0 or 19
+def _write_items_to_template(ws, df_items: pd.DataFrame, info: TemplateInfo):
+    if info.token_cell:
+        ws.cell(row=info.token_cell[0], column=info.token_cell[1]).value = None
+    start_row = info.start_row
 
     c_task = column_index_from_string(COLMAP["task"])
     c_qty  = column_index_from_string(COLMAP["qty"])
@@ -551,14 +545,16 @@ def _write_items_to_template(ws, df_items: pd.DataFrame):
         _ensure_amount_formula(ws, r, c_qty, c_price, c_amt)
         r += 1
 
-def export_with_template(template_bytes: bytes, df_items: pd.DataFrame):
-    wb = load_workbook(filename=BytesIO(template_bytes))
-    ws = wb.active
-    _write_items_to_template(ws, df_items)
-    out = BytesIO()
-    wb.save(out)
-    out.seek(0)
-    return out
+def export_with_template(template_bytes: bytes, df_items: pd.DataFrame) -> bytes:
+    # テンプレ（SHA-256）と明細が同じ再実行では作り直さない（mitsumori/export.py のキャッシュを共用）
+    def _build() -> bytes:
+        wb = load_workbook(filename=BytesIO(template_bytes))
+        ws = wb.active
+        _write_items_to_template(ws, df_items, template_info(template_bytes, ws))
+        out = BytesIO()
+        wb.save(out)
+        return out.getvalue()
+    return cached_bytes(content_digest(df_items, salt=f"kun2-template:{template_digest(template_bytes)}"), _build)
 
 # =========================
 # 実行（★ コンテナ方式でボタンにグラデを適用 ★）
@@ -616,14 +612,11 @@ if st.session_state["df"] is not None:
     st.write(f"**消費税:** {st.session_state['meta']['tax']:,}円")
     st.write(f"**合計:** {st.session_state['meta']['total']:,}円")
 
-    buf = BytesIO()
-    with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
-        st.session_state["df"].to_excel(writer, index=False, sheet_name="見積もり")
-    buf.seek(0)
-    st.download_button("Excelでダウンロード", buf, "見積もり.xlsx",
-                       mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    # xlsx は内容ハッシュでキャッシュ（mitsumori/export.py）。チャット入力などの再実行では作り直さない
+    st.download_button("Excelでダウンロード", frame_xlsx(st.session_state["df"]), "見積もり.xlsx",
+                       mime=XLSX_MIME)
 
     tmpl = st.file_uploader("DD見積書テンプレートをアップロード（.xlsx）", type=["xlsx"])
     if tmpl is not None:
-        out = export_with_template(tmpl.read(), st.session_state["df"])
-        st.download_button("DD見積書テンプレで出力", out, "見積もり_DDテンプレ.xlsx")
+        out = export_with_template(tmpl.getvalue(), st.session_state["df"])
+        st.download_button("DD見積書テンプレで出力", out, "見積もり_DDテンプレ.xlsx", mime=XLSX_MIME)
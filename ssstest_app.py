@@ -1,27 +1,41 @@
 # app.py (Gemini 2.5 対応版 / フォールバックなし)
 import os
-import re
 import json
+import time
 import importlib
-from io import BytesIO
 from datetime import date
-import ast
-from typing import Optional
+from typing import List
 
 import streamlit as st
 import pandas as pd
 import google.generativeai as genai
 from dateutil.relativedelta import relativedelta
-from openpyxl.styles import Font
 
 # ===== openpyxl / Excel =====
-from openpyxl import load_workbook
 from openpyxl.cell.cell import MergedCell
-from openpyxl.utils import column_index_from_string, get_column_letter
 
-# ===== OpenAI v1 SDK =====
-from openai import OpenAI
-import httpx  # ← 追加
+# ===== 共通ロジック（mitsumori/） =====
+from mitsumori import aio
+from mitsumori.items import Item, parse_items, items_to_json, items_to_df
+from mitsumori.estimate import compute_totals, rush_coeff
+from mitsumori.budget import scale_prices_to_budget
+from mitsumori.montecarlo import (
+    RANGE_SAMPLES, RANGE_TEMPERATURE, price_bands, asample_parallel, samples_to_items,
+)
+from mitsumori.ratecard import open_rate_card, apply_rate_card, MODE_FILL, MODE_CLAMP, MODE_REPLACE
+from mitsumori.case import CaseSpec
+from mitsumori.archive import open_archive, record_estimate
+from mitsumori.columnar import query as query_estimate_lines
+from mitsumori.anomaly import load_price_stats, score_items, score_df, reprice_targets, reprice_prompt, merge_repriced
+from mitsumori.retrieval import CaseIndex, few_shot_block, DEFAULT_K as FEW_SHOT_K
+from mitsumori.service import STRICT_JSON_HEADER, build_prompt, normalize_prompt, parse_budget_hint_jpy
+from ui.estimate_view import estimate_view
+from mitsumori.export import estimate_xlsx, XLSX_MIME
+from mitsumori.template import template_xlsx, TemplateError, OVERFLOW_MAX_PAGES
+from mitsumori.render import render_html_cached
+from mitsumori.continuation import (
+    finish_reason_truncated, agenerate_with_continuation, parse_items_truncation,
+)
 
 # =========================
 # ページ設定
@@ -47,10 +61,8 @@ os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
 if OPENAI_ORG_ID:
     os.environ["OPENAI_ORG_ID"] = OPENAI_ORG_ID
 
-# OpenAI v1 クライアント（httpx.Client を明示して渡す）
-openai_client = OpenAI(
-    http_client=httpx.Client(timeout=60.0)
-)
+# OpenAI v1 クライアント（AsyncOpenAI + httpx.AsyncClient。呼び出しは共有イベントループ mitsumori/aio.py で await する）
+openai_client = aio.openai_client()
 
 # バージョン表示
 try:
@@ -61,9 +73,7 @@ except Exception:
 # =========================
 # 定数
 # =========================
-TAX_RATE = 0.10
-MGMT_FEE_CAP_RATE = 0.15
-RUSH_K = 0.75
+# 税率・管理費上限・短納期係数は mitsumori/estimate.py
 
 # =========================
 # セッション
@@ -71,7 +81,7 @@ RUSH_K = 0.75
 for k in [
     "items_json_raw", "items_json", "df", "meta", "final_html",
     "used_fallback", "fallback_reason", "gemini_block_reason", "model_used",
-    "gemini_raw_dict"
+    "gemini_raw_dict", "continuation_info", "price_range", "rate_card_report", "anomaly_report", "few_shot_report"
 ]:
     if k not in st.session_state:
         st.session_state[k] = None
@@ -133,146 +143,44 @@ model_choice = st.selectbox(
 )
 do_normalize_pass = st.checkbox("LLMで正規化パスをかける（推奨）", value=True)
 do_infer_from_notes = st.checkbox("備考から不足項目を推論して補完（推奨）", value=True)
+do_few_shot = st.checkbox(f"過去の類似見積（最大 {FEW_SHOT_K} 件）を参考例としてプロンプトに入れる", value=False)
+do_price_range = st.checkbox(f"価格レンジ（P10/P50/P90）も推定する（{RANGE_SAMPLES} サンプルを並行取得）", value=False)
+rate_card_mode = st.selectbox(
+    "単価表（ローカル）の使い方",
+    ["0円の行だけ補完", "範囲外の単価を補正", "単価表の標準単価で置換", "使わない"],
+)
+do_reprice_outliers = st.checkbox("単価が過去の相場から外れた行だけ LLM に再見積させる", value=False)
 
 # =========================
 # ユーティリティ
 # =========================
-def join_or(value_list, empty="なし", sep=", "):
-    if not value_list:
-        return empty
-    return sep.join(map(str, value_list))
-
-def rush_coeff(base_days: int, target_days: int) -> float:
-    if target_days >= base_days or base_days <= 0:
-        return 1.0
-    r = (base_days - target_days) / base_days
-    return round(1 + RUSH_K * r, 2)
-
-# ---------- 予算パース（税抜） ----------
-def parse_budget_hint_jpy(s: str) -> Optional[int]:
-    if not s:
-        return None
-    t = str(s).strip().replace(",", "").replace(" ", "")
-    t = t.replace("円", "")
-    try:
-        if "億" in t:
-            n = float(t.replace("億", "") or "0")
-            return int(n * 100_000_000)
-        if "万" in t:
-            n = float(t.replace("万円", "").replace("万", "") or "0")
-            return int(n * 10_000)
-        n = float(t)
-        return int(n)
-    except Exception:
-        return None
-
 # ---------- JSON ロバストパース ----------
-JSON_ITEMS_FALLBACK = {"items": []}
-
-def _strip_code_fences(s: str) -> str:
-    s = s.strip()
-    if s.startswith("```"):
-        s = re.sub(r"^```(json)?\s*", "", s, flags=re.IGNORECASE)
-        s = re.sub(r"\s*```$", "", s)
-    return s.strip()
-
-def _remove_trailing_commas(s: str) -> str:
-    return re.sub(r",\s*([}\]])", r"\1", s)
-
-def _coerce_json_like(s: str):
-    if not s:
-        return None
-    try:
-        return json.loads(s)
-    except Exception:
-        pass
-    try:
-        first = s.find("{"); last = s.rfind("}")
-        if first != -1 and last != -1 and last > first:
-            frag = s[first:last+1]
-            frag = _remove_trailing_commas(frag)
-            frag2 = frag.replace("\r", "")
-            frag2 = re.sub(r"\bTrue\b", "true", frag2)
-            frag2 = re.sub(r"\bFalse\b", "false", frag2)
-            frag2 = re.sub(r"\bNone\b", "null", frag2)
-            if "'" in frag2 and '"' not in frag2:
-                frag2 = frag2.replace("'", '"')
-            try:
-                return json.loads(frag2)
-            except Exception:
-                pass
-    except Exception:
-        pass
-    try:
-        return ast.literal_eval(s)
-    except Exception:
-        return None
-
-def robust_parse_items_json(raw: str) -> str:
-    s = _strip_code_fences(raw)
-    obj = _coerce_json_like(s)
-    if not isinstance(obj, dict):
-        obj = JSON_ITEMS_FALLBACK.copy()
-    items = obj.get("items")
-    if not isinstance(items, list):
-        if isinstance(obj.get("result"), dict) and isinstance(obj["result"].get("items"), list):
-            items = obj["result"]["items"]
-        elif isinstance(obj.get("data"), list):
-            items = obj["data"]
-        else:
-            items = []
-    obj["items"] = items
-    return json.dumps(obj, ensure_ascii=False)
+# 寛容スキャナ本体は mitsumori/parsing.py、Item への変換は mitsumori/items.py（parse_items）
 
 # ---------- プロンプト ----------
-STRICT_JSON_HEADER = (
-    "必ず有効な JSON 1オブジェクトのみ（コードフェンスなし）を返してください。"
-    "説明文や前置きは禁止です。"
-    "もし要件を満たせない・生成が難しい場合でも、空にはせず、必ず {\"items\": []} を返してください。"
-)
+# 案件条件・出力仕様・正規化の文面と STRICT_JSON_HEADER、参考予算のパースは mitsumori/service.py（CLI・HTTP API と共通）
 
-def _common_case_block() -> str:
-    return f"""【案件条件】
-- 尺: {final_duration}
-- 本数: {num_versions}本
-- 撮影日数: {shoot_days}日 / 編集日数: {edit_days}日
-- 納品希望日: {delivery_date.isoformat()}
-- キャスト: メイン{cast_main}人 / エキストラ{cast_extra}人 / タレント: {"あり" if talent_use else "なし"}
-- スタッフ候補: {join_or(staff_roles, empty="未指定")}
-- 撮影場所: {shoot_location if shoot_location else "未定"}
-- 撮影機材: {join_or(kizai, empty="未指定")}
-- 美術装飾: {set_design_quality}
-- CG: {"あり" if use_cg else "なし"} / ナレーション: {"あり" if use_narration else "なし"} / 音楽: {use_music} / MA: {"あり" if ma_needed else "なし"}
-- 納品形式: {join_or(deliverables, empty="未定")}
-- 字幕: {join_or(subtitle_langs, empty="なし")}
-- 使用地域: {usage_region} / 使用期間: {usage_period}
-- 参考予算（税抜）: {budget_hint if budget_hint else "未設定"}
-- 備考: {extra_notes if extra_notes else "特になし"}"""
-
-def _inference_block() -> str:
-    if not do_infer_from_notes:
+def _few_shot_block() -> str:
+    # アーカイブから条件の近い確定見積を引いて参考例にする。件数・文字数・検索時間は画面の情報欄に出す
+    st.session_state["few_shot_report"] = None
+    if not do_few_shot:
         return ""
-    return """
-- 備考や案件概要、一般的な広告映像制作の慣行から、未指定の必須/付随項目を推論して適宜補完すること。
-"""
+    t0 = time.perf_counter()
+    examples = []
+    for est_id, score in _case_index().nearest(_case_spec(), FEW_SHOT_K):
+        rec = _archive().get(est_id)
+        if rec:
+            examples.append((rec["case"], rec["items"], score))
+    block = few_shot_block(examples)
+    st.session_state["few_shot_report"] = {
+        "examples": len(examples),
+        "block_chars": len(block),
+        "retrieval_ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
+    return block
 
 def build_prompt_json() -> str:
-    return f"""{STRICT_JSON_HEADER}
-
-あなたは広告映像制作の見積り項目を作成するエキスパートです。
-以下の条件を満たし、**JSONのみ**を返してください。
-
-{_common_case_block()}
-
-【出力仕様】
-- JSON 1オブジェクト、ルートは items 配列のみ。
-- 各要素キー: category / task / qty / unit / unit_price / note
-- category は「制作人件費」「企画」「撮影費」「出演関連費」「編集費・MA費」「諸経費」「管理費」いずれか。
-{_inference_block()}
-- qty, unit は妥当な値（日/式/人/時間/カット等）。単価は日本の広告映像相場の一般レンジで推定。
-- 管理費は固定1行（task=管理費（固定）, qty=1, unit=式）。
-- 合計/税/HTMLなどは出力しない。
-"""
+    return build_prompt(_case_spec(), do_infer_from_notes, _few_shot_block())
 
 # ---------- モデルIDマッピング ----------
 def _gemini_model_id_from_choice(choice: str) -> str:
@@ -295,7 +203,7 @@ def _map_openai_model(choice: str) -> str:
     return "gpt-4.1"
 
 # ---------- LLM 呼び出し（2.5専用チューニング / フォールバックなし） ----------
-def llm_generate_items_json(prompt: str) -> str:
+def llm_generate_items(prompt: str) -> List[Item]:
     """
     選択モデルで items JSON を生成（Gemini 2.5 Flash/Pro 直叩き・フォールバックなし）。
     2.5 で空返しを避けるため response_mime_type=application/json を指定。
@@ -347,10 +255,14 @@ def llm_generate_items_json(prompt: str) -> str:
         "model_used": None,
     })
 
-    try:
+    # _call は共有イベントループで動くので st.* には触らず、ここに溜めて後で書く
+    gemini_raw = {}
+    st.session_state["model_used"] = (_gemini_model_id_from_choice(model_choice) if model_choice.startswith("Gemini")
+                                      else _map_openai_model(model_choice))
+
+    async def _call(p: str):
         if model_choice.startswith("Gemini"):
             model_id = _gemini_model_id_from_choice(model_choice)
-            st.session_state["model_used"] = model_id
 
             # ★ ここが肝心：2.5 は JSON MIME を明示する方が空返しが減る
             model = genai.GenerativeModel(
@@ -365,85 +277,73 @@ def llm_generate_items_json(prompt: str) -> str:
             )
 
             # 1st: generate_content
-            resp = model.generate_content(prompt)
+            resp = await model.generate_content_async(p)
             try:
-                st.session_state["gemini_raw_dict"] = resp.to_dict()
+                gemini_raw["dict"] = resp.to_dict()
             except Exception:
-                st.session_state["gemini_raw_dict"] = {"_note": "to_dict() failed"}
+                gemini_raw["dict"] = {"_note": "to_dict() failed"}
             out = _robust_extract_gemini_text(resp)
+            hit_limit = finish_reason_truncated(resp)
 
             # 2nd: 同一モデルの chat 経路で再試行（フォールバックではない）
             if not out or len(out.strip()) < 3:
                 chat = model.start_chat(history=[])
-                resp2 = chat.send_message(prompt)
+                resp2 = await chat.send_message_async(p)
                 try:
-                    st.session_state["gemini_raw_dict"] = {
-                        "first": st.session_state.get("gemini_raw_dict"),
+                    gemini_raw["dict"] = {
+                        "first": gemini_raw.get("dict"),
                         "retry_chat": resp2.to_dict()
                     }
                 except Exception:
                     pass
                 out = _robust_extract_gemini_text(resp2)
+                hit_limit = finish_reason_truncated(resp2)
+
+            return out or "", hit_limit
+
+        # OpenAI 側（従来どおり）
+        gpt_model = _map_openai_model(model_choice)
+        resp = await openai_client.chat.completions.create(
+            model=gpt_model,
+            messages=[
+                {"role": "system", "content": "You MUST return a single valid JSON object only."},
+                {"role": "user", "content": p},
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.2,
+            max_tokens=8000,
+        )
+        return resp.choices[0].message.content or "", finish_reason_truncated(resp)
 
-            raw = out or ""
-        else:
-            # OpenAI 側（従来どおり）
-            gpt_model = _map_openai_model(model_choice)
-            resp = openai_client.chat.completions.create(
-                model=gpt_model,
-                messages=[
-                    {"role": "system", "content": "You MUST return a single valid JSON object only."},
-                    {"role": "user", "content": prompt},
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.2,
-                max_tokens=8000,
-            )
-            raw = resp.choices[0].message.content or ""
-            st.session_state["model_used"] = gpt_model
-
-        # 最低限のガード：本当に空なら {items:[]} を採用
-        if not raw or len(raw.strip()) == 0:
-            raw = '{"items": []}'
-
-        st.session_state["items_json_raw"] = raw
-
-        parsed = robust_parse_items_json(raw)
+    try:
+        # 上限到達で途中切れなら、閉じている item の続きから継続生成して継ぎ足す
         try:
-            if not json.loads(parsed).get("items"):
-                # items キーが無い/空配列のみならそれも許容（最低限のJSON）
-                return json.dumps({"items": []}, ensure_ascii=False)
-        except Exception:
-            raise RuntimeError("Parsed JSON malformed.")
-
-        return parsed
+            items, raws, info = aio.run(agenerate_with_continuation(_call, prompt))
+        finally:
+            if "dict" in gemini_raw:
+                st.session_state["gemini_raw_dict"] = gemini_raw["dict"]
+        st.session_state["items_json_raw"] = "\n\n".join(r for r in raws if r) or '{"items": []}'
+        st.session_state["continuation_info"] = info
+        if info["truncated"]:
+            st.warning("⚠️ 出力上限で途中切れのため、閉じている項目までを採用しました。")
+        return items
 
     except Exception as e:
         # “最後の非常口”だけは残す（画面は進める）
         st.session_state["used_fallback"] = True
         st.session_state["fallback_reason"] = f"{type(e).__name__}: {str(e)[:200]}"
         st.warning("⚠️ モデル応答の解析に失敗（最低限の固定JSONを使用）。")
-        fallback = {"items": []}
-        parsed = json.dumps(fallback, ensure_ascii=False)
-        st.session_state["items_json_raw"] = parsed
-        return parsed
+        st.session_state["items_json_raw"] = json.dumps({"items": []}, ensure_ascii=False)
+        return []
 
 
 
-def llm_normalize_items_json(items_json: str) -> str:
+def llm_normalize_items(items: List[Item]) -> List[Item]:
     """
     正規化パスも 2.5 では JSON MIME を明示して空返しを回避。
     """
     try:
-        prompt = f"""{STRICT_JSON_HEADER}
-次のJSONを検査・正規化してください。返答は**修正済みJSONのみ**で、説明は不要です。
-- スキーマ外キー削除、欠損補完（qty/unit/unit_price/note）
-- category 正規化（制作人件費/企画/撮影費/出演関連費/編集費・MA費/諸経費/管理費）
-- 単位表記のゆれを正規化
-- 管理費は固定1行（task=管理費（固定）, qty=1, unit=式）
-【入力JSON】
-{items_json}
-"""
+        prompt = normalize_prompt(items)
         if model_choice.startswith("Gemini"):
             model_id = _gemini_model_id_from_choice(model_choice)
             model = genai.GenerativeModel(
@@ -456,10 +356,11 @@ def llm_normalize_items_json(items_json: str) -> str:
                     "response_mime_type": "application/json",
                 },
             )
-            res = model.generate_content(prompt).text or '{"items":[]}'
+            resp = aio.run(model.generate_content_async(prompt))
+            res = resp.text or '{"items":[]}'
         else:
             gpt_model = _map_openai_model(model_choice)
-            resp = openai_client.chat.completions.create(
+            resp = aio.run(openai_client.chat.completions.create(
                 model=gpt_model,
                 messages=[
                     {"role": "system", "content": "You MUST return a single valid JSON object only."},
@@ -468,364 +369,238 @@ def llm_normalize_items_json(items_json: str) -> str:
                 response_format={"type": "json_object"},
                 temperature=0.2,
                 max_tokens=4000,
-            )
+            ))
             res = resp.choices[0].message.content or '{"items":[]}'
-        return robust_parse_items_json(res)
+        # 正規化結果が途中切れなら項目が欠けるので、正規化前を採用
+        if finish_reason_truncated(resp) or parse_items_truncation(res)[1]:
+            return items
+        return parse_items(res)
     except Exception:
         # 失敗時はそのまま返す（最低限の許容）
-        return items_json
+        return items
 
 
-# ---------- 計算 ----------
-def df_from_items_json(items_json: str) -> pd.DataFrame:
-    # JSONの壊れに耐える
+# ---------- 外れ値の行だけ再見積（入力・出力とも外れた行のみ） ----------
+def llm_reprice_items(items: List[Item], result: dict) -> List[Item]:
     try:
-        data = json.loads(items_json) if items_json else {}
+        prompt = f"""{STRICT_JSON_HEADER}
+{reprice_prompt(items, result)}"""
+        if model_choice.startswith("Gemini"):
+            model = genai.GenerativeModel(
+                _gemini_model_id_from_choice(model_choice),
+                generation_config={
+                    "candidate_count": 1,
+                    "temperature": 0.2,
+                    "top_p": 0.9,
+                    "max_output_tokens": 2000,
+                    "response_mime_type": "application/json",
+                },
+            )
+            resp = aio.run(model.generate_content_async(prompt))
+            res = resp.text or '{"items":[]}'
+        else:
+            resp = aio.run(openai_client.chat.completions.create(
+                model=_map_openai_model(model_choice),
+                messages=[
+                    {"role": "system", "content": "You MUST return a single valid JSON object only."},
+                    {"role": "user", "content": prompt},
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.2,
+                max_tokens=2000,
+            ))
+            res = resp.choices[0].message.content or '{"items":[]}'
+        if finish_reason_truncated(resp) or parse_items_truncation(res)[1]:
+            return items
+        return merge_repriced(items, result, parse_items(res))
     except Exception:
-        data = {}
-
-    items = data.get("items", []) or []
-    norm = []
-    for x in items:
-        # 文字列や None が混じっても安全に拾う
-        norm.append({
-            "category": str((x or {}).get("category", "")),
-            "task": str((x or {}).get("task", "")),
-            "qty": (x or {}).get("qty", 0),
-            "unit": str((x or {}).get("unit", "")),
-            "unit_price": (x or {}).get("unit_price", 0),
-            "note": str((x or {}).get("note", "")),
-        })
-
-    df = pd.DataFrame(norm)
-
-    # 必須カラムを補完（存在しない場合に作る）
-    for col in ["category", "task", "qty", "unit", "unit_price", "note"]:
-        if col not in df.columns:
-            df[col] = "" if col in ["category", "task", "unit", "note"] else 0
-
-    # 数値カラムは強制的に数値化（文字列/NoneでもOKにする）
-    df["qty"] = pd.to_numeric(df["qty"], errors="coerce").fillna(0.0)
-    df["unit_price"] = pd.to_numeric(df["unit_price"], errors="coerce").fillna(0).astype(int)
-
-    return df
-
-def compute_totals(df_items: pd.DataFrame, base_days: int, target_days: int):
-    accel = rush_coeff(base_days, target_days)
-    df_items = df_items.copy()
-    df_items["小計"] = (df_items["qty"] * df_items["unit_price"]).round().astype(int)
-
-    is_mgmt = (df_items["category"] == "管理費")
-    df_items.loc[~is_mgmt, "小計"] = (df_items.loc[~is_mgmt, "小計"] * accel).round().astype(int)
-
-    mgmt_current = int(df_items.loc[is_mgmt, "小計"].sum()) if is_mgmt.any() else 0
-    subtotal_after_rush = int(df_items.loc[~is_mgmt, "小計"].sum())
-    mgmt_cap = int(round(subtotal_after_rush * MGMT_FEE_CAP_RATE))
-    mgmt_final = min(mgmt_current, mgmt_cap) if mgmt_current > 0 else mgmt_cap
-
-    if is_mgmt.any():
-        idx = df_items[is_mgmt].index[0]
-        df_items.at[idx, "unit_price"] = mgmt_final
-        df_items.at[idx, "qty"] = 1
-        df_items.at[idx, "小計"] = mgmt_final
-    else:
-        df_items = pd.concat([df_items, pd.DataFrame([{
-            "category":"管理費","task":"管理費（固定）","qty":1,"unit":"式","unit_price":mgmt_final,"小計":mgmt_final
-        }])], ignore_index=True)
-
-    taxable = int(df_items["小計"].sum())
-    tax = int(round(taxable * TAX_RATE))
-    total = taxable + tax
-
-    meta = {
-        "rush_coeff": accel,
-        "subtotal_after_rush_excl_mgmt": subtotal_after_rush,
-        "mgmt_fee_final": mgmt_final,
-        "taxable": taxable,
-        "tax": tax,
-        "total": total,
-    }
-    return df_items, meta
-
-# ---------- 予算に（税抜）で寄せる ----------
-def scale_prices_to_budget(df_items: pd.DataFrame,
-                           base_days: int,
-                           target_days: int,
-                           target_taxable_jpy: int,
-                           low: float = 0.6,
-                           high: float = 5.0,
-                           round_to: int = 1000) -> pd.DataFrame:
-    df_now, meta_now = compute_totals(df_items, base_days, target_days)
-    nonmgmt_after_rush = float(meta_now["subtotal_after_rush_excl_mgmt"])
-    if nonmgmt_after_rush <= 0:
-        return df_items.copy()
-
-    desired_nonmgmt_after_rush = target_taxable_jpy / (1.0 + MGMT_FEE_CAP_RATE)
-    s = desired_nonmgmt_after_rush / nonmgmt_after_rush
-    s = max(low, min(high, s))
-
-    df_scaled = df_items.copy()
-    is_mgmt = (df_scaled["category"] == "管理費")
-
-    df_scaled.loc[~is_mgmt, "unit_price"] = (
-        df_scaled.loc[~is_mgmt, "unit_price"].astype(float) * s
-    ).round().astype(int)
-
-    if round_to and round_to > 1:
-        def _round(x): return int(round(x / round_to) * round_to)
-        df_scaled.loc[~is_mgmt, "unit_price"] = df_scaled.loc[~is_mgmt, "unit_price"].map(_round)
-
-    return df_scaled
-
-# ---------- 表示 ----------
-def render_html(df_items: pd.DataFrame, meta: dict) -> str:
-    def td_right(x): return f"<td style='text-align:right'>{x}</td>"
-    html = []
-    html.append("<p>以下は、映像制作にかかる各種費用をカテゴリごとに整理した概算見積書です。</p>")
-    html.append(f"<p>短納期係数：{meta['rush_coeff']} ／ 管理費上限：{int(MGMT_FEE_CAP_RATE*100)}% ／ 消費税率：{int(TAX_RATE*100)}%</p>")
-    html.append("<table border='1' cellspacing='0' cellpadding='6' style='border-collapse:collapse;width:100%'>")
-    html.append("<thead><tr>"
-                "<th style='text-align:left'>カテゴリ</th>"
-                "<th style='text-align:left'>項目</th>"
-                "<th style='text-align:right'>単価</th>"
-                "<th style='text-align:left'>数量</th>"
-                "<th style='text-align:left'>単位</th>"
-                "<th style='text-align:right'>金額（円）</th>"
-                "</tr></thead>")
-    html.append("<tbody>")
-    current_cat = None
-    for _, r in df_items.iterrows():
-        cat = r.get("category","")
-        if cat != current_cat:
-            html.append(f"<tr><td colspan='6' style='text-align:left;background:#f6f6f6;font-weight:bold'>{cat}</td></tr>")
-            current_cat = cat
-        unit_price_str = f"{int(r.get('unit_price',0)):,}"
-        qty_str = str(r.get('qty',''))
-        unit_str = r.get('unit','')
-        amount_str = f"{int(r.get('小計',0)):,}"
-        task_str = r.get('task','')
-        html.append(
-            "<tr>"
-            f"<td>{cat}</td>"
-            f"<td>{task_str}</td>"
-            f"{td_right(unit_price_str)}"
-            f"<td>{qty_str}</td>"
-            f"<td>{unit_str}</td>"
-            f"{td_right(amount_str)}"
-            "</tr>"
+        return items
+
+
+# ---------- 価格レンジ用サンプル（OpenAI は n-choices で 1 リクエスト、Gemini は並列呼び出し） ----------
+async def llm_sample_items(prompt: str, model_id: str, n: int = RANGE_SAMPLES) -> List[List[Item]]:
+    # メイン生成と並行して共有イベントループで待つので st.* には触らない
+    try:
+        if model_id.startswith("gemini"):
+            model = genai.GenerativeModel(
+                model_id,
+                generation_config={
+                    "candidate_count": 1,
+                    "temperature": RANGE_TEMPERATURE,
+                    "top_p": 0.9,
+                    "max_output_tokens": 2500,
+                    "response_mime_type": "application/json",
+                },
+            )
+            async def _one(p: str) -> str:
+                return (await model.generate_content_async(p)).text
+
+            return samples_to_items(await asample_parallel(_one, prompt, n))
+        resp = await openai_client.chat.completions.create(
+            model=model_id,
+            messages=[
+                {"role": "system", "content": "You MUST return a single valid JSON object only."},
+                {"role": "user", "content": prompt},
+            ],
+            response_format={"type": "json_object"},
+            temperature=RANGE_TEMPERATURE,
+            max_tokens=8000,
+            n=n,
         )
-    html.append("</tbody></table>")
-    html.append(
-        f"<p><b>小計（税抜）</b>：{meta['taxable']:,}円　／　"
-        f"<b>消費税</b>：{meta['tax']:,}円　／　"
-        f"<b>合計</b>：<span style='color:red'>{meta['total']:,}円</span></p>"
+        return samples_to_items([c.message.content or "" for c in resp.choices])
+    except Exception:
+        return []
+
+# ---------- 単価表（ローカル SQLite。定番項目は LLM の単価より優先） ----------
+RATE_CARD_MODES = {
+    "0円の行だけ補完": MODE_FILL,
+    "範囲外の単価を補正": MODE_CLAMP,
+    "単価表の標準単価で置換": MODE_REPLACE,
+}
+
+@st.cache_resource
+def _rate_card():
+    return open_rate_card()
+
+@st.cache_resource
+def _archive():
+    return open_archive()
+
+@st.cache_resource
+def _case_index():
+    # 起動時に全件から作り、以降は保存のたびに add で追記する
+    return CaseIndex.build(_archive().cases())
+
+@st.cache_resource(ttl=3600)
+def _price_stats():
+    # 過去見積（分析用 Parquet）の単価分布を優先し、単価表の範囲で補う。1 時間ごとに集計し直す
+    try:
+        lines = query_estimate_lines(columns=["category", "task", "unit", "unit_price"])
+    except Exception:
+        lines = None
+    return load_price_stats(_rate_card(), lines)
+
+def _case_spec() -> CaseSpec:
+    return CaseSpec(
+        final_duration=final_duration, num_versions=int(num_versions),
+        shoot_days=int(shoot_days), edit_days=int(edit_days), delivery_date=delivery_date.isoformat(),
+        cast_main=int(cast_main), cast_extra=int(cast_extra), talent_use=talent_use,
+        staff_roles=list(staff_roles), shoot_location=shoot_location, kizai=list(kizai),
+        set_design_quality=set_design_quality, use_cg=use_cg, use_narration=use_narration,
+        use_music=use_music, ma_needed=ma_needed, deliverables=list(deliverables),
+        subtitle_langs=list(subtitle_langs), usage_region=usage_region, usage_period=usage_period,
+        budget_hint=budget_hint, extra_notes=extra_notes,
     )
-    html.append("<p>※本見積書は自動生成された概算です。実制作内容・条件により金額が増減します。</p>")
-    return "\n".join(html)
 
-def download_excel(df_items: pd.DataFrame, meta: dict):
-    out = df_items.copy()
-    out = out[["category","task","unit_price","qty","unit","小計"]]
-    out.columns = ["カテゴリ","項目","単価（円）","数量","単位","金額（円）"]
+# ---------- 計算・表示 ----------
+# compute_totals は mitsumori/estimate.py、scale_prices_to_budget は mitsumori/budget.py、render_html は mitsumori/render.py
 
-    buf = BytesIO()
-    try:
-        import xlsxwriter  # noqa: F401
-        engine = "xlsxwriter"
-    except ModuleNotFoundError:
-        engine = "openpyxl"
-
-    with pd.ExcelWriter(buf, engine=engine) as writer:
-        out.to_excel(writer, index=False, sheet_name="見積もり")
-
-        if engine == "xlsxwriter":
-            wb = writer.book
-            ws = writer.sheets["見積もり"]
-            fmt_int = wb.add_format({"num_format": "#,##0"})
-            ws.set_column("A:B", 20)
-            ws.set_column("C:C", 14, fmt_int)
-            ws.set_column("D:D", 8)
-            ws.set_column("E:E", 8)
-            ws.set_column("F:F", 14, fmt_int)
-            last_row = len(out) + 2
-            ws.write(last_row,   4, "小計（税抜）")
-            ws.write_number(last_row,   5, int(meta["taxable"]), fmt_int)
-            ws.write(last_row+1, 4, "消費税")
-            ws.write_number(last_row+1, 5, int(meta["tax"]), fmt_int)
-            ws.write(last_row+2, 4, "合計")
-            ws.write_number(last_row+2, 5, int(meta["total"]), fmt_int)
-        else:
-            ws = writer.book["見積もり"]
-            widths = {"A":20, "B":20, "C":14, "D":8, "E":8, "F":14}
-            for col, w in widths.items():
-                ws.column_dimensions[col].width = w
-            for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=3, max_col=3):
-                for cell in row: cell.number_format = '#,##0'
-            for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=6, max_col=6):
-                for cell in row: cell.number_format = '#,##0'
-            last_row = ws.max_row + 2
-            ws.cell(row=last_row,   column=5, value="小計（税抜）")
-            ws.cell(row=last_row,   column=6, value=int(meta["taxable"])).number_format = '#,##0'
-            ws.cell(row=last_row+1, column=5, value="消費税")
-            ws.cell(row=last_row+1, column=6, value=int(meta["tax"])).number_format = '#,##0'
-            ws.cell(row=last_row+2, column=5, value="合計")
-            ws.cell(row=last_row+2, column=6, value=int(meta["total"])).number_format = '#,##0'
-
-    buf.seek(0)
-    st.download_button("📥 Excelでダウンロード", buf, "見積もり.xlsx",
-                       mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+def download_excel(df_items: pd.DataFrame, meta: dict):
+    # ブック生成は mitsumori/export.py。表と meta が同じ再実行では作り直さず、キャッシュの bytes をそのまま渡す
+    st.download_button(
+        "📥 Excelでダウンロード",
+        estimate_xlsx(df_items, meta),
+        "見積もり.xlsx",
+        mime=XLSX_MIME,
+    )
 
 # =========================
 # DD見積書テンプレ出力（事前拡張テンプレ対応：行挿入なし）
 # =========================
-TOKEN_ITEMS = "{{ITEMS_START}}"
-COLMAP = {"task": "B", "qty": "O", "unit": "Q", "unit_price": "S", "amount": "W"}
-BASE_START_ROW    = 19
-BASE_SUBTOTAL_ROW = 72
-
-def _find_token(ws, token: str):
-    for row in ws.iter_rows(values_only=False):
-        for cell in row:
-            if isinstance(cell.value, str) and cell.value.strip() == token:
-                return cell.row, cell.column
-    return None, None
-
-def _ensure_amount_formula(ws, row, qty_col_idx, price_col_idx, amount_col_idx):
-    c = ws.cell(row=row, column=amount_col_idx)
-    v = c.value
-    if not (isinstance(v, str) and v.startswith("=")):
-        qcol = get_column_letter(qty_col_idx)
-        pcol = get_column_letter(price_col_idx)
-        c.value = f"={qcol}{row}*{pcol}{row}"
-    c.number_format = '#,##0'
-
-def _update_subtotal_formula(ws, subtotal_row, start_row, end_row, amount_col_idx):
-    ac = get_column_letter(amount_col_idx)
-    if end_row < start_row:
-        ws.cell(row=subtotal_row, column=amount_col_idx).value = 0
-        ws.cell(row=subtotal_row, column=amount_col_idx).number_format = '#,##0'
-    else:
-        ws.cell(row=subtotal_row, column=amount_col_idx).value = f"=SUM({ac}{start_row}:{ac}{end_row})"
-        ws.cell(row=subtotal_row, column=amount_col_idx).number_format = '#,##0'
-
-def _find_subtotal_anchor_auto(ws, amount_col_idx: int):
-    last_r = None
-    for r in range(1, ws.max_row + 1):
-        v = ws.cell(row=r, column=amount_col_idx).value
-        if isinstance(v, str):
-            s = v.strip().upper()
-            if s.startswith("=") and "SUM(" in s:
-                last_r = r
-    if last_r is not None:
-        return last_r, amount_col_idx
-    return None, None
-
-def _write_preextended(ws, df_items: pd.DataFrame):
-    # TOKEN 位置（なければ既定）
-    r0, c0 = _find_token(ws, TOKEN_ITEMS)
-    if r0:
-        ws.cell(row=r0, column=c0).value = None
-    start_row = r0 or BASE_START_ROW
-
-    # 列インデックス
-    c_task = column_index_from_string(COLMAP["task"])      # B列
-    c_qty  = column_index_from_string(COLMAP["qty"])
-    c_unit = column_index_from_string(COLMAP["unit"])
-    c_price= column_index_from_string(COLMAP["unit_price"])
-    c_amt  = column_index_from_string(COLMAP["amount"])
-
-    # 小計アンカー検出
-    sub_r, _ = _find_subtotal_anchor_auto(ws, c_amt)
-    if sub_r is None:
-        sub_r = BASE_SUBTOTAL_ROW
-    end_row = sub_r - 1
-    capacity = end_row - start_row + 1
-    if capacity <= 0:
-        st.error("テンプレートの明細枠が不正です（小計行が ITEMS_START より上）。")
+# 書き込みは mitsumori/template.py。ITEMS_START・小計行・明細枠の解析はテンプレの SHA-256 ごとに 1 回だけ。
+# 出力はテンプレ・明細・meta の内容ハッシュで覚えるので、結果欄の再実行では作り直さない。
+# overflow=True なら枠を超えた分はテンプレのシートを複製した続きのシートに書き、小計は 1 枚目に合算する
+def export_with_template(template_bytes: bytes, df_items: pd.DataFrame, meta: dict, overflow: bool = False):
+    try:
+        res = template_xlsx(template_bytes, df_items, meta, max_pages=OVERFLOW_MAX_PAGES if overflow else 1)
+    except TemplateError as e:
+        st.error(str(e))
         return
-
-    # いったん明細範囲をクリア & 金額列に式をセット
-    for r in range(start_row, end_row + 1):
-        ws.cell(row=r, column=c_task).value  = None
-        ws.cell(row=r, column=c_qty).value   = None
-        ws.cell(row=r, column=c_unit).value  = None
-        ws.cell(row=r, column=c_price).value = None
-        _ensure_amount_formula(ws, r, c_qty, c_price, c_amt)
-
-    r = start_row
-    current_cat = None
-    warned_full = False
-
-    def _ensure_capacity():
-        nonlocal warned_full
-        if r > end_row and not warned_full:
-            st.warning(f"テンプレの明細枠（{capacity}行）を超えたため、入り切る範囲で出力しました。")
-            warned_full = True
-        return r <= end_row
-
-    # === カテゴリ見出し + 項目を書き込み ===
-    for _, row in df_items.iterrows():
-        cat = str(row.get("category", "")) or ""
-        if cat != current_cat:
-            if not _ensure_capacity(): break
-            # 見出し行（B列のみ太字）
-            cell = ws.cell(row=r, column=c_task)
-            cell.value = cat
-            cell.font = Font(bold=True)
-            # 他列は空欄
-            ws.cell(row=r, column=c_qty).value   = None
-            ws.cell(row=r, column=c_unit).value  = None
-            ws.cell(row=r, column=c_price).value = None
-            _ensure_amount_formula(ws, r, c_qty, c_price, c_amt)
-            current_cat = cat
-            r += 1
-
-        if not _ensure_capacity(): break
-        # 通常の項目行
-        ws.cell(row=r, column=c_task).value  = str(row.get("task",""))
-        ws.cell(row=r, column=c_qty).value   = float(row.get("qty", 0) or 0)
-        ws.cell(row=r, column=c_unit).value  = str(row.get("unit",""))
-        ws.cell(row=r, column=c_price).value = int(float(row.get("unit_price", 0) or 0))
-        _ensure_amount_formula(ws, r, c_qty, c_price, c_amt)
-        r += 1
-
-    last_detail_row = max(start_row, r - 1)
-    _update_subtotal_formula(ws, sub_r, start_row, last_detail_row, c_amt)
-
-def export_with_template(template_bytes: bytes, df_items: pd.DataFrame, meta: dict):
-    wb = load_workbook(filename=BytesIO(template_bytes))
-    ws = wb.active
-    _write_preextended(ws, df_items)
-    out = BytesIO()
-    wb.save(out)
-    out.seek(0)
+    info = res.info
+    for msg in info.issues:
+        st.caption(f"⚠ {msg}")
+    if res.pages > 1:
+        st.caption(f"明細枠（{info.capacity}行）を超えた分を続きの {res.pages - 1} シートに出力しました（小計は 1 枚目に合算）。")
+    if res.dropped:
+        st.warning(f"テンプレの明細枠（{info.capacity}行 × {res.pages} シート）を超えたため、入り切る範囲で出力しました。")
     st.download_button(
         "📥 DD見積書テンプレ（.xlsx）でダウンロード",
-        out,
+        res.data,
         "見積もり_DDテンプレ.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        mime=XLSX_MIME,
         key="dl_dd_template"
     )
 
+# =========================
+# 過去の見積（アーカイブ）
+# =========================
+with st.expander("📚 過去の見積を検索（複製は LLM を呼ばずに再計算のみ）", expanded=False):
+    arc_query = st.text_input("キーワード（項目名・備考・撮影場所。空白区切りで AND）", key="archive_query")
+    arc_category = st.selectbox("カテゴリで絞り込み", ["（すべて）"] + _archive().categories(), key="archive_category")
+    arc_hits = _archive().search(arc_query, None if arc_category == "（すべて）" else arc_category)
+    if arc_hits:
+        st.dataframe(pd.DataFrame(arc_hits), use_container_width=True, hide_index=True)
+        arc_id = st.selectbox("複製する見積 ID", [h["id"] for h in arc_hits], key="archive_pick")
+        if st.button("📋 この見積を複製（現在の納期で再計算）", key="archive_clone"):
+            rec = _archive().get(arc_id)
+            df_calc, meta = compute_totals(items_to_df(rec["items"]), base_days=int(shoot_days + edit_days + 5),
+                                           target_days=(delivery_date - date.today()).days)
+            st.session_state["items_json_raw"] = f"(アーカイブ #{arc_id} から複製)"
+            st.session_state["items_json"] = items_to_json(rec["items"])
+            st.session_state["df"] = df_calc
+            st.session_state["meta"] = meta
+            st.session_state["final_digest"], st.session_state["final_html"] = render_html_cached(df_calc, meta)
+            st.session_state["continuation_info"] = None
+            st.session_state["price_range"] = None
+            st.session_state["rate_card_report"] = None
+            st.session_state["anomaly_report"] = None
+            st.session_state["few_shot_report"] = None
+            st.caption("複製元の入力条件（フォームには反映しません）")
+            st.json(rec["case"].to_dict(), expanded=False)
+    else:
+        st.caption("該当する見積はありません。")
+
 # =========================
 # 実行
 # =========================
 if st.button("💡 見積もりを作成"):
     with st.spinner("AIが見積もり項目を作成中…"):
         prompt = build_prompt_json()
-        items_json_str = llm_generate_items_json(prompt)
+        range_future = None
+        if do_price_range:
+            # レンジ用サンプルはメイン生成と並行して取る（待ち時間はほぼ 1 リクエスト分。スレッドは立てない）
+            sample_model = _gemini_model_id_from_choice(model_choice) if model_choice.startswith("Gemini") else _map_openai_model(model_choice)
+            range_future = aio.submit(llm_sample_items(prompt, sample_model))
+        items = llm_generate_items(prompt)
 
         if do_normalize_pass:
-            items_json_str = llm_normalize_items_json(items_json_str)
+            items = llm_normalize_items(items)
+
+        st.session_state["rate_card_report"] = None
+        if rate_card_mode in RATE_CARD_MODES:
+            items, rate_report = apply_rate_card(items, _rate_card(), RATE_CARD_MODES[rate_card_mode])
+            st.session_state["rate_card_report"] = {k: v for k, v in rate_report.items() if k != "lines"}
+
+        # --- 単価の外れ値チェック（過去見積・単価表の分布と比較）。指定があれば外れた行だけ聞き直す ---
+        anomaly_accel = rush_coeff(int(shoot_days + edit_days + 5), (delivery_date - date.today()).days)
+        anomaly = score_items(items, _price_stats(), anomaly_accel)
+        targets = reprice_targets(items, anomaly) if do_reprice_outliers else []
+        repriced = len(targets)
+        if targets:
+            items = llm_reprice_items(items, anomaly)
+            anomaly = score_items(items, _price_stats(), anomaly_accel)
+        st.session_state["anomaly_report"] = {
+            "checked": anomaly["checked"], "flagged": len(anomaly["flagged"]), "repriced": repriced,
+        }
 
         try:
-            df_items = df_from_items_json(items_json_str)
+            df_items = items_to_df(items)
         except Exception:
             st.error("JSONの解析に失敗しました。もう一度お試しください。")
             with st.expander("デバッグ：モデル生出力を見る"):
                 st.code(st.session_state.get("items_json_raw", "(no raw)"))
             with st.expander("デバッグ：ロバスト整形後JSONを見る"):
-                st.code(items_json_str, language="json")
+                st.code(items_to_json(items), language="json")
             st.stop()
 
         base_days = int(shoot_days + edit_days + 5)
@@ -845,13 +620,30 @@ if st.button("💡 見積もりを作成"):
             )
             df_calc, meta = compute_totals(df_scaled, base_days, target_days)
             df_items = df_scaled  # 以降の出力はスケール後
+            # 外れ値の印は表に出す単価（予算寄せ後）で付け直す
+            anomaly = score_df(df_scaled, _price_stats(), anomaly_accel)
+            st.session_state["anomaly_report"]["flagged"] = len(anomaly["flagged"])
+
+        final_digest, final_html = render_html_cached(df_calc, meta, anomaly["reasons"])
 
-        final_html = render_html(df_calc, meta)
+        # --- 価格レンジ（メインの項目も 1 サンプルとして含める。予算寄せ前） ---
+        st.session_state["price_range"] = None
+        if range_future is not None:
+            samples = range_future.result()
+            st.session_state["price_range"] = price_bands([items] + samples, base_days, target_days)
 
-        st.session_state["items_json"] = items_json_str
+        st.session_state["items_json"] = items_to_json(items)  # 保存用にだけ直列化
         st.session_state["df"] = df_calc
         st.session_state["meta"] = meta
         st.session_state["final_html"] = final_html
+        st.session_state["final_digest"] = final_digest
+
+        # --- アーカイブ（検索・複製用）と分析用 Parquet へ保存。失敗しても見積表示は続ける ---
+        try:
+            record_estimate(_archive(), _case_spec(), df_calc, meta, "ssstest_app",
+                            st.session_state.get("model_used"), _case_index())
+        except Exception as e:
+            st.warning(f"見積の保存に失敗しました: {e}")
 
 # =========================
 # 表示 & ダウンロード
@@ -863,11 +655,23 @@ if st.session_state["final_html"]:
         "used_fallback": bool(st.session_state.get("used_fallback")),
         "fallback_reason": st.session_state.get("fallback_reason"),
         "gemini_block_reason": st.session_state.get("gemini_block_reason"),
-        "model_used": st.session_state.get("model_used") or "(n/a)"
+        "model_used": st.session_state.get("model_used") or "(n/a)",
+        "continuation": st.session_state.get("continuation_info"),
+        "rate_card": st.session_state.get("rate_card_report"),
+        "anomaly": st.session_state.get("anomaly_report"),
+        "few_shot": st.session_state.get("few_shot_report"),
     })
 
     st.success("✅ 見積もり結果（サーバ計算で整合性チェック済み）")
-    st.components.v1.html(st.session_state["final_html"], height=900, scrolling=True)
+    # 内容が前回と同じなら HTML は送り直さない（ui/estimate_view）
+    estimate_view(st.session_state["final_html"], st.session_state["final_digest"], height=900)
+    band = st.session_state.get("price_range")
+    if band and band["n"]:
+        t = band["total"]
+        st.markdown(f"**価格レンジ（{band['n']} サンプル・予算寄せ前・税込）**　"
+                    f"P10 {t[10]:,}円 ／ P50 {t[50]:,}円 ／ P90 {t[90]:,}円")
+        with st.expander("行ごとのレンジ（単価・金額の P10/P50/P90）", expanded=False):
+            st.dataframe(band["lines"], use_container_width=True)
     download_excel(st.session_state["df"], st.session_state["meta"])
 
     st.markdown("---")
@@ -875,7 +679,8 @@ if st.session_state["final_html"]:
     tmpl = st.file_uploader("DD見積書テンプレート（.xlsx）をアップロード", type=["xlsx"], key="tmpl_upload")
     if tmpl is not None:
         st.caption("テンプレに `{{ITEMS_START}}` を明細1行目（例：B19）に置いてください。小計セルはW列のSUM式で自動検出（例：W72）。行挿入は行いません。")
-        export_with_template(tmpl.read(), st.session_state["df"], st.session_state["meta"])
+        overflow = st.checkbox("明細枠を超えた分は続きのシートに出力する", value=True, key="tmpl_overflow")
+        export_with_template(tmpl.getvalue(), st.session_state["df"], st.session_state["meta"], overflow)
 
     with st.expander("デバッグ：モデル生出力（RAW）", expanded=False):
         st.code(st.session_state.get("items_json_raw", "(no raw)"))
@@ -886,12 +691,12 @@ if st.session_state["final_html"]:
 with st.expander("OpenAI 接続テスト（任意）", expanded=False):
     if st.button("▶︎ gpt-4.1-mini に簡易テスト送信"):
         try:
-            r = openai_client.chat.completions.create(
+            r = aio.run(openai_client.chat.completions.create(
                 model="gpt-4.1-mini",
                 messages=[{"role": "user", "content": "Return {\"ok\":true} as JSON only."}],
                 response_format={"type": "json_object"},
                 max_tokens=100,
-            )
+            ))
             st.code(r.choices[0].message.content or "(empty)")
         except Exception as e:
             st.error(f"OpenAI呼び出しで例外: {type(e).__name__}: {str(e)[:300]}")
@@ -0,0 +1 @@
+# Streamlit 専用の表示部品（mitsumori/ は streamlit に依存させないため、こちらに分ける）
@@ -0,0 +1,23 @@
+# 見積 HTML の表示部品（st.components.v1.html の置き換え）
+# st.components.v1.html は再実行のたびに HTML 全体をブラウザへ送り直す。
+# この部品は内容ハッシュが前回と同じなら digest だけを送り、ブラウザ側は表示中の内容をそのまま残す。
+
+from pathlib import Path
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+_component = components.declare_component("estimate_view", path=str(Path(__file__).resolve().parent))
+
+def estimate_view(html: str, digest: str, height: int = 900, key: str = "estimate_view") -> None:
+    sent_key, handled_key = f"_{key}_sent_digest", f"_{key}_missing_handled"
+    prev = st.session_state.get(key)
+    # ブラウザ側で内容が見つからなかった（iframe の作り直し等）ときは html を送り直す。
+    # 部品の値は次の報告まで残るので、送り直し済みの報告（digest と報告時刻の組）は覚えておいて二度は送らない
+    missing = (isinstance(prev, dict) and prev.get("missing") == digest
+               and dict(prev) != st.session_state.get(handled_key))
+    if missing:
+        st.session_state[handled_key] = dict(prev)
+    send_html = missing or st.session_state.get(sent_key) != digest
+    _component(digest=digest, html=html if send_html else None, height=height, key=key, default=None)
+    st.session_state[sent_key] = digest